@@ -36,7 +36,9 @@ from app.services.lie_service import LIEService
 from app.services.cis_service import CISService
 from app.services.llm_service import LLMService
 from app.services.results_service import ResultsService
-from app.workers.tasks import process_user_comprehensive
+from app.workers.tasks import process_user_comprehensive, process_user_comprehensive_async
+from app.workers.async_execution import async_mode_enabled
+from app.workers.celery_app import INTERACTIVE_QUEUE, enqueue
 from app.utils.prompt_builder import PromptBuilder
 from celery import Celery
 from app.utils.serialization import safe_model_dump
@@ -256,6 +258,11 @@ async def get_user_interaction_data(
 
 
 
+def _comprehensive_task():
+    """The async-native task when workers run in CELERY_ASYNC_MODE"""
+    return process_user_comprehensive_async if async_mode_enabled() else process_user_comprehensive
+
+
 @router.post("/{user_id}/process-comprehensive")
 async def process_user_comprehensive_endpoint(
     user_id: str = Path(..., min_length=1, max_length=100, description="User identifier"),
@@ -276,12 +283,11 @@ async def process_user_comprehensive_endpoint(
                    endpoint="process_user_comprehensive")
         
         # Enqueue the user for comprehensive processing directly
-        result = process_user_comprehensive.apply_async(
+        result = enqueue(
+            _comprehensive_task(),
             args=[user_id],
-            queue="user_processing",
-            routing_key=f"user_processing_{hash(user_id) % 10}",  # Distribute across workers
+            queue=INTERACTIVE_QUEUE,  # Never waits behind scheduled bulk refreshes
             priority=priority,
-            expires=None,
             retry=True,
             retry_policy={
                 'max_retries': 3,
@@ -308,7 +314,7 @@ async def process_user_comprehensive_endpoint(
             "task_id": result.id,
             "message": f"User {user_id} enqueued for comprehensive processing",
             "status": "queued",
-            "queue": "user_processing"
+            "queue": INTERACTIVE_QUEUE
         }
         
     except Exception as e:
@@ -338,7 +344,7 @@ async def process_user_comprehensive_direct_endpoint(
         logger.info("Processing user comprehensively (direct)", user_id=user_id)
         
         # Process the user directly (synchronous)
-        result = process_user_comprehensive.delay(user_id)
+        result = enqueue(_comprehensive_task(), args=[user_id], queue=INTERACTIVE_QUEUE)
         
         # Wait for the result
         comprehensive_data = result.get(timeout=30)  # 30 second timeout
@@ -430,6 +436,8 @@ async def generate_recommendations_endpoint(
         loc = request.location.model_dump() if getattr(request, 'location', None) else None
         date_range = request.date_range.model_dump() if getattr(request, 'date_range', None) else None
         builder = PromptBuilder()
+        # Context fetched here is handed to ranking so it is not fetched twice
+        user_context = None
         if prompt is not None:
             # Wrap custom prompt to maintain strict JSON structure
             current_city = (loc.get("city") if loc and loc.get("city") else "Barcelona")
@@ -471,6 +479,11 @@ async def generate_recommendations_endpoint(
                     preferences={},
                     engagement_score=0.5
                 )
+            user_context = {
+                "user_profile": user_profile,
+                "location_data": location_data,
+                "interaction_data": interaction_data,
+            }
             from app.core.constants import RecommendationType
             if not any([user_profile, location_data, interaction_data]):
                 prompt = builder.build_fallback_prompt(
@@ -505,6 +518,7 @@ async def generate_recommendations_endpoint(
                         current_city=(loc.get("city") if loc else "Barcelona"),
                         location_context=loc,
                         date_range=date_range,
+                        user_context=user_context,
                     ),
                     timeout=per_attempt_timeout
                 )
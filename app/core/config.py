@@ -133,11 +133,61 @@ class Settings(BaseSettings):
         env="RECOMMENDATION_REFRESH_INTERVAL_MINUTES"
     )
 
+    # Ranking context assembly (per-source timeout for profile/location/interaction fetches)
+    context_fetch_timeout_seconds: float = Field(default=5.0, env="CONTEXT_FETCH_TIMEOUT_SECONDS")
+
+    # Embedding caches
+    user_embedding_cache_size: int = Field(default=1024, env="USER_EMBEDDING_CACHE_SIZE")
+    user_embedding_cache_ttl_seconds: int = Field(default=7200, env="USER_EMBEDDING_CACHE_TTL_SECONDS")
+    item_vector_store_path: str = Field(default="/tmp/portal_engine/item_vectors", env="ITEM_VECTOR_STORE_PATH")
+    item_vector_store_capacity: int = Field(default=65536, env="ITEM_VECTOR_STORE_CAPACITY")
+    # Trained two-tower weights (torch state_dict); without them ranking uses the deterministic encoder
+    two_tower_weights_path: Optional[str] = Field(default=None, env="TWO_TOWER_WEIGHTS_PATH")
+
+    # LLM response cache (keyed by prompt plus the full personalising inputs)
+    llm_response_cache_enabled: bool = Field(default=True, env="LLM_RESPONSE_CACHE_ENABLED")
+    llm_response_cache_ttl_seconds: int = Field(default=21600, env="LLM_RESPONSE_CACHE_TTL_SECONDS")
+
+    # Streamed LLM responses (rank categories as they arrive; partial result on timeout)
+    llm_streaming_enabled: bool = Field(default=False, env="LLM_STREAMING_ENABLED")
+    llm_stream_timeout_seconds: float = Field(default=90.0, env="LLM_STREAM_TIMEOUT_SECONDS")
+
+    # Single-flight coalescing of duplicate recommendation generations
+    single_flight_lease_seconds: float = Field(default=180.0, env="SINGLE_FLIGHT_LEASE_SECONDS")
+    single_flight_wait_timeout_seconds: float = Field(default=150.0, env="SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS")
+    single_flight_poll_interval_seconds: float = Field(default=0.25, env="SINGLE_FLIGHT_POLL_INTERVAL_SECONDS")
+
+    # Notification publisher connection pool (Pub/Sub to the notification service)
+    notification_publisher_max_connections: int = Field(default=20, env="NOTIFICATION_PUBLISHER_MAX_CONNECTIONS")
+
+    # Shared outbound HTTP connection pools (per host)
+    http_pool_max_connections: int = Field(default=100, env="HTTP_POOL_MAX_CONNECTIONS")
+    http_pool_max_keepalive: int = Field(default=20, env="HTTP_POOL_MAX_KEEPALIVE")
+    http_pool_keepalive_expiry: float = Field(default=30.0, env="HTTP_POOL_KEEPALIVE_EXPIRY")
+    http_http2_enabled: bool = Field(default=True, env="HTTP_HTTP2_ENABLED")
+
     # Task interval
     task_interval_seconds: int = Field(default=10, env="TASK_INTERVAL_SECONDS")
     
     # Celery Worker Configuration
     celery_worker_concurrency: int = Field(default=10, env="CELERY_WORKER_CONCURRENCY")
+    # Async execution mode: threads pool + one event loop multiplexing AsyncTask coroutines
+    celery_async_mode: bool = Field(default=False, env="CELERY_ASYNC_MODE")
+    celery_async_max_in_flight: int = Field(default=200, env="CELERY_ASYNC_MAX_IN_FLIGHT")
+    # Per-queue worker concurrency (used when a worker consumes only dedicated queues)
+    celery_interactive_concurrency: int = Field(default=8, env="CELERY_INTERACTIVE_CONCURRENCY")
+    celery_bulk_concurrency: int = Field(default=4, env="CELERY_BULK_CONCURRENCY")
+    celery_maintenance_concurrency: int = Field(default=1, env="CELERY_MAINTENANCE_CONCURRENCY")
+    # Scheduled bulk refreshes still queued after this long are dropped
+    bulk_refresh_deadline_seconds: int = Field(default=3600, env="BULK_REFRESH_DEADLINE_SECONDS")
+
+    # Bulk user refresh (process_users_batch)
+    batch_refresh_chunk_size: int = Field(default=100, env="BATCH_REFRESH_CHUNK_SIZE")
+    batch_refresh_fetch_concurrency: int = Field(default=20, env="BATCH_REFRESH_FETCH_CONCURRENCY")
+    batch_refresh_llm_concurrency: int = Field(default=8, env="BATCH_REFRESH_LLM_CONCURRENCY")
+    # Incremental refresh: unchanged users keep recommendations younger than this
+    incremental_refresh_enabled: bool = Field(default=True, env="INCREMENTAL_REFRESH_ENABLED")
+    incremental_refresh_max_age_seconds: int = Field(default=21600, env="INCREMENTAL_REFRESH_MAX_AGE_SECONDS")
     
     # Logging
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
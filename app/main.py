@@ -15,6 +15,7 @@ from pydantic import ValidationError
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.api.routers import health, users, ui
+from app.services.http_client import http_client_registry
 from app.models.responses import APIResponse
 from app.utils.serialization import safe_serialize
 import json
@@ -87,7 +88,8 @@ async def lifespan(app: FastAPI):
                         environment=settings.environment)
     
     try:
-        # Log any cleanup operations here
+        closed = await http_client_registry.aclose_all()
+        shutdown_logger.info("Closed pooled HTTP clients", count=closed)
         shutdown_logger.info("Application shutdown completed successfully")
     except Exception as e:
         shutdown_logger.error("Error during application shutdown", 
@@ -5,6 +5,7 @@ import httpx
 from typing import Optional, Dict, Any
 from app.core.logging import get_logger
 from app.core.config import settings
+from app.services.http_client import http_client_registry
 import time
 
 
@@ -64,13 +65,15 @@ class BaseService:
             return {"success": False, "error": "circuit_open"}
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            client = await http_client_registry.get_client(url, timeout=self.timeout)
+            async with http_client_registry.track(url):
                 response = await client.request(
                     method=method,
                     url=url,
                     params=params,
                     json=data,
-                    headers=default_headers
+                    headers=default_headers,
+                    timeout=self.timeout
                 )
                 
                 response.raise_for_status()
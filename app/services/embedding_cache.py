@@ -0,0 +1,155 @@
+"""
+User embedding cache.
+
+Stores user vectors as raw float32 bytes in a bounded in-process LRU and in
+Redis, keyed by user id. Each entry carries a fingerprint of the inputs the
+vector was built from (profile, location, interaction history); a lookup with
+a different fingerprint is a miss and the next store replaces the entry, so a
+changed history invalidates the cached vector without explicit deletes.
+
+Example:
+    >>> cache = UserEmbeddingCache(redis_client=client)
+    >>> fp = cache.fingerprint(profile, location, history, interactions)
+    >>> vec = cache.get("user123", fp)
+    >>> if vec is None:
+    ...     vec = cache.set("user123", fp, build_vector())
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import redis
+
+from app.core.logging import get_logger
+
+logger = get_logger("embedding_cache")
+
+
+class UserEmbeddingCache:
+    """Two-level (in-process LRU + Redis) cache for user embedding vectors.
+
+    Vectors are held as float32. Entries can be marked local-only (``shared=False``)
+    for vectors that are only meaningful inside the current process, such as
+    two-tower outputs computed with process-local weights.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        max_entries: int = 1024,
+        ttl_seconds: int = 7200,
+        namespace: str = "recommendations",
+        signature: str = "v1"
+    ):
+        self.redis_client = redis_client
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = int(ttl_seconds)
+        self.namespace = namespace
+        self.signature = signature
+        self._local: "OrderedDict[Tuple[str, str], Tuple[str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(*inputs: Any) -> str:
+        """Stable digest of the embedding inputs (order-insensitive for dict keys)."""
+        payload = json.dumps(inputs, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _redis_key(self, user_id: str, kind: str) -> str:
+        return f"{self.namespace}:embeddings:{kind}:{self.signature}:{user_id}"
+
+    def get(self, user_id: str, fingerprint: str, kind: str = "user") -> Optional[np.ndarray]:
+        """Return the cached vector if it was built from inputs with this fingerprint."""
+        if not user_id:
+            return None
+        local_key = (kind, str(user_id))
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is not None and entry[0] == fingerprint:
+                self._local.move_to_end(local_key)
+                self.hits += 1
+                return entry[1]
+
+        vector = self._redis_get(user_id, fingerprint, kind)
+        if vector is not None:
+            self._store_local(local_key, fingerprint, vector)
+            self.hits += 1
+            return vector
+        self.misses += 1
+        return None
+
+    def set(self, user_id: str, fingerprint: str, vector: np.ndarray, kind: str = "user", shared: bool = True) -> np.ndarray:
+        """Cache ``vector`` for ``user_id`` and return the float32 copy that was stored."""
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        if not user_id:
+            return vector
+        self._store_local((kind, str(user_id)), fingerprint, vector)
+        if shared:
+            self._redis_set(user_id, fingerprint, vector, kind)
+        return vector
+
+    def invalidate(self, user_id: str, kind: str = "user") -> None:
+        """Drop a user's entry from both levels."""
+        with self._lock:
+            self._local.pop((kind, str(user_id)), None)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.delete(self._redis_key(user_id, kind))
+        except Exception as e:
+            logger.warning("Embedding cache invalidate failed", user_id=user_id, error=str(e))
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "local_entries": len(self._local),
+            "max_entries": self.max_entries,
+        }
+
+    def _store_local(self, local_key: Tuple[str, str], fingerprint: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._local[local_key] = (fingerprint, vector)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _redis_get(self, user_id: str, fingerprint: str, kind: str) -> Optional[np.ndarray]:
+        if self.redis_client is None:
+            return None
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hget(self._redis_key(user_id, kind), "fp")
+                pipe.hget(self._redis_key(user_id, kind), "vec")
+                stored_fp, raw = pipe.execute()
+            if isinstance(stored_fp, bytes):
+                stored_fp = stored_fp.decode("ascii", errors="ignore")
+            if stored_fp != fingerprint or not isinstance(raw, (bytes, bytearray)):
+                return None
+            return np.frombuffer(raw, dtype=np.float32).copy()
+        except Exception as e:
+            logger.warning("Embedding cache read failed", user_id=user_id, error=str(e))
+            return None
+
+    def _redis_set(self, user_id: str, fingerprint: str, vector: np.ndarray, kind: str) -> None:
+        if self.redis_client is None:
+            return
+        key = self._redis_key(user_id, kind)
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={"fp": fingerprint, "vec": vector.tobytes()})
+                pipe.expire(key, self.ttl_seconds)
+                pipe.execute()
+        except Exception as e:
+            logger.warning("Embedding cache write failed", user_id=user_id, error=str(e))
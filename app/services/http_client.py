@@ -0,0 +1,247 @@
+"""
+Shared pooled HTTP clients.
+
+Opening a fresh ``httpx.AsyncClient`` per call pays DNS, TCP and TLS setup on
+every LLM and service request and throws the connection away afterwards. The
+registry keeps one long-lived client per (event loop, origin) with bounded
+connection limits and keep-alive, negotiating HTTP/2 when the ``h2`` package is
+installed, so concurrent callers multiplex over warm connections.
+
+Clients are opened lazily on first use and closed on FastAPI lifespan shutdown
+and Celery worker process shutdown. Clients are bound to the event loop that
+created them; a caller on a different loop transparently gets its own client.
+
+Example:
+    >>> client = await http_client_registry.get_client(url)
+    >>> async with http_client_registry.track(url):
+    ...     response = await client.post(url, json=payload, timeout=timeout)
+"""
+import asyncio
+import importlib.util
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger("http_client")
+
+_H2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class _PooledClient:
+    """A client plus the loop it belongs to and its usage counters."""
+
+    def __init__(self, client: Any, loop: asyncio.AbstractEventLoop, origin: str):
+        self.client = client
+        self.loop_ref = weakref.ref(loop)
+        self.origin = origin
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def usable_from(self, loop: asyncio.AbstractEventLoop) -> bool:
+        return self.loop_ref() is loop and not loop.is_closed() and getattr(self.client, "is_closed", False) is not True
+
+    def orphaned(self) -> bool:
+        loop = self.loop_ref()
+        return loop is None or loop.is_closed()
+
+
+class HTTPClientRegistry:
+    """Process-wide registry of pooled ``httpx.AsyncClient`` instances per host."""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        http2: Optional[bool] = None,
+    ):
+        self.max_connections = int(max_connections if max_connections is not None else settings.http_pool_max_connections)
+        self.max_keepalive_connections = int(
+            max_keepalive_connections if max_keepalive_connections is not None else settings.http_pool_max_keepalive
+        )
+        self.keepalive_expiry = float(keepalive_expiry if keepalive_expiry is not None else settings.http_pool_keepalive_expiry)
+        wanted_http2 = settings.http_http2_enabled if http2 is None else http2
+        self.http2 = bool(wanted_http2 and _H2_AVAILABLE)
+        if wanted_http2 and not _H2_AVAILABLE:
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1",
+                          hint="pip install 'httpx[http2]'")
+        self._clients: Dict[Tuple[int, str], _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def origin(url: str) -> str:
+        """``scheme://host[:port]`` of ``url``; the pooling key."""
+        parts = urlsplit(str(url))
+        if not parts.scheme or not parts.netloc:
+            return str(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    async def get_client(self, url: str, timeout: Optional[float] = None) -> httpx.AsyncClient:
+        """Return the pooled client for ``url``'s origin on the running loop, opening it if needed."""
+        loop = asyncio.get_running_loop()
+        origin = self.origin(url)
+        key = (id(loop), origin)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry.usable_from(loop):
+                return entry.client
+            self._drop_orphans()
+
+        client = httpx.AsyncClient(timeout=timeout, limits=self._limits(), http2=self.http2)
+        client = await client.__aenter__()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry.usable_from(loop):
+                # Another coroutine on this loop opened one first
+                duplicate = client
+                client = entry.client
+            else:
+                self._clients[key] = _PooledClient(client, loop, origin)
+                duplicate = None
+        if duplicate is not None:
+            await self._close_client(duplicate, origin)
+        else:
+            logger.info("Opened pooled HTTP client", origin=origin, http2=self.http2,
+                        max_connections=self.max_connections)
+        return client
+
+    @asynccontextmanager
+    async def track(self, url: str):
+        """Account one request against ``url``'s pool for the utilisation metrics."""
+        entry = self._entry_for(url)
+        if entry is not None:
+            entry.in_flight += 1
+            entry.requests += 1
+        try:
+            yield
+        except Exception:
+            if entry is not None:
+                entry.errors += 1
+            raise
+        finally:
+            if entry is not None:
+                entry.in_flight -= 1
+                self._publish_metrics(entry)
+
+    def _entry_for(self, url: str) -> Optional[_PooledClient]:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return self._clients.get((id(loop), self.origin(url)))
+
+    @staticmethod
+    def _pool_connections(client: Any) -> Tuple[int, int]:
+        """(open, idle) connection counts from the transport pool, when exposed."""
+        try:
+            connections = list(client._transport._pool.connections)
+            idle = sum(1 for c in connections if c.is_idle())
+            return len(connections), idle
+        except Exception:
+            return 0, 0
+
+    def _publish_metrics(self, entry: _PooledClient) -> None:
+        try:
+            from app.services.monitoring import monitoring_service
+            open_conns, idle = self._pool_connections(entry.client)
+            collector = monitoring_service.metrics_collector
+            labels = {"origin": entry.origin}
+            collector.set_gauge("http_pool_in_flight", entry.in_flight, labels)
+            collector.set_gauge("http_pool_open_connections", open_conns, labels)
+            collector.set_gauge("http_pool_utilisation", open_conns / self.max_connections if self.max_connections else 0.0, labels)
+            collector.increment_counter("http_pool_requests_total", 1, labels)
+        except Exception as e:
+            logger.debug("Failed to publish HTTP pool metrics", error=str(e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        pools = []
+        with self._lock:
+            entries = list(self._clients.values())
+        for entry in entries:
+            open_conns, idle = self._pool_connections(entry.client)
+            pools.append({
+                "origin": entry.origin,
+                "in_flight": entry.in_flight,
+                "requests": entry.requests,
+                "errors": entry.errors,
+                "open_connections": open_conns,
+                "idle_connections": idle,
+                "utilisation": round(open_conns / self.max_connections, 4) if self.max_connections else 0.0,
+            })
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "clients": len(pools),
+            "pools": pools,
+        }
+
+    def _drop_orphans(self) -> None:
+        """Forget clients whose loop is gone; their sockets died with it. Caller holds the lock."""
+        for key in [k for k, e in self._clients.items() if e.orphaned()]:
+            self._clients.pop(key, None)
+
+    @staticmethod
+    async def _close_client(client: Any, origin: str) -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Failed to close pooled HTTP client", origin=origin, error=str(e))
+
+    async def aclose_all(self) -> int:
+        """Close every client owned by the running loop and forget the rest."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        closed = 0
+        for entry in entries:
+            if entry.loop_ref() is loop:
+                await self._close_client(entry.client, entry.origin)
+                closed += 1
+        if entries:
+            logger.info("Closed pooled HTTP clients", closed=closed, dropped=len(entries) - closed)
+        return closed
+
+    def close_all(self) -> int:
+        """Synchronous shutdown hook (e.g. Celery worker shutdown).
+
+        Clients whose loop is still open but idle are closed on that loop; clients
+        of running or closed loops are dropped.
+        """
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        closed = 0
+        for entry in entries:
+            loop = entry.loop_ref()
+            if loop is None or loop.is_closed() or loop.is_running():
+                continue
+            try:
+                loop.run_until_complete(self._close_client(entry.client, entry.origin))
+                closed += 1
+            except Exception as e:
+                logger.warning("Failed to close pooled HTTP client", origin=entry.origin, error=str(e))
+        if entries:
+            logger.info("Closed pooled HTTP clients", closed=closed, dropped=len(entries) - closed)
+        return closed
+
+
+# Global registry instance
+http_client_registry = HTTPClientRegistry()
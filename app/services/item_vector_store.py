@@ -0,0 +1,326 @@
+"""
+Item vector store.
+
+Holds text embeddings for recurring catalog items (the same popular titles come
+back from the LLM for many users) as one contiguous float32 matrix plus a
+key -> row index. With a ``path`` the matrix is a memory-mapped file and the
+index an append-only sidecar log, so every worker process on the host reads the
+same vectors; rows are immutable once written and published by appending their
+index line, which keeps readers lock-free.
+
+When the matrix fills up, the writer compacts it into a new generation of files
+holding only the latest row per key (dropping the oldest entries too if that
+would leave under a quarter of the rows free) and swaps the ``.gen`` pointer;
+readers keep their old mapping until their next refresh switches generation.
+A lookup miss re-reads the index at most once per ``refresh_interval`` and only
+when the ``.gen`` pointer or the index file has changed since the last read.
+
+Example:
+    >>> store = ItemVectorStore(dim=128, path="/tmp/portal_engine/item_vectors")
+    >>> vec = store.get("movies:inception", checksum)
+    >>> if vec is None:
+    ...     store.put("movies:inception", checksum, build_vector())
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.logging import get_logger
+
+try:
+    import fcntl
+    _FILE_LOCKING_AVAILABLE = True
+except Exception:
+    _FILE_LOCKING_AVAILABLE = False
+
+logger = get_logger("item_vector_store")
+
+
+class ItemVectorStore:
+    """Contiguous float32 vector store keyed by normalized item key.
+
+    Each entry carries a checksum of the text it was built from; a lookup with a
+    different checksum (e.g. the LLM returned a new description) is a miss and the
+    next ``put`` publishes a fresh row for the key. The row it replaces is
+    reclaimed by the next compaction.
+    """
+
+    def __init__(
+        self,
+        dim: int = 128,
+        capacity: int = 65536,
+        path: Optional[str] = None,
+        signature: str = "v1",
+        refresh_interval: float = 0.05
+    ):
+        self.dim = int(dim)
+        self.capacity = max(1, int(capacity))
+        self.signature = signature
+        self.refresh_interval = max(0.0, float(refresh_interval))
+        self._next_refresh_check = 0.0
+        self._generation_stamp: Optional[Tuple[int, int]] = None
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._index_offset = 0
+        self._generation = 0
+        self._base: Optional[str] = None
+        self._data_path: Optional[str] = None
+        self._index_path: Optional[str] = None
+        self._lock_path: Optional[str] = None
+        self._generation_path: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+
+        self._vectors = None
+        if path and _FILE_LOCKING_AVAILABLE:
+            try:
+                self._open_shared(path)
+            except Exception as e:
+                logger.warning("Item vector store falling back to process memory", path=path, error=str(e))
+                self._data_path = self._index_path = self._lock_path = self._generation_path = None
+                self._vectors = None
+        if self._vectors is None:
+            self._vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+
+    @property
+    def shared(self) -> bool:
+        return self._data_path is not None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str, checksum: int) -> Optional[np.ndarray]:
+        """Return a copy of the stored vector for ``key`` if its checksum matches."""
+        key = self._clean_key(key)
+        with self._lock:
+            entry = self._index.get(key)
+            if (entry is None or entry[1] != checksum) and self.shared and self._refresh_if_changed():
+                entry = self._index.get(key)
+            if entry is None or entry[1] != checksum:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return np.array(self._vectors[entry[0]], dtype=np.float32)
+
+    def put(self, key: str, checksum: int, vector: np.ndarray) -> bool:
+        """Store ``vector`` for ``key``; returns False if it cannot be written."""
+        key = self._clean_key(key)
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            return False
+        with self._lock:
+            if self.shared:
+                return self._put_shared(key, checksum, vector)
+            if self._count >= self.capacity:
+                self._compact_local()
+            row = self._count
+            self._vectors[row] = vector
+            self._count += 1
+            self._index[key] = (row, checksum)
+            return True
+
+    def get_stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "rows_used": self._count,
+            "capacity": self.capacity,
+            "shared": self.shared,
+            "generation": self._generation,
+            "compactions": self.compactions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    @staticmethod
+    def _clean_key(key: str) -> str:
+        # Keys are stored one per line in the index log
+        return " ".join(str(key).split())
+
+    def _live_entries(self) -> List[Tuple[str, Tuple[int, int]]]:
+        """Latest row per key in publish order, keeping a quarter of the rows free."""
+        live = sorted(self._index.items(), key=lambda item: item[1][0])
+        keep = self.capacity - max(1, self.capacity // 4)
+        return live[-keep:] if keep > 0 else []
+
+    def _compact_local(self) -> None:
+        live = self._live_entries()
+        self._index = {}
+        # Rows only move towards the front, so copying in publish order is safe
+        for row, (key, (old_row, checksum)) in enumerate(live):
+            self._vectors[row] = self._vectors[old_row]
+            self._index[key] = (row, checksum)
+        self._count = len(live)
+        self.compactions += 1
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        # Generation 0 keeps the original file names
+        suffix = f".g{generation}" if generation else ""
+        return f"{self._base}{suffix}.f32", f"{self._base}{suffix}.idx"
+
+    def _ensure_files(self, generation: int) -> None:
+        data_path, index_path = self._paths(generation)
+        size = self.capacity * self.dim * 4
+        if not os.path.exists(data_path) or os.path.getsize(data_path) < size:
+            with open(data_path, "ab") as fh:
+                fh.truncate(size)
+        open(index_path, "a").close()
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self._generation_path, "r", encoding="utf-8") as fh:
+                return int(fh.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            return self._generation
+
+    def _switch_generation(self, generation: int) -> None:
+        data_path, index_path = self._paths(generation)
+        vectors = np.memmap(data_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        self._vectors = vectors
+        self._data_path, self._index_path = data_path, index_path
+        self._generation = generation
+        self._index = {}
+        self._count = 0
+        self._index_offset = 0
+
+    def _open_shared(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self._base = os.path.join(path, f"items-{self.signature}-{self.dim}")
+        self._lock_path = self._base + ".lock"
+        self._generation_path = self._base + ".gen"
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                generation = self._read_generation()
+                self._ensure_files(generation)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._switch_generation(generation)
+        self._refresh_index()
+
+    def _file_stamp(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh_if_changed(self) -> bool:
+        """Refresh on the read path, rate-limited and skipped when no file changed.
+
+        Returns whether the index was re-read.
+        """
+        now = time.monotonic()
+        if now < self._next_refresh_check:
+            return False
+        self._next_refresh_check = now + self.refresh_interval
+        try:
+            index_size = os.stat(self._index_path).st_size
+        except OSError:
+            index_size = None
+        if (
+            self._file_stamp(self._generation_path) == self._generation_stamp
+            and index_size is not None
+            and index_size <= self._index_offset
+        ):
+            return False
+        self._refresh_index()
+        return True
+
+    def _refresh_index(self) -> None:
+        """Read index lines appended by any process since the last refresh."""
+        self._generation_stamp = self._file_stamp(self._generation_path)
+        generation = self._read_generation()
+        if generation != self._generation:
+            try:
+                self._switch_generation(generation)
+            except Exception as e:
+                logger.warning("Item vector store generation switch failed", generation=generation, error=str(e))
+                return
+        try:
+            with open(self._index_path, "rb") as fh:
+                fh.seek(self._index_offset)
+                chunk = fh.read()
+        except Exception as e:
+            logger.warning("Item vector index read failed", error=str(e))
+            return
+        if not chunk:
+            return
+        # Only consume complete lines; a writer may be mid-append
+        complete = chunk[: chunk.rfind(b"\n") + 1]
+        self._index_offset += len(complete)
+        for line in complete.decode("utf-8", errors="replace").splitlines():
+            try:
+                row_s, checksum_s, key = line.split("\t", 2)
+                row = int(row_s)
+                self._index[key] = (row, int(checksum_s))
+                self._count = max(self._count, row + 1)
+            except ValueError:
+                continue
+
+    def _put_shared(self, key: str, checksum: int, vector: np.ndarray) -> bool:
+        try:
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh_index()
+                    entry = self._index.get(key)
+                    if entry is not None and entry[1] == checksum:
+                        return True
+                    if self._count >= self.capacity:
+                        self._compact_shared()
+                    row = self._count
+                    # Write the row before publishing it in the index
+                    self._vectors[row] = vector
+                    with open(self._index_path, "a", encoding="utf-8") as fh:
+                        fh.write(f"{row}\t{checksum}\t{key}\n")
+                    self._refresh_index()
+                    return True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception as e:
+            logger.warning("Item vector store write failed", key=key, error=str(e))
+            return False
+
+    def _compact_shared(self) -> None:
+        """Copy live rows into the next generation's files; caller holds the file lock."""
+        live = self._live_entries()
+        generation = self._generation + 1
+        data_path, index_path = self._paths(generation)
+        for stale in (data_path, index_path):
+            # Left behind by a compaction that died before publishing
+            if os.path.exists(stale):
+                os.remove(stale)
+        self._ensure_files(generation)
+        vectors = np.memmap(data_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        lines = []
+        for row, (key, (old_row, checksum)) in enumerate(live):
+            vectors[row] = self._vectors[old_row]
+            lines.append(f"{row}\t{checksum}\t{key}\n")
+        vectors.flush()
+        with open(index_path, "w", encoding="utf-8") as fh:
+            fh.write("".join(lines))
+        pointer = self._generation_path + ".tmp"
+        with open(pointer, "w", encoding="utf-8") as fh:
+            fh.write(str(generation))
+        os.replace(pointer, self._generation_path)
+
+        old_paths = self._paths(self._generation)
+        self._switch_generation(generation)
+        self._refresh_index()
+        # Processes still mapping the old data file keep it alive until they switch
+        for old in old_paths:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        self.compactions += 1
+        logger.info("Compacted item vector store", generation=generation, rows=len(live), capacity=self.capacity)
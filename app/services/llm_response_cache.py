@@ -0,0 +1,105 @@
+"""
+LLM response cache.
+
+Sits in front of the provider round-trip in ``LLMService._call_llm_api``. The
+provider output carries personalised text, so entries are keyed by the full
+generation inputs (prompt, structured user context, city, provider and a UTC
+date bucket): repeated requests with identical inputs, such as retries,
+re-rankings and batch refreshes of unchanged users, reuse the parsed provider
+output. Per-user ranking still runs on every request.
+
+Values are zlib-compressed JSON stored with a TTL.
+
+Example:
+    >>> cache = LLMResponseCache(redis_client=client)
+    >>> key = cache.key(descriptor)
+    >>> recs = cache.get(key)
+    >>> if recs is None:
+    ...     cache.set(key, call_provider())
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Optional
+
+import redis
+
+from app.core.logging import get_logger
+
+logger = get_logger("llm_response_cache")
+
+
+class LLMResponseCache:
+    """Redis-backed, compressed cache of parsed LLM recommendation responses."""
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        ttl_seconds: int = 21600,
+        namespace: str = "recommendations",
+        enabled: bool = True,
+        compress_level: int = 6
+    ):
+        self.redis_client = redis_client
+        self.ttl_seconds = int(ttl_seconds)
+        self.namespace = namespace
+        self.enabled = bool(enabled) and self.ttl_seconds > 0
+        self.compress_level = int(compress_level)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(descriptor: Dict[str, Any]) -> str:
+        """Stable digest of a request descriptor."""
+        payload = json.dumps(descriptor, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:llm_cache:{key}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled or self.redis_client is None:
+            return None
+        value = None
+        try:
+            raw = self.redis_client.get(self._redis_key(key))
+            if raw:
+                value = json.loads(zlib.decompress(raw).decode("utf-8"))
+        except Exception as e:
+            logger.warning("LLM response cache read failed", key=key, error=str(e))
+            value = None
+        if not isinstance(value, dict):
+            value = None
+        self._record("hit" if value is not None else "miss")
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> bool:
+        if not self.enabled or self.redis_client is None or not value:
+            return False
+        try:
+            raw = zlib.compress(json.dumps(value, default=str, separators=(",", ":")).encode("utf-8"), self.compress_level)
+            self.redis_client.setex(self._redis_key(key), self.ttl_seconds, raw)
+            return True
+        except Exception as e:
+            logger.warning("LLM response cache write failed", key=key, error=str(e))
+            return False
+
+    def _record(self, result: str) -> None:
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        try:
+            from app.services.monitoring import monitoring_service
+            monitoring_service.metrics_collector.increment_counter("llm_response_cache_requests_total", 1, {"result": result})
+        except Exception as e:
+            logger.debug("Failed to record LLM cache metric", error=str(e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
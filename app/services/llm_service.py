@@ -1,15 +1,28 @@
+import asyncio
 import json
 import time
 import random
 import httpx
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 from app.core.logging import get_logger, log_api_call, log_api_response, log_exception
 from app.core.config import settings
+from app.services.embedding_cache import UserEmbeddingCache
+from app.services.http_client import http_client_registry
+from app.services.item_vector_store import ItemVectorStore
+from app.services.llm_response_cache import LLMResponseCache
+from app.services.notification_publisher import NotificationPublishError, notification_publisher
+from app.services.single_flight import SingleFlight
+from app.utils import featurizer
+from app.utils.event_loop import loop_runner
+from app.utils.json_stream import CategoryStreamParser
+from app.utils.prompt_builder import PromptBuilder
 import redis
 from datetime import datetime, timezone
 import math
+import zlib
 from dataclasses import dataclass
 import re
+import numpy as np
 
 try:
     import torch
@@ -22,6 +35,90 @@ except Exception:
 logger = get_logger("llm_service")
 
 
+if TWO_TOWER_TORCH_AVAILABLE:
+    class HashingTextEncoder(nn.Module):  # type: ignore
+        def __init__(self, vocab_size: int, embed_dim: int):
+            super().__init__()
+            self.emb = nn.EmbeddingBag(vocab_size, embed_dim, mode="mean")
+
+        def forward(self, token_indices: torch.Tensor, offsets: Optional[torch.Tensor] = None) -> torch.Tensor:
+            """Mean-pool token embeddings.
+
+            Without offsets the whole tensor is one bag and a 1-D embedding is returned;
+            with offsets each bag is one row of a (batch, embed_dim) matrix.
+            """
+            if token_indices is None or token_indices.numel() == 0:
+                return torch.zeros(self.emb.embedding_dim, device=next(self.parameters()).device)
+            if offsets is None:
+                offsets = torch.tensor([0], device=token_indices.device, dtype=torch.long)
+                return self.emb(token_indices, offsets).squeeze(0)
+            return self.emb(token_indices, offsets)
+
+    class UserTower(nn.Module):  # type: ignore
+        def __init__(self, vocab_size: int = 50000, text_embed_dim: int = 64, numeric_dim: int = 8, out_dim: int = 64):
+            super().__init__()
+            self.text = HashingTextEncoder(vocab_size, text_embed_dim)
+            self.numeric = nn.Sequential(
+                nn.Linear(numeric_dim, 64), nn.ReLU(), nn.Linear(64, out_dim)
+            )
+            self.proj = nn.Linear(text_embed_dim + out_dim, out_dim)
+
+        def forward(self, token_indices: torch.Tensor, numeric: torch.Tensor, offsets: Optional[torch.Tensor] = None) -> torch.Tensor:
+            t = self.text(token_indices, offsets)
+            n = self.numeric(numeric)
+            x = torch.cat([t, n], dim=-1)
+            x = self.proj(x)
+            return F.normalize(x, p=2, dim=-1)
+
+    class ItemTower(UserTower):  # type: ignore
+        pass
+
+    class TwoTowerModel(nn.Module):  # type: ignore
+        def __init__(self, vocab_size: int = 50000, text_embed_dim: int = 64, user_numeric_dim: int = 8, item_numeric_dim: int = 8, out_dim: int = 64):
+            super().__init__()
+            self.user = UserTower(vocab_size, text_embed_dim, user_numeric_dim, out_dim)
+            self.item = ItemTower(vocab_size, text_embed_dim, item_numeric_dim, out_dim)
+
+        def forward(self, u_tokens: torch.Tensor, u_numeric: torch.Tensor, i_tokens: torch.Tensor, i_numeric: torch.Tensor) -> torch.Tensor:
+            ue = self.user(u_tokens, u_numeric)
+            ie = self.item(i_tokens, i_numeric)
+            sim = F.cosine_similarity(ue, ie, dim=-1)  # [-1, 1]
+            return sim
+
+        def score_items(
+            self,
+            u_tokens: torch.Tensor,
+            u_numeric: torch.Tensor,
+            i_tokens: torch.Tensor,
+            i_offsets: torch.Tensor,
+            i_numeric: torch.Tensor
+        ) -> torch.Tensor:
+            """Cosine similarity of one user against a batch of items.
+
+            The user tower runs once and the item tower runs over every item in a single
+            EmbeddingBag pass (flat tokens + offsets). Both towers emit unit vectors, so
+            scoring is one matrix-vector product.
+            """
+            ue = self.user(u_tokens, u_numeric)
+            return self.score_items_for_user(ue, i_tokens, i_offsets, i_numeric)
+
+        def score_items_for_user(
+            self,
+            ue: torch.Tensor,
+            i_tokens: torch.Tensor,
+            i_offsets: torch.Tensor,
+            i_numeric: torch.Tensor
+        ) -> torch.Tensor:
+            """Same as score_items for an already-encoded (unit) user vector."""
+            ie = self.item(i_tokens, i_numeric, i_offsets)
+            return ie @ ue  # [-1, 1] per item
+else:
+    HashingTextEncoder = None
+    UserTower = None
+    ItemTower = None
+    TwoTowerModel = None
+
+
 class LLMService:
     """Service to generate recommendations from prompts and store in Redis"""
     
@@ -71,6 +168,66 @@ class LLMService:
         # Two-Tower model (lazy init)
         self._two_tower_model = None
         self._two_tower_device = "cpu"
+        self._two_tower_version = 0
+        # Only trained weights are used for ranking; random initial weights would differ per process
+        self._two_tower_trained = False
+        binary_redis = self._create_embedding_redis_client()
+        # User embeddings are reused across refreshes while their inputs are unchanged
+        self._embedding_cache = UserEmbeddingCache(
+            redis_client=binary_redis,
+            max_entries=getattr(settings, "user_embedding_cache_size", 1024),
+            ttl_seconds=getattr(settings, "user_embedding_cache_ttl_seconds", 7200),
+            namespace=getattr(settings, "redis_namespace", "recommendations"),
+            signature=self._featurizer_signature()
+        )
+        # Text vectors of recurring catalog items, shared across worker processes via mmap
+        self._item_vector_store = self._create_item_vector_store()
+        # Profile/LIE/CIS clients for context assembly (created on first use, then reused)
+        self._context_services: Optional[Dict[str, Any]] = None
+        # Parsed provider responses keyed by prompt plus personalising inputs
+        self._llm_response_cache = LLMResponseCache(
+            redis_client=binary_redis,
+            ttl_seconds=getattr(settings, "llm_response_cache_ttl_seconds", 21600),
+            namespace=getattr(settings, "redis_namespace", "recommendations"),
+            enabled=getattr(settings, "llm_response_cache_enabled", True)
+        )
+        # Coalesces duplicate generation requests within and across processes
+        self._single_flight = SingleFlight(
+            namespace=getattr(settings, "redis_namespace", "recommendations"),
+            lease_seconds=getattr(settings, "single_flight_lease_seconds", 180.0),
+            wait_timeout=getattr(settings, "single_flight_wait_timeout_seconds", 150.0),
+            poll_interval=getattr(settings, "single_flight_poll_interval_seconds", 0.25)
+        )
+
+    def _create_embedding_redis_client(self) -> Optional[redis.Redis]:
+        """Binary-safe Redis client for raw float32 embedding bytes and compressed cache entries."""
+        try:
+            return redis.Redis(
+                host=settings.redis_host,
+                port=getattr(settings, "redis_port", 6379),
+                db=1,
+                password=getattr(settings, "redis_password", None),
+                socket_connect_timeout=3,
+                socket_timeout=5,
+                health_check_interval=30,
+                decode_responses=False
+            )
+        except Exception as e:
+            logger.warning("Embedding cache will be process-local only", error=str(e))
+            return None
+
+    def _create_item_vector_store(self) -> ItemVectorStore:
+        path = getattr(settings, "item_vector_store_path", None)
+        capacity = getattr(settings, "item_vector_store_capacity", 65536)
+        if not isinstance(path, str):
+            path = None
+        if not isinstance(capacity, int):
+            capacity = 65536
+        return ItemVectorStore(dim=128, capacity=capacity, path=path, signature=self._featurizer_signature())
+
+    def _featurizer_signature(self) -> str:
+        """Identifies the token hashing scheme; persisted vectors are namespaced by it."""
+        return featurizer.FEATURIZER_VERSION
 
     def _validate_cached_payload(self, payload: Any) -> bool:
         """Basic schema checks for cached recommendation payloads."""
@@ -120,14 +277,11 @@ class LLMService:
         """Simple deterministic hashing vectorizer for text into fixed-size vector.
         Avoids external deps; suitable for similarity features.
         """
-        if not isinstance(text, str) or not text:
-            return [0.0] * dim
-        vec = [0.0] * dim
-        for token in text.lower().split():
-            h = hash(token) % dim
-            sign = 1.0 if (hash(token + "_") % 2 == 0) else -1.0
-            vec[h] += sign
-        return vec
+        return self._hashing_vector(text, dim).tolist()
+
+    def _hashing_vector(self, text: str, dim: int = 128) -> np.ndarray:
+        """NumPy variant of _hashing_vectorizer used by the batch scoring path."""
+        return featurizer.vector(text, dim)
 
     def _l2_normalize(self, vec: List[float]) -> List[float]:
         mag = math.sqrt(sum(v * v for v in vec))
@@ -161,20 +315,28 @@ class LLMService:
         history: Dict[str, List[Dict[str, str]]],
         interaction_data: Optional[Dict[str, Any]]
     ) -> List[float]:
+        return self._user_embedding_array(user_profile, location_data, history, interaction_data).tolist()
+
+    def _user_embedding_array(
+        self,
+        user_profile: Optional[Dict[str, Any]],
+        location_data: Optional[Dict[str, Any]],
+        history: Dict[str, List[Dict[str, str]]],
+        interaction_data: Optional[Dict[str, Any]]
+    ) -> np.ndarray:
         dim = 128
-        accum = [0.0] * dim
+        accum = np.zeros(dim)
 
         # Profile-based signals
         if user_profile:
             age = user_profile.get("age")
             if isinstance(age, (int, float)):
                 age_bucket = self._bucketize(float(age), [18, 25, 35, 45, 55, 65])
-                age_vec = self._hashing_vectorizer(f"age_bucket_{age_bucket}", dim)
-                accum = [a + b for a, b in zip(accum, age_vec)]
+                accum += self._hashing_vector(f"age_bucket_{age_bucket}", dim)
             interests = user_profile.get("interests", [])
             if isinstance(interests, list) and interests:
                 txt = " ".join(str(i) for i in interests[:20])
-                accum = [a + b for a, b in zip(accum, self._hashing_vectorizer("interests " + txt, dim))]
+                accum += self._hashing_vector("interests " + txt, dim)
             # Keywords from preferences (legacy)
             prefs = user_profile.get("preferences", {})
             kw_values = []
@@ -187,7 +349,7 @@ class LLMService:
             except Exception:
                 pass
             if kw_values:
-                accum = [a + b for a, b in zip(accum, self._hashing_vectorizer("keywords " + " ".join(kw_values), dim))]
+                accum += self._hashing_vector("keywords " + " ".join(kw_values), dim)
 
         # Location-based signals
         if location_data:
@@ -197,7 +359,7 @@ class LLMService:
             else:
                 city = cur if isinstance(cur, str) else ""
             if city:
-                accum = [a + b for a, b in zip(accum, self._hashing_vectorizer("city " + city, dim))]
+                accum += self._hashing_vector("city " + city, dim)
 
         # Interaction history signals
         action_weights = {
@@ -216,19 +378,27 @@ class LLMService:
                 action = inter.get("action", "view").lower()
                 weight = action_weights.get(action, 0.2)
                 rec = self._recency_weight(inter.get("timestamp", ""))
-                v = self._hashing_vectorizer(" ".join(text_bits), dim)
-                accum = [a + weight * rec * b for a, b in zip(accum, v)]
+                accum += weight * rec * self._hashing_vector(" ".join(text_bits), dim)
 
         # Engagement level (optional)
         if interaction_data:
             es = interaction_data.get("engagement_score")
             if isinstance(es, (int, float)):
                 bucket = self._bucketize(float(es), [0.2, 0.4, 0.6, 0.8])
-                accum = [a + b for a, b in zip(accum, self._hashing_vectorizer(f"engagement_{bucket}", dim))]
+                accum += self._hashing_vector(f"engagement_{bucket}", dim)
 
-        return self._l2_normalize(accum)
+        return self._l2_normalize_array(accum)
+
+    def _l2_normalize_array(self, vec: np.ndarray) -> np.ndarray:
+        mag = float(np.sqrt(np.dot(vec, vec)))
+        if mag == 0.0:
+            return vec
+        return vec / mag
 
     def _build_item_embedding(self, item: Dict[str, Any], category: str) -> List[float]:
+        return self._item_embedding_array(item, category).tolist()
+
+    def _item_embedding_array(self, item: Dict[str, Any], category: str) -> np.ndarray:
         dim = 128
         parts: List[str] = []
         # Common textual fields
@@ -240,7 +410,7 @@ class LLMService:
         if isinstance(item.get("keywords"), list):
             parts.append(" ".join(map(str, item.get("keywords"))))
 
-        vec = self._hashing_vectorizer(" ".join(parts), dim)
+        vec = self._item_text_vector(" ".join(parts), item, category, dim)
 
         # Numeric/popularity features via bucket tags
         # rating
@@ -251,7 +421,7 @@ class LLMService:
             rating_val = None
         if rating_val is not None:
             rb = self._bucketize(rating_val, [2, 3, 3.5, 4, 4.5, 8, 9])
-            vec = [v + u for v, u in zip(vec, self._hashing_vectorizer(f"rating_bucket_{rb}", dim))]
+            vec += self._hashing_vector(f"rating_bucket_{rb}", dim)
 
         # listeners/popularity
         listeners_raw = item.get("monthly_listeners")
@@ -261,13 +431,13 @@ class LLMService:
             listeners = None
         if listeners is not None:
             lb = self._bucketize(listeners, [1, 5, 10, 25, 50, 100])
-            vec = [v + u for v, u in zip(vec, self._hashing_vectorizer(f"listeners_bucket_{lb}", dim))]
+            vec += self._hashing_vector(f"listeners_bucket_{lb}", dim)
 
         # distance/location relevance
         dist = item.get("distance_from_user")
         if isinstance(dist, (int, float)):
             db = self._bucketize(float(dist), [1, 5, 10, 20, 50, 100, 500])
-            vec = [v + u for v, u in zip(vec, self._hashing_vectorizer(f"distance_bucket_{db}", dim))]
+            vec += self._hashing_vector(f"distance_bucket_{db}", dim)
 
         # recency
         now = datetime.now(timezone.utc)
@@ -298,9 +468,71 @@ class LLMService:
                 recency_val = None
         if recency_val is not None:
             rb = self._bucketize(float(recency_val), [0, 7, 30, 90, 365, 5 * 365])
-            vec = [v + u for v, u in zip(vec, self._hashing_vectorizer(f"recency_bucket_{rb}", dim))]
+            vec += self._hashing_vector(f"recency_bucket_{rb}", dim)
+
+        return self._l2_normalize_array(vec)
+
+    def _user_embedding_fingerprint(
+        self,
+        user_profile: Optional[Dict[str, Any]],
+        location_data: Optional[Dict[str, Any]],
+        history: Optional[Dict[str, List[Dict[str, str]]]],
+        interaction_data: Optional[Dict[str, Any]]
+    ) -> str:
+        """Digest of the inputs that feed the user encoders; volatile fields are left out
+        so an unchanged profile/history maps to the same cache entry."""
+        profile = user_profile or {}
+        cur = (location_data or {}).get("current_location")
+        if isinstance(cur, dict):
+            city = cur.get("city") or cur.get("name") or ""
+        else:
+            city = cur if isinstance(cur, str) else ""
+        return UserEmbeddingCache.fingerprint(
+            profile.get("age"),
+            profile.get("interests"),
+            profile.get("preferences"),
+            city,
+            (interaction_data or {}).get("engagement_score"),
+            history or {}
+        )
 
-        return self._l2_normalize(vec)
+    def _get_user_vector(
+        self,
+        user_id: Optional[str],
+        user_profile: Optional[Dict[str, Any]],
+        location_data: Optional[Dict[str, Any]],
+        history: Dict[str, List[Dict[str, str]]],
+        interaction_data: Optional[Dict[str, Any]]
+    ) -> np.ndarray:
+        """User embedding for the hashing encoder, served from the embedding cache when
+        the profile/history fingerprint is unchanged."""
+        if not user_id:
+            return self._user_embedding_array(user_profile or {}, location_data or {}, history or {}, interaction_data or {})
+        fp = self._user_embedding_fingerprint(user_profile, location_data, history, interaction_data)
+        cached = self._embedding_cache.get(user_id, fp)
+        if cached is not None:
+            return cached
+        vector = self._user_embedding_array(user_profile or {}, location_data or {}, history or {}, interaction_data or {})
+        return self._embedding_cache.set(user_id, fp, vector)
+
+    def _item_text_vector(self, text: str, item: Dict[str, Any], category: str, dim: int = 128) -> np.ndarray:
+        """Hashed text vector for an item, looked up in the item vector store first.
+
+        Keyed by category plus normalized title; the text checksum guards against the
+        same title arriving with a different description or genre.
+        """
+        title = self._normalize_key(str(item.get("title") or item.get("name") or ""))
+        store = getattr(self, "_item_vector_store", None)
+        if not title or store is None or dim != store.dim:
+            return self._hashing_vector(text, dim)
+        key = f"{category}:{title}"
+        checksum = zlib.crc32(text.encode("utf-8"))
+        cached = store.get(key, checksum)
+        if cached is not None:
+            return cached.astype(np.float64)
+        vec = self._hashing_vector(text, dim)
+        store.put(key, checksum, vec)
+        return vec
 
     def _category_prior(self, item: Dict[str, Any], category: str) -> float:
         """Small prior boost based on intrinsic item quality/popularity."""
@@ -426,10 +658,7 @@ class LLMService:
         return bool(TWO_TOWER_TORCH_AVAILABLE)
 
     def _hash_tokens(self, text: str, vocab_size: int) -> List[int]:
-        if not isinstance(text, str) or not text:
-            return []
-        tokens = [t for t in text.lower().split() if t]
-        return [abs(hash(t)) % vocab_size for t in tokens[:256]]
+        return featurizer.token_ids(text, vocab_size)
 
     def _extract_user_numeric_features(
         self,
@@ -495,23 +724,48 @@ class LLMService:
         dist_n = 1.0 - min(1.0, dist / 100.0)
         return [rating_n, box_office_n, capacity_n, listeners_n, chart_pos_n, price_min_n, age_gate_n, dist_n]
 
-    def _preference_alignment_boost(self, item: Dict[str, Any], category: str, user_profile: Dict[str, Any]) -> float:
+    def _preference_terms(self, user_profile: Dict[str, Any]) -> List[str]:
+        """Salient cue terms used by the preference-alignment boost.
+        Depends only on the user profile, so batch scoring computes it once per request.
+        """
+        prefs_texts: List[str] = []
+        # gather declared interests from profile
+        interests = (user_profile or {}).get("interests")
+        if isinstance(interests, list):
+            prefs_texts.extend([str(x).lower() for x in interests])
+        # also scan preferences free-form keys/values
+        prefs = (user_profile or {}).get("preferences", {})
+        if isinstance(prefs, dict):
+            prefs_texts.extend([str(k).lower() for k in list(prefs.keys())[:20]])
+            for v in list(prefs.values())[:20]:
+                if isinstance(v, (str, int, float)):
+                    prefs_texts.append(str(v).lower())
+
+        # Heuristic: count strong matches of salient cues
+        strong_terms = [
+            "african-american", "hispanic", "latin", "latino", "afrobeats", "jazz", "urban",
+            "dance", "dancing", "sunset", "solitary", "minimalist", "museum", "park",
+            "action", "drama", "science fiction", "festival"
+        ]
+        # Expand with profile-derived cues (words following 'very likely') if present
+        for t in list(prefs_texts):
+            if "very likely" in t:
+                strong_terms.append(t.replace("very likely", "").strip())
+        return [t.strip() for t in strong_terms if t.strip()]
+
+    def _preference_alignment_boost(
+        self,
+        item: Dict[str, Any],
+        category: str,
+        user_profile: Dict[str, Any],
+        terms: Optional[List[str]] = None
+    ) -> float:
         """Compute a deterministic preference-alignment boost in [0, 0.2].
         Emphasizes 'very likely' traits by scanning item metadata fields.
         """
         try:
-            prefs_texts: List[str] = []
-            # gather declared interests from profile
-            interests = (user_profile or {}).get("interests")
-            if isinstance(interests, list):
-                prefs_texts.extend([str(x).lower() for x in interests])
-            # also scan preferences free-form keys/values
-            prefs = (user_profile or {}).get("preferences", {})
-            if isinstance(prefs, dict):
-                prefs_texts.extend([str(k).lower() for k in list(prefs.keys())[:20]])
-                for v in list(prefs.values())[:20]:
-                    if isinstance(v, (str, int, float)):
-                        prefs_texts.append(str(v).lower())
+            if terms is None:
+                terms = self._preference_terms(user_profile)
 
             # Extract item text pieces
             parts: List[str] = []
@@ -523,24 +777,7 @@ class LLMService:
                 parts.extend([str(k) for k in item.get("keywords")])
             item_text = (" ".join(parts)).lower()
 
-            # Heuristic: count strong matches of salient cues
-            strong_terms = [
-                "african-american", "hispanic", "latin", "latino", "afrobeats", "jazz", "urban",
-                "dance", "dancing", "sunset", "solitary", "minimalist", "museum", "park",
-                "action", "drama", "science fiction", "festival"
-            ]
-            # Expand with profile-derived cues (words following 'very likely') if present
-            for t in list(prefs_texts):
-                if "very likely" in t:
-                    strong_terms.append(t.replace("very likely", "").strip())
-
-            match_score = 0.0
-            for term in strong_terms:
-                t = term.strip()
-                if not t:
-                    continue
-                if t in item_text:
-                    match_score += 1.0
+            match_score = float(sum(1 for t in terms if t in item_text))
 
             # Cap and scale. Multiple matches → stronger boost
             match_score = min(match_score, 5.0)
@@ -549,74 +786,30 @@ class LLMService:
         except Exception:
             return 0.0
 
-    # Define placeholders first to satisfy static analysis; override with real impls if torch is available
-    class HashingTextEncoder:  # type: ignore
-        pass
-
-    class UserTower:  # type: ignore
-        pass
-
-    class ItemTower:  # type: ignore
-        pass
-
-    class TwoTowerModel:  # type: ignore
-        pass
-
-    if TWO_TOWER_TORCH_AVAILABLE:
-        class HashingTextEncoder(nn.Module):  # type: ignore
-            def __init__(self, vocab_size: int, embed_dim: int):
-                super().__init__()
-                self.emb = nn.EmbeddingBag(vocab_size, embed_dim, mode="mean")
-
-            def forward(self, token_indices: torch.Tensor) -> torch.Tensor:
-                if token_indices is None or token_indices.numel() == 0:
-                    return torch.zeros(self.emb.embedding_dim, device=next(self.parameters()).device)
-                offsets = torch.tensor([0], device=token_indices.device, dtype=torch.long)
-                return self.emb(token_indices, offsets).squeeze(0)
-
-        class UserTower(nn.Module):  # type: ignore
-            def __init__(self, vocab_size: int = 50000, text_embed_dim: int = 64, numeric_dim: int = 8, out_dim: int = 64):
-                super().__init__()
-                self.text = HashingTextEncoder(vocab_size, text_embed_dim)  # type: ignore[name-defined]
-                self.numeric = nn.Sequential(
-                    nn.Linear(numeric_dim, 64), nn.ReLU(), nn.Linear(64, out_dim)
-                )
-                self.proj = nn.Linear(text_embed_dim + out_dim, out_dim)
-
-            def forward(self, token_indices: torch.Tensor, numeric: torch.Tensor) -> torch.Tensor:
-                t = self.text(token_indices)
-                n = self.numeric(numeric)
-                x = torch.cat([t, n], dim=-1)
-                x = self.proj(x)
-                return F.normalize(x, p=2, dim=-1)
-
-        class ItemTower(nn.Module):  # type: ignore
-            def __init__(self, vocab_size: int = 50000, text_embed_dim: int = 64, numeric_dim: int = 8, out_dim: int = 64):
-                super().__init__()
-                self.text = HashingTextEncoder(vocab_size, text_embed_dim)  # type: ignore[name-defined]
-                self.numeric = nn.Sequential(
-                    nn.Linear(numeric_dim, 64), nn.ReLU(), nn.Linear(64, out_dim)
-                )
-                self.proj = nn.Linear(text_embed_dim + out_dim, out_dim)
-
-            def forward(self, token_indices: torch.Tensor, numeric: torch.Tensor) -> torch.Tensor:
-                t = self.text(token_indices)
-                n = self.numeric(numeric)
-                x = torch.cat([t, n], dim=-1)
-                x = self.proj(x)
-                return F.normalize(x, p=2, dim=-1)
-
-        class TwoTowerModel(nn.Module):  # type: ignore
-            def __init__(self, vocab_size: int = 50000, text_embed_dim: int = 64, user_numeric_dim: int = 8, item_numeric_dim: int = 8, out_dim: int = 64):
-                super().__init__()
-                self.user = UserTower(vocab_size, text_embed_dim, user_numeric_dim, out_dim)  # type: ignore[name-defined]
-                self.item = ItemTower(vocab_size, text_embed_dim, item_numeric_dim, out_dim)  # type: ignore[name-defined]
-
-            def forward(self, u_tokens: torch.Tensor, u_numeric: torch.Tensor, i_tokens: torch.Tensor, i_numeric: torch.Tensor) -> torch.Tensor:
-                ue = self.user(u_tokens, u_numeric)
-                ie = self.item(i_tokens, i_numeric)
-                sim = F.cosine_similarity(ue, ie, dim=-1)  # [-1, 1]
-                return sim
+    def _ranking_prior(self, item: Dict[str, Any], category: str) -> float:
+        """Small rating/distance prior added on top of the two-tower similarity."""
+        prior = 0.0
+        rating_raw = item.get("rating")
+        try:
+            rating_val = float(str(rating_raw).replace("/10", "").replace("/5", "")) if rating_raw is not None else None
+            if rating_val is not None:
+                scale = 10.0 if category in ["movies", "music"] else 5.0
+                prior += min(0.1, max(0.0, rating_val) / scale * 0.1)
+        except Exception:
+            pass
+        dist = item.get("distance_from_user")
+        if isinstance(dist, (int, float)) and dist >= 0:
+            if dist < 5:
+                prior += 0.08
+            elif dist < 20:
+                prior += 0.04
+        return prior
+
+    # Expose the torch model classes on the service for callers that reference them there
+    HashingTextEncoder = HashingTextEncoder
+    UserTower = UserTower
+    ItemTower = ItemTower
+    TwoTowerModel = TwoTowerModel
 
     def _init_two_tower_if_needed(self) -> None:
         if not self._torch_available():
@@ -636,6 +829,30 @@ class LLMService:
             except Exception as e:
                 logger.warning("Failed to initialize Two-Tower model", error=str(e))
                 self._two_tower_model = None
+                return
+            self._load_two_tower_weights()
+
+    def _load_two_tower_weights(self) -> None:
+        """Load trained weights from ``two_tower_weights_path`` when configured."""
+        path = getattr(settings, "two_tower_weights_path", None)
+        if not isinstance(path, str) or not path:
+            return
+        try:
+            state = torch.load(path, map_location=self._two_tower_device, weights_only=True)
+            self._two_tower_model.load_state_dict(state)
+            self._two_tower_model.eval()
+            self._two_tower_trained = True
+            logger.info("Loaded Two-Tower weights", path=path)
+        except Exception as e:
+            logger.warning("Failed to load Two-Tower weights, using deterministic ranking", path=path, error=str(e))
+
+    def _two_tower_ready(self) -> bool:
+        """Whether ranking should use the two-tower model (trained weights only)."""
+        if not self._torch_available():
+            return False
+        if not self._two_tower_trained and isinstance(getattr(settings, "two_tower_weights_path", None), str):
+            self._init_two_tower_if_needed()
+        return self._two_tower_model is not None and self._two_tower_trained
 
     def train_two_tower_mock(
         self,
@@ -716,6 +933,111 @@ class LLMService:
                     except Exception:
                         continue
         model.eval()
+        self._two_tower_trained = True
+        # Weights changed; cached user-tower outputs are stale
+        self._two_tower_version += 1
+
+    def _two_tower_user_tokens(
+        self,
+        user_profile: Optional[Dict[str, Any]],
+        location_data: Optional[Dict[str, Any]],
+        history: Optional[Dict[str, List[Dict[str, str]]]]
+    ) -> List[int]:
+        """Hashed token ids for the user tower (interests, prefs, city, history titles/genres)."""
+        user_tokens: List[int] = []
+        try:
+            if isinstance(user_profile, dict):
+                interests = user_profile.get("interests", [])
+                if isinstance(interests, list):
+                    user_tokens.extend(self._hash_tokens(" ".join(map(str, interests)), 50000))
+                prefs = user_profile.get("preferences", {})
+                if isinstance(prefs, dict):
+                    user_tokens.extend(self._hash_tokens(" ".join(map(str, prefs.keys())), 50000))
+            if isinstance(location_data, dict):
+                city = ""
+                cur = location_data.get("current_location")
+                if isinstance(cur, dict):
+                    city = cur.get("city") or cur.get("name") or ""
+                elif isinstance(cur, str):
+                    city = cur
+                if city:
+                    user_tokens.extend(self._hash_tokens(city, 50000))
+            for cat, items in (history or {}).items():
+                for inter in items[:50]:
+                    title = inter.get("title") or inter.get("name") or ""
+                    genre = inter.get("genre") or inter.get("type") or inter.get("category") or ""
+                    user_tokens.extend(self._hash_tokens(title + " " + genre, 50000))
+        except Exception:
+            pass
+        return user_tokens
+
+    def _two_tower_item_tokens(self, item: Dict[str, Any], category: str) -> List[int]:
+        """Hashed token ids for the item tower (title, description, genre, keywords, category)."""
+        item_tokens: List[int] = []
+        try:
+            title = item.get("title") or item.get("name") or ""
+            desc = item.get("description", "")
+            genre_key = {"movies": "genre", "music": "genre", "places": "type", "events": "category"}.get(category, "genre")
+            genre = item.get(genre_key, "")
+            kw = item.get("keywords")
+            kw_text = " ".join(map(str, kw)) if isinstance(kw, list) else ""
+            cat_text = str(category or "")
+            item_tokens.extend(self._hash_tokens(" ".join([title, desc, genre, kw_text, cat_text]), 50000))
+        except Exception:
+            pass
+        return item_tokens
+
+    def _two_tower_similarities(
+        self,
+        items: List[Dict[str, Any]],
+        category: str,
+        history: Dict[str, List[Dict[str, str]]],
+        user_profile: Dict[str, Any] = None,
+        location_data: Dict[str, Any] = None,
+        interaction_data: Dict[str, Any] = None,
+        user_id: Optional[str] = None
+    ) -> np.ndarray:
+        """Score all items against the user with one batched two-tower forward pass.
+
+        Item tokens are flattened into a single tensor with EmbeddingBag offsets so the
+        item tower runs once for the whole category; the user tower also runs once and
+        its output is cached in-process per user (the weights are process-local).
+        """
+        device = self._two_tower_device
+        fp = None
+        ue_t = None
+        if user_id:
+            fp = self._user_embedding_fingerprint(user_profile, location_data, history, interaction_data)
+            fp = f"{fp}:{self._two_tower_version}"
+            cached = self._embedding_cache.get(user_id, fp, kind="two_tower")
+            if cached is not None:
+                ue_t = torch.from_numpy(cached).to(device)
+
+        flat_tokens: List[int] = []
+        offsets: List[int] = []
+        item_numeric: List[List[float]] = []
+        for item in items:
+            offsets.append(len(flat_tokens))
+            flat_tokens.extend(self._two_tower_item_tokens(item or {}, category) or [0])
+            item_numeric.append(self._extract_item_numeric_features(item or {}, category))
+
+        i_tokens_t = torch.tensor(flat_tokens, dtype=torch.long, device=device)
+        i_offsets_t = torch.tensor(offsets, dtype=torch.long, device=device)
+        i_num_t = torch.tensor(item_numeric, dtype=torch.float32, device=device)
+
+        with torch.no_grad():
+            if ue_t is None:
+                user_tokens = self._two_tower_user_tokens(user_profile, location_data, history)
+                u_numeric_list = self._extract_user_numeric_features(
+                    user_profile or {}, location_data or {}, interaction_data or {}, history or {}
+                )
+                u_tokens_t = torch.tensor(user_tokens if user_tokens else [0], dtype=torch.long, device=device)
+                u_num_t = torch.tensor(u_numeric_list, dtype=torch.float32, device=device)
+                ue_t = self._two_tower_model.user(u_tokens_t, u_num_t)
+                if fp is not None:
+                    self._embedding_cache.set(user_id, fp, ue_t.detach().cpu().numpy(), kind="two_tower", shared=False)
+            sims = self._two_tower_model.score_items_for_user(ue_t, i_tokens_t, i_offsets_t, i_num_t)
+        return sims.detach().cpu().numpy().astype(np.float64)
 
     def _compute_ranking_score(
         self,
@@ -726,96 +1048,45 @@ class LLMService:
         location_data: Dict[str, Any] = None,
         interaction_data: Dict[str, Any] = None
     ) -> float:
-        """Compute a ranking score using a PyTorch Two-Tower model if available.
+        """Compute a ranking score using a PyTorch Two-Tower model if trained weights are available.
 
-        Falls back to the deterministic two-tower hashing encoder if PyTorch or model is unavailable.
+        Otherwise uses the deterministic two-tower hashing encoder.
         Keeps output compatible with existing downstream normalization (~[0.1, 1.5]).
         """
         try:
-            # Prefer PyTorch model if available
-            if self._torch_available():
-                self._init_two_tower_if_needed()
-                if self._two_tower_model is not None:
-                    device = self._two_tower_device
-
-                    # Build user tokens (from profile interests, prefs, location, and history titles/genres)
-                    user_tokens: List[int] = []
-                    try:
-                        if isinstance(user_profile, dict):
-                            interests = user_profile.get("interests", [])
-                            if isinstance(interests, list):
-                                user_tokens.extend(self._hash_tokens(" ".join(map(str, interests)), 50000))
-                            prefs = user_profile.get("preferences", {})
-                            if isinstance(prefs, dict):
-                                user_tokens.extend(self._hash_tokens(" ".join(map(str, prefs.keys())), 50000))
-                        if isinstance(location_data, dict):
-                            city = ""
-                            cur = location_data.get("current_location")
-                            if isinstance(cur, dict):
-                                city = cur.get("city") or cur.get("name") or ""
-                            elif isinstance(cur, str):
-                                city = cur
-                            if city:
-                                user_tokens.extend(self._hash_tokens(city, 50000))
-                        for cat, items in (history or {}).items():
-                            for inter in items[:50]:
-                                title = inter.get("title") or inter.get("name") or ""
-                                genre = inter.get("genre") or inter.get("type") or inter.get("category") or ""
-                                user_tokens.extend(self._hash_tokens(title + " " + genre, 50000))
-                    except Exception:
-                        pass
+            # Prefer the PyTorch model once it has trained weights
+            if self._two_tower_ready():
+                device = self._two_tower_device
 
-                    # Build user numeric features
-                    u_numeric_list = self._extract_user_numeric_features(
-                        user_profile or {}, location_data or {}, interaction_data or {}, history or {}
-                    )
+                # Build user tokens (from profile interests, prefs, location, and history titles/genres)
+                user_tokens = self._two_tower_user_tokens(user_profile, location_data, history)
 
-                    # Build item tokens and numeric features
-                    item_tokens: List[int] = []
-                    try:
-                        title = item.get("title") or item.get("name") or ""
-                        desc = item.get("description", "")
-                        genre_key = {"movies": "genre", "music": "genre", "places": "type", "events": "category"}.get(category, "genre")
-                        genre = item.get(genre_key, "")
-                        kw = item.get("keywords")
-                        kw_text = " ".join(map(str, kw)) if isinstance(kw, list) else ""
-                        cat_text = str(category or "")
-                        item_tokens.extend(self._hash_tokens(" ".join([title, desc, genre, kw_text, cat_text]), 50000))
-                    except Exception:
-                        pass
-                    i_numeric_list = self._extract_item_numeric_features(item or {}, category)
-
-                    # Convert to tensors
-                    u_tokens_t = torch.tensor(user_tokens if user_tokens else [0], dtype=torch.long, device=device)
-                    i_tokens_t = torch.tensor(item_tokens if item_tokens else [0], dtype=torch.long, device=device)
-                    u_num_t = torch.tensor(u_numeric_list, dtype=torch.float32, device=device)
-                    i_num_t = torch.tensor(i_numeric_list, dtype=torch.float32, device=device)
-
-                    with torch.no_grad():
-                        sim = self._two_tower_model(u_tokens_t, u_num_t, i_tokens_t, i_num_t).item()  # [-1, 1]
-                    sim01 = (sim + 1.0) / 2.0  # [0, 1]
-
-                    # Optional small priors as before
-                    prior = 0.0
-                    rating_raw = item.get("rating")
-                    try:
-                        rating_val = float(str(rating_raw).replace("/10", "").replace("/5", "")) if rating_raw is not None else None
-                        if rating_val is not None:
-                            scale = 10.0 if category in ["movies", "music"] else 5.0
-                            prior += min(0.1, max(0.0, rating_val) / scale * 0.1)
-                    except Exception:
-                        pass
-                    dist = item.get("distance_from_user")
-                    if isinstance(dist, (int, float)) and dist >= 0:
-                        if dist < 5:
-                            prior += 0.08
-                        elif dist < 20:
-                            prior += 0.04
-
-                    # Preference alignment booster
-                    pref_boost = self._preference_alignment_boost(item or {}, category, user_profile or {})
-                    score = 0.1 + 1.4 * sim01 + prior + pref_boost
-                    return max(0.0, min(1.5, score))
+                # Build user numeric features
+                u_numeric_list = self._extract_user_numeric_features(
+                    user_profile or {}, location_data or {}, interaction_data or {}, history or {}
+                )
+
+                # Build item tokens and numeric features
+                item_tokens = self._two_tower_item_tokens(item, category)
+                i_numeric_list = self._extract_item_numeric_features(item or {}, category)
+
+                # Convert to tensors
+                u_tokens_t = torch.tensor(user_tokens if user_tokens else [0], dtype=torch.long, device=device)
+                i_tokens_t = torch.tensor(item_tokens if item_tokens else [0], dtype=torch.long, device=device)
+                u_num_t = torch.tensor(u_numeric_list, dtype=torch.float32, device=device)
+                i_num_t = torch.tensor(i_numeric_list, dtype=torch.float32, device=device)
+
+                with torch.no_grad():
+                    sim = self._two_tower_model(u_tokens_t, u_num_t, i_tokens_t, i_num_t).item()  # [-1, 1]
+                sim01 = (sim + 1.0) / 2.0  # [0, 1]
+
+                # Optional small priors as before
+                prior = self._ranking_prior(item, category)
+
+                # Preference alignment booster
+                pref_boost = self._preference_alignment_boost(item or {}, category, user_profile or {})
+                score = 0.1 + 1.4 * sim01 + prior + pref_boost
+                return max(0.0, min(1.5, score))
 
             # Fallback to deterministic two-tower hashing encoder-based similarity
             user_embed = self._build_user_embedding(
@@ -827,37 +1098,96 @@ class LLMService:
             item_embed = self._build_item_embedding(item or {}, category)
             sim = self._cosine_similarity(user_embed, item_embed)
             sim01 = (sim + 1.0) / 2.0
-            prior = 0.0
-            rating_raw = item.get("rating")
-            try:
-                rating_val = float(str(rating_raw).replace("/10", "").replace("/5", "")) if rating_raw is not None else None
-                if rating_val is not None:
-                    scale = 10.0 if category in ["movies", "music"] else 5.0
-                    prior += min(0.1, max(0.0, rating_val) / scale * 0.1)
-            except Exception:
-                pass
-            dist = item.get("distance_from_user")
-            if isinstance(dist, (int, float)) and dist >= 0:
-                if dist < 5:
-                    prior += 0.08
-                elif dist < 20:
-                    prior += 0.04
+            prior = self._ranking_prior(item, category)
             pref_boost = self._preference_alignment_boost(item or {}, category, user_profile or {})
             score = 0.1 + 1.4 * sim01 + prior + pref_boost
             return max(0.0, min(1.5, score))
         except Exception:
             return 0.5
 
-    async def generate_recommendations(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", location_context: Optional[Dict[str, Any]] = None, date_range: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def _compute_ranking_scores(
+        self,
+        items: List[Dict[str, Any]],
+        category: str,
+        history: Dict[str, List[Dict[str, str]]],
+        user_profile: Dict[str, Any] = None,
+        location_data: Dict[str, Any] = None,
+        interaction_data: Dict[str, Any] = None,
+        user_vector: Optional[np.ndarray] = None,
+        user_id: Optional[str] = None
+    ) -> List[float]:
+        """Batch variant of _compute_ranking_score for all items of one category.
+
+        The user vector is built once (or passed in by the caller), item vectors are
+        stacked into a matrix, and cosine similarity, priors and preference boosts are
+        combined as arrays. Scores match the per-item path exactly.
         """
-        Generate recommendations based on prompt and store in Redis
+        if not items:
+            return []
+        try:
+            sims = None
+            if self._two_tower_ready():
+                sims = self._two_tower_similarities(
+                    items, category, history, user_profile, location_data, interaction_data,
+                    user_id=user_id
+                )
+
+            if sims is None:
+                if user_vector is None:
+                    user_vector = self._user_embedding_array(
+                        user_profile or {},
+                        location_data or {},
+                        history or {},
+                        interaction_data or {}
+                    )
+                item_matrix = np.vstack([self._item_embedding_array(item or {}, category) for item in items])
+
+                user_norm = float(np.linalg.norm(user_vector))
+                item_norms = np.linalg.norm(item_matrix, axis=1)
+                denom = item_norms * user_norm
+                dots = item_matrix @ user_vector
+                sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom != 0.0)
+
+            terms = self._preference_terms(user_profile or {})
+            priors = np.array([self._ranking_prior(item, category) for item in items])
+            boosts = np.array([
+                self._preference_alignment_boost(item or {}, category, user_profile or {}, terms=terms)
+                for item in items
+            ])
+            scores = 0.1 + 1.4 * ((sims + 1.0) / 2.0) + priors + boosts
+            return np.clip(scores, 0.0, 1.5).tolist()
+        except Exception as e:
+            logger.warning("Batch ranking failed, scoring items individually",
+                           category=category,
+                           item_count=len(items),
+                           error=str(e))
+            return [
+                self._compute_ranking_score(item, category, history, user_profile, location_data, interaction_data)
+                for item in items
+            ]
+
+    async def generate_recommendations(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", location_context: Optional[Dict[str, Any]] = None, date_range: Optional[Dict[str, Any]] = None, user_context: Optional[Dict[str, Any]] = None, store: bool = True) -> Dict[str, Any]:
         """
+        Generate recommendations based on prompt and store in Redis.
+        ``user_context`` may carry profile/location/interaction data the caller already fetched.
+        ``store=False`` leaves the write to the caller (batch refreshes store many users at once).
+        Concurrent calls with the same user, prompt, city and location/date context share one generation.
+        """
+        key = SingleFlight.make_key(user_id, prompt, current_city, location_context, date_range)
+        return await self._single_flight.run(
+            key,
+            lambda: self._generate_recommendations_uncoalesced(prompt, user_id, current_city, location_context, date_range, user_context, store=store),
+            redis_client=getattr(self, "redis_client", None),
+            share=lambda response: bool(response.get("success"))
+        )
+
+    async def _generate_recommendations_uncoalesced(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", location_context: Optional[Dict[str, Any]] = None, date_range: Optional[Dict[str, Any]] = None, user_context: Optional[Dict[str, Any]] = None, store: bool = True) -> Dict[str, Any]:
         try:
             logger.info(f"Generating recommendations for prompt: {prompt[:100]}...")
             
             start_time = time.time()
             
-            recommendations = await self._call_llm_api(prompt, user_id, current_city)
+            recommendations = await self._call_llm_api(prompt, user_id, current_city, user_context=user_context)
             # Apply location/date post-processing if provided
             if location_context or date_range:
                 recommendations = self._apply_location_date_filters(recommendations, location_context, date_range)
@@ -879,9 +1209,12 @@ class LLMService:
                     "ranking_enabled": user_id is not None
                 }
             }
+            if user_context is not None:
+                # Lets a later scheduled refresh tell whether these inputs have changed
+                response["input_fingerprint"] = self.input_fingerprint(user_context)
             
-            if user_id:
-                self._store_in_redis(user_id, response)
+            if user_id and store:
+                await asyncio.to_thread(self._store_in_redis, user_id, response)
             
             logger.info(f"Generated {response['metadata']['total_recommendations']} recommendations for user {user_id}")
             return response
@@ -895,11 +1228,13 @@ class LLMService:
                 "user_id": user_id
             }
     
-    async def _call_llm_api(self, prompt: str, user_id: str = None, current_city: str = "Barcelona") -> Dict[str, List[Dict]]:
+    async def _call_llm_api(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", user_context: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict]]:
         """
         Call the actual LLM API to generate recommendations
         """
         start_time = time.time()
+        # Assemble ranking context concurrently with the LLM round-trip
+        context_task = asyncio.ensure_future(self._assemble_user_context(user_id, user_context)) if user_id else None
         
         # Log API call initiation
         log_api_call(
@@ -912,16 +1247,31 @@ class LLMService:
         )
         
         try:
+            cache_key = self._llm_cache_key(prompt, current_city, user_context)
+            cached = await asyncio.to_thread(self._llm_response_cache.get, cache_key)
+            if cached is not None:
+                logger.info("LLM response cache hit",
+                           user_id=user_id,
+                           response_time_ms=(time.time() - start_time) * 1000)
+                completed = await self._fill_missing_categories(prompt, cached, current_city)
+                return await asyncio.to_thread(self._process_llm_recommendations, completed, user_id, current_city, user_context=await self._await_user_context(context_task))
+
+            if self._llm_streaming_enabled():
+                return await self._stream_llm_api(prompt, user_id, current_city, context_task, cache_key, start_time)
+
             payload = {
                 "text": prompt,
                 "provider": settings.recommendation_api_provider
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            url = f"{settings.recommendation_api_url}/process-text"
+            client = await http_client_registry.get_client(url, timeout=self.timeout)
+            async with http_client_registry.track(url):
                 response = await client.post(
-                    f"{settings.recommendation_api_url}/process-text",
+                    url,
                     json=payload,
-                    headers={"Content-Type": "application/json"}
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout
                 )
                 response.raise_for_status()
                 
@@ -947,9 +1297,10 @@ class LLMService:
                                    response_time=response_time,
                                    user_id=user_id)
                     coerced = self._coerce_recommendations_dict(raw_result)
+                    await asyncio.to_thread(self._llm_response_cache.set, cache_key, coerced)
                     # Ensure complete shape by filling missing categories if provider truncated
                     completed = await self._fill_missing_categories(prompt, coerced, current_city)
-                    return self._process_llm_recommendations(completed, user_id, current_city)
+                    return await asyncio.to_thread(self._process_llm_recommendations, completed, user_id, current_city, user_context=await self._await_user_context(context_task))
                 
                 if isinstance(raw_result, str):
                     parsed = self._robust_parse_json(raw_result)
@@ -959,8 +1310,9 @@ class LLMService:
                                        response_time=response_time,
                                        user_id=user_id)
                         coerced = self._coerce_recommendations_dict(parsed)
+                        await asyncio.to_thread(self._llm_response_cache.set, cache_key, coerced)
                         completed = await self._fill_missing_categories(prompt, coerced, current_city)
-                        return self._process_llm_recommendations(completed, user_id, current_city)
+                        return await asyncio.to_thread(self._process_llm_recommendations, completed, user_id, current_city, user_context=await self._await_user_context(context_task))
                     
                     logger.info("LLM response is not valid JSON, attempting text parsing",
                                user_id=user_id,
@@ -972,7 +1324,7 @@ class LLMService:
                                    response_time=response_time,
                                    user_id=user_id,
                                    parsing_method="text")
-                    return self._process_llm_recommendations(recommendations, user_id, current_city)
+                    return await asyncio.to_thread(self._process_llm_recommendations, recommendations, user_id, current_city, user_context=await self._await_user_context(context_task))
                 
                 logger.error("Unexpected type for LLM result",
                            user_id=user_id,
@@ -1021,6 +1373,182 @@ class LLMService:
                            user_id=user_id,
                            error="unexpected_error")
             return self._get_fallback_recommendations()
+        finally:
+            if context_task is not None and not context_task.done():
+                context_task.cancel()
+
+    def _llm_streaming_enabled(self) -> bool:
+        return getattr(settings, "llm_streaming_enabled", False) is True
+
+    def _llm_stream_timeout(self) -> float:
+        try:
+            return float(getattr(settings, "llm_stream_timeout_seconds", self.timeout))
+        except (TypeError, ValueError):
+            return float(self.timeout)
+
+    @staticmethod
+    async def _sse_text(response: Any) -> AsyncIterator[str]:
+        """Yield the text carried by the ``data:`` lines of a server-sent event stream."""
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:]
+            if data.startswith(" "):
+                data = data[1:]
+            if data.strip() == "[DONE]":
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                yield data
+                continue
+            if isinstance(event, dict):
+                delta = next((event[k] for k in ("delta", "content", "text") if isinstance(event.get(k), str)), None)
+                yield delta if delta is not None else data
+            elif isinstance(event, str):
+                yield event
+            else:
+                yield data
+
+    async def _stream_llm_api(
+        self,
+        prompt: str,
+        user_id: Optional[str],
+        current_city: str,
+        context_task: Optional["asyncio.Future"],
+        cache_key: str,
+        start_time: float
+    ) -> Dict[str, List[Dict]]:
+        """Stream the provider response and rank each category as soon as its array is complete.
+
+        If the stream exceeds ``llm_stream_timeout_seconds`` after at least one category
+        arrived, the categories ranked so far are returned instead of the fallback.
+        """
+        url = f"{settings.recommendation_api_url}/process-text"
+        payload = {
+            "text": prompt,
+            "provider": settings.recommendation_api_provider,
+            "stream": True
+        }
+        parser = CategoryStreamParser()
+        raw: Dict[str, List] = {}
+        ranked: Dict[str, List[Dict]] = {}
+        state: Dict[str, Any] = {"ranking_context": None, "status_code": None}
+
+        async def consume() -> None:
+            client = await http_client_registry.get_client(url, timeout=self.timeout)
+            async with http_client_registry.track(url):
+                async with client.stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    headers={"Content-Type": "application/json", "Accept": "text/event-stream, application/json"},
+                    timeout=self.timeout
+                ) as response:
+                    response.raise_for_status()
+                    state["status_code"] = response.status_code
+                    is_sse = "text/event-stream" in response.headers.get("content-type", "")
+                    chunks = self._sse_text(response) if is_sse else response.aiter_text()
+                    async for chunk in chunks:
+                        for category, items in parser.feed(chunk):
+                            if state["ranking_context"] is None:
+                                user_context = await self._await_user_context(context_task)
+                                state["ranking_context"] = await asyncio.to_thread(self._prepare_ranking_context, user_id, user_context)
+                            raw[category] = list(items)
+                            ranked[category] = await asyncio.to_thread(self._rank_category, category, items, state["ranking_context"], user_id, current_city)
+                            logger.info("Ranked streamed category",
+                                       user_id=user_id,
+                                       category=category,
+                                       items=len(ranked[category]),
+                                       elapsed_ms=(time.time() - start_time) * 1000)
+
+        try:
+            await asyncio.wait_for(consume(), timeout=self._llm_stream_timeout())
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            if not ranked:
+                raise httpx.ReadTimeout(f"LLM stream timed out before any category completed: {e}") from e
+            logger.warning("LLM stream timed out, returning partial recommendations",
+                          user_id=user_id,
+                          categories=sorted(ranked),
+                          response_time_ms=(time.time() - start_time) * 1000)
+            log_api_response("llm_api", "/process-text", True,
+                           status_code=state["status_code"],
+                           response_time=time.time() - start_time,
+                           user_id=user_id,
+                           streamed=True,
+                           partial=True)
+            return await self._complete_streamed_categories(prompt, ranked, state["ranking_context"], user_id, current_city)
+
+        log_api_response("llm_api", "/process-text", True,
+                       status_code=state["status_code"],
+                       response_time=time.time() - start_time,
+                       user_id=user_id,
+                       streamed=True)
+
+        if not ranked:
+            # Body did not expose category arrays incrementally (e.g. result sent as a JSON string)
+            parsed = self._robust_parse_json(parser.text)
+            if isinstance(parsed, dict) and "result" in parsed:
+                result = parsed["result"]
+                parsed = result if isinstance(result, dict) else self._robust_parse_json(result) if isinstance(result, str) else None
+            if isinstance(parsed, dict):
+                coerced = self._coerce_recommendations_dict(parsed)
+                await asyncio.to_thread(self._llm_response_cache.set, cache_key, coerced)
+            else:
+                coerced = self._parse_text_response(parser.text)
+            completed = await self._fill_missing_categories(prompt, coerced, current_city)
+            return await asyncio.to_thread(self._process_llm_recommendations, completed, user_id, current_city, user_context=await self._await_user_context(context_task))
+
+        missing = [c for c in ("movies", "music", "places", "events") if c not in ranked]
+        if missing:
+            logger.info("LLM stream completed without some categories", user_id=user_id, missing=missing)
+        else:
+            # Only complete responses are cached
+            await asyncio.to_thread(self._llm_response_cache.set, cache_key, {category: raw[category] for category in ("movies", "music", "places", "events")})
+        return await self._complete_streamed_categories(prompt, ranked, state["ranking_context"], user_id, current_city)
+
+    async def _complete_streamed_categories(
+        self,
+        prompt: str,
+        ranked: Dict[str, List[Dict]],
+        ranking_context: Optional[Dict[str, Any]],
+        user_id: Optional[str],
+        current_city: str
+    ) -> Dict[str, List[Dict]]:
+        """Fill categories the stream did not deliver, as the buffered path does, and rank any filled items."""
+        filled = await self._fill_missing_categories(prompt, dict(ranked), current_city)
+        for category, items in filled.items():
+            if category not in ranked and items:
+                context = ranking_context or await asyncio.to_thread(self._prepare_ranking_context, user_id)
+                filled[category] = await asyncio.to_thread(self._rank_category, category, items, context, user_id, current_city)
+        return {category: filled.get(category, []) for category in ("movies", "music", "places", "events")}
+
+    def _llm_cache_key(self, prompt: str, current_city: str, user_context: Optional[Dict[str, Any]] = None) -> str:
+        """Response-cache key built from the generation inputs.
+
+        Provider output includes personalised text (``why_would_you_like_this``), so
+        the key covers the prompt, which renders every user detail, and the
+        structured profile, location and interaction data it was built from, plus
+        the provider and a UTC date bucket. The prompt's generation time of day is
+        dropped; the date bucket already covers it.
+        """
+        context = {key: self._context_to_dict((user_context or {}).get(key)) for key in self.CONTEXT_KEYS}
+        return LLMResponseCache.key({
+            "prompt": PromptBuilder.strip_timestamps(prompt),
+            "city": (current_city or "").strip().lower(),
+            "inputs": self.input_fingerprint(context)["inputs"],
+            "provider": str(settings.recommendation_api_provider),
+            "date": time.strftime("%Y-%m-%d", time.gmtime()),
+        })
+
+    async def _await_user_context(self, context_task: Optional["asyncio.Future"]) -> Optional[Dict[str, Any]]:
+        if context_task is None:
+            return None
+        try:
+            return await context_task
+        except Exception as e:
+            logger.warning("User context assembly failed", error=str(e))
+            return {key: None for key in self.CONTEXT_KEYS}
     
     def _parse_text_response(self, response_text: str) -> Dict[str, List[Dict]]:
         """Parse text response from LLM and convert to structured format"""
@@ -1142,7 +1670,97 @@ class LLMService:
         except Exception:
             return None
     
-    def _process_llm_recommendations(self, recommendations: Dict[str, Any], user_id: str = None, current_city: str = "Barcelona") -> Dict[str, List[Dict]]:
+    CONTEXT_KEYS = ("user_profile", "location_data", "interaction_data")
+
+    def _get_context_services(self) -> Dict[str, Any]:
+        """Profile/location/interaction clients, built once per service instance."""
+        if self._context_services is None:
+            from app.services.user_profile import UserProfileService
+            from app.services.lie_service import LIEService
+            from app.services.cis_service import CISService
+            self._context_services = {
+                "user_profile": (UserProfileService(timeout=10), "get_user_profile"),
+                "location_data": (LIEService(timeout=10), "get_location_data"),
+                "interaction_data": (CISService(timeout=10), "get_interaction_data"),
+            }
+        return self._context_services
+
+    def _context_fetch_timeout(self) -> float:
+        timeout = getattr(settings, "context_fetch_timeout_seconds", 5.0)
+        return float(timeout) if isinstance(timeout, (int, float)) and timeout > 0 else 5.0
+
+    @staticmethod
+    def _context_to_dict(value: Any) -> Optional[Dict[str, Any]]:
+        if value is None or isinstance(value, dict):
+            return value
+        if hasattr(value, "safe_dump"):
+            return value.safe_dump()
+        if hasattr(value, "model_dump"):
+            return value.model_dump()
+        return None
+
+    async def _assemble_user_context(
+        self,
+        user_id: str,
+        user_context: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Collect profile, location and interaction data for ranking.
+
+        Sources already present in ``user_context`` (fetched by the router or a Celery
+        task) are reused; the rest are fetched concurrently on the caller's loop, each
+        with its own timeout. A failed or slow source yields None instead of failing
+        the whole context.
+        """
+        provided = user_context or {}
+        context: Dict[str, Optional[Dict[str, Any]]] = {
+            key: self._context_to_dict(provided.get(key)) for key in self.CONTEXT_KEYS
+        }
+        missing = [key for key in self.CONTEXT_KEYS if context[key] is None and key not in provided]
+        if not user_id or not missing:
+            return context
+
+        try:
+            services = self._get_context_services()
+        except Exception as e:
+            logger.warning("Context services unavailable", user_id=user_id, error=str(e))
+            return context
+
+        timeout = self._context_fetch_timeout()
+
+        async def fetch(key: str) -> Any:
+            service, method = services[key]
+            return await asyncio.wait_for(getattr(service, method)(user_id), timeout=timeout)
+
+        results = await asyncio.gather(*(fetch(key) for key in missing), return_exceptions=True)
+        for key, result in zip(missing, results):
+            if isinstance(result, BaseException):
+                logger.warning("Context source failed, continuing without it",
+                               user_id=user_id,
+                               source=key,
+                               timed_out=isinstance(result, asyncio.TimeoutError),
+                               error=str(result))
+                continue
+            try:
+                context[key] = self._context_to_dict(result)
+            except Exception as e:
+                logger.warning("Context source returned unusable data", user_id=user_id, source=key, error=str(e))
+        return context
+
+    def _resolve_user_context_blocking(self, user_id: str) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Context for synchronous callers of _process_llm_recommendations.
+
+        Async callers assemble context on their own loop and pass it in; here we can
+        only run the fetches when no loop is running in this thread.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return loop_runner.run(self._assemble_user_context(user_id))
+        logger.warning("Skipping context fetch inside a running event loop; pass user_context instead",
+                       user_id=user_id)
+        return {key: None for key in self.CONTEXT_KEYS}
+
+    def _process_llm_recommendations(self, recommendations: Dict[str, Any], user_id: str = None, current_city: str = "Barcelona", user_context: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict]]:
         """
         Process and enhance recommendations from the LLM API with normalized scores
         """
@@ -1155,108 +1773,110 @@ class LLMService:
                 "events": recommendations.get("events", [])
             }
             
-            history = self._get_user_interaction_history(user_id) if user_id else {}
-            
-            user_profile = None
-            location_data = None
-            interaction_data = None
-            
-            if user_id:
-                try:
-                    from app.services.user_profile import UserProfileService
-                    from app.services.lie_service import LIEService
-                    from app.services.cis_service import CISService
-                    import asyncio
-                    
-                    user_service = UserProfileService(timeout=10)
-                    lie_service = LIEService(timeout=10)
-                    cis_service = CISService(timeout=10)
-                    
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    
-                    try:
-                        user_profile = loop.run_until_complete(user_service.get_user_profile(user_id))
-                        location_data = loop.run_until_complete(lie_service.get_location_data(user_id))
-                        interaction_data = loop.run_until_complete(cis_service.get_interaction_data(user_id))
-                        
-                        if user_profile:
-                            user_profile = user_profile.safe_dump() if hasattr(user_profile, 'safe_dump') else user_profile.model_dump()
-                        if location_data:
-                            location_data = location_data.safe_dump() if hasattr(location_data, 'safe_dump') else location_data.model_dump()
-                        if interaction_data:
-                            interaction_data = interaction_data.safe_dump() if hasattr(interaction_data, 'safe_dump') else interaction_data.model_dump()
-                            
-                    finally:
-                        loop.close()
-                        
-                except Exception as e:
-                    logger.warning(f"Could not fetch user data for enhanced scoring: {str(e)}")
-            
+            ranking_context = self._prepare_ranking_context(user_id, user_context)
+
             for category, items in processed.items():
                 if not isinstance(items, list) or not items:
                     continue
-                    
-                # Normalize malformed/partial items and compute raw scores
-                normalized_items: List[Dict[str, Any]] = []
-                raw_scores = []
-                for item in items:
-                    if not isinstance(item, dict):
-                        continue
-                    norm = self._normalize_item(category, item, current_city)
-                    if not norm:
-                        continue
-                    raw = self._compute_ranking_score(
-                        norm, category, history, user_profile, location_data, interaction_data
-                    )
-                    norm['_raw_score'] = raw
-                    raw_scores.append(raw)
-                    normalized_items.append(norm)
-                items[:] = normalized_items
-                
-                # Normalize to 0.1-1.0 range per category
-                if raw_scores:
-                    min_s = min(raw_scores)
-                    max_s = max(raw_scores)
-                    if max_s == min_s:
-                        norm_score = 0.5
-                        for item in items:
-                            item["ranking_score"] = round(norm_score, 2)
-                    else:
-                        for item in items:
-                            norm = 0.1 + 0.9 * (item['_raw_score'] - min_s) / (max_s - min_s)
-                            item["ranking_score"] = round(norm, 2)
-                    # Clean up
-                    for item in items:
-                        del item['_raw_score']
-                
-                # Generate reasons if missing or too short
-                for item in items:
-                    reason = item.get("why_would_you_like_this")
-                    reason_sentences = self._count_sentences(reason) if reason else 0
-                    logger.info(f"Processing {category} item: {item.get('title', item.get('name', 'Unknown'))} - reason sentences: {reason_sentences}")
-                    
-                    if not reason or (isinstance(reason, str) and reason_sentences < 3):
-                        logger.info(f"Expanding short reason for {category} item: {item.get('title', item.get('name', 'Unknown'))}")
-                        item["why_would_you_like_this"] = self._generate_personalized_reason(
-                            item, category, "", user_id, current_city
-                        )
-                    # Ensure description is 3-5 sentences similar to why_would_you_like_this
-                    desc = item.get("description")
-                    if isinstance(desc, str):
-                        if self._count_sentences(desc) < 3:
-                            item["description"] = self._expand_description(desc, item, category, current_city)
-                    else:
-                        item["description"] = self._expand_description("", item, category, current_city)
-                
-                # Sort by ranking_score descending
-                items.sort(key=lambda x: x.get("ranking_score", 0), reverse=True)
+                self._rank_category(category, items, ranking_context, user_id, current_city)
             
             return processed
         except Exception as e:
             logger.error(f"Error processing LLM recommendations: {str(e)}")
             return self._get_fallback_recommendations()
 
+    def _prepare_ranking_context(self, user_id: Optional[str], user_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Per-request inputs shared by every category: history, profile/location/interaction data and the user vector."""
+        history = self._get_user_interaction_history(user_id) if user_id else {}
+        
+        user_profile = None
+        location_data = None
+        interaction_data = None
+        
+        if user_id:
+            try:
+                if user_context is None:
+                    user_context = self._resolve_user_context_blocking(user_id)
+                user_profile = self._context_to_dict(user_context.get("user_profile"))
+                location_data = self._context_to_dict(user_context.get("location_data"))
+                interaction_data = self._context_to_dict(user_context.get("interaction_data"))
+            except Exception as e:
+                logger.warning(f"Could not fetch user data for enhanced scoring: {str(e)}")
+        
+        # The user vector does not depend on the item, so build (or fetch) it once per request
+        user_vector = None
+        try:
+            user_vector = self._get_user_vector(user_id, user_profile, location_data, history, interaction_data)
+        except Exception as e:
+            logger.warning(f"Could not build user embedding for batch scoring: {str(e)}")
+
+        return {
+            "history": history,
+            "user_profile": user_profile,
+            "location_data": location_data,
+            "interaction_data": interaction_data,
+            "user_vector": user_vector,
+        }
+
+    def _rank_category(self, category: str, items: List[Any], ranking_context: Dict[str, Any], user_id: Optional[str], current_city: str) -> List[Dict[str, Any]]:
+        """Normalize, score, explain and sort one category's items in place."""
+        # Normalize malformed/partial items and compute raw scores in one batch
+        normalized_items: List[Dict[str, Any]] = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            norm = self._normalize_item(category, item, current_city)
+            if not norm:
+                continue
+            normalized_items.append(norm)
+        raw_scores = self._compute_ranking_scores(
+            normalized_items, category, ranking_context["history"], ranking_context["user_profile"],
+            ranking_context["location_data"], ranking_context["interaction_data"],
+            user_vector=ranking_context["user_vector"], user_id=user_id
+        )
+        for norm, raw in zip(normalized_items, raw_scores):
+            norm['_raw_score'] = raw
+        items[:] = normalized_items
+        
+        # Normalize to 0.1-1.0 range per category
+        if raw_scores:
+            min_s = min(raw_scores)
+            max_s = max(raw_scores)
+            if max_s == min_s:
+                norm_score = 0.5
+                for item in items:
+                    item["ranking_score"] = round(norm_score, 2)
+            else:
+                for item in items:
+                    norm = 0.1 + 0.9 * (item['_raw_score'] - min_s) / (max_s - min_s)
+                    item["ranking_score"] = round(norm, 2)
+            # Clean up
+            for item in items:
+                del item['_raw_score']
+        
+        # Generate reasons if missing or too short
+        for item in items:
+            reason = item.get("why_would_you_like_this")
+            reason_sentences = self._count_sentences(reason) if reason else 0
+            logger.info(f"Processing {category} item: {item.get('title', item.get('name', 'Unknown'))} - reason sentences: {reason_sentences}")
+            
+            if not reason or (isinstance(reason, str) and reason_sentences < 3):
+                logger.info(f"Expanding short reason for {category} item: {item.get('title', item.get('name', 'Unknown'))}")
+                item["why_would_you_like_this"] = self._generate_personalized_reason(
+                    item, category, "", user_id, current_city
+                )
+            # Ensure description is 3-5 sentences similar to why_would_you_like_this
+            desc = item.get("description")
+            if isinstance(desc, str):
+                if self._count_sentences(desc) < 3:
+                    item["description"] = self._expand_description(desc, item, category, current_city)
+            else:
+                item["description"] = self._expand_description("", item, category, current_city)
+        
+        # Sort by ranking_score descending
+        items.sort(key=lambda x: x.get("ranking_score", 0), reverse=True)
+        return items
+
     def _get_fallback_recommendations(self) -> Dict[str, List[Dict]]:
         """
         Get fallback recommendations when LLM API fails
@@ -1653,7 +2273,9 @@ class LLMService:
                 logger.warning("Skipping cache store: payload failed validation", user_id=user_id)
                 return
             key = f"recommendations:{user_id}"
-            data_size = len(json.dumps(data, default=str))
+            # Serialize once; the same string is measured and written
+            payload = json.dumps(data, default=str)
+            data_size = len(payload)
             
             logger.info("Storing recommendations in Redis",
                        user_id=user_id,
@@ -1661,42 +2283,28 @@ class LLMService:
                        data_size_bytes=data_size,
                        ttl_seconds=86400)
             
-            payload = json.dumps(data, default=str)
-            # Store directly for test compatibility
-            self.redis_client.setex(key, 86400, payload)
+            # SETEX and the ready notification share one pipelined round-trip on the publisher's pool
+            try:
+                notification_publisher.store_and_publish(key, 86400, payload, user_id)
+                publish_error = None
+            except NotificationPublishError as pub_err:
+                publish_error = pub_err
             
             logger.info("Recommendations stored successfully in Redis",
                        user_id=user_id,
                        key=key,
                        data_size_bytes=data_size)
             
-            # Publish notification
-            try:
-                notify_payload = {
-                    "type": "notification",
-                    "user_id": str(user_id),
-                    "message": {"content": "Your new recommendations are ready!"}
-                }
-                pub_client = redis.Redis(
-                    host=settings.redis_host,
-                    port=getattr(settings, "redis_port", 6379),
-                    password=getattr(settings, "redis_password", None),
-                    db=0,
-                    decode_responses=True,
-                    socket_connect_timeout=3,
-                    socket_timeout=5,
-                )
-                pub_client.publish("notifications:user", json.dumps(notify_payload))
-                
+            if publish_error is None:
                 logger.info("Notification published successfully",
                            user_id=user_id,
-                           channel="notifications:user",
+                           channel=notification_publisher.channel,
                            notification_type="recommendations_ready")
-            except Exception as pub_err:
+            else:
                 logger.error("Failed to publish notification",
                             user_id=user_id,
-                            error=str(pub_err),
-                            channel="notifications:user")
+                            error=str(publish_error),
+                            channel=notification_publisher.channel)
         except Exception as e:
             logger.error("Error storing recommendations in Redis",
                         user_id=user_id,
@@ -1704,6 +2312,51 @@ class LLMService:
                         error=str(e))
             log_exception("llm_service", e, {"user_id": user_id, "operation": "store_redis"})
     
+    def store_many_in_redis(self, responses: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Store several users' recommendations in one pipelined SETEX batch.
+
+        One grouped notification names every stored user. Returns the user ids
+        that were written.
+        """
+        try:
+            items = []
+            for user_id, data in responses.items():
+                if not self._validate_cached_payload(data):
+                    logger.warning("Skipping cache store: payload failed validation", user_id=user_id)
+                    continue
+                items.append((user_id, f"recommendations:{user_id}", json.dumps(data, default=str)))
+            if not items:
+                return []
+
+            logger.info("Storing batch of recommendations in Redis",
+                       user_count=len(items),
+                       data_size_bytes=sum(len(value) for _, _, value in items),
+                       ttl_seconds=86400)
+            try:
+                stored, _ = notification_publisher.store_many_and_publish(items, 86400)
+                logger.info("Batch notification published successfully",
+                           user_count=len(stored),
+                           channel=notification_publisher.channel,
+                           notification_type="recommendations_ready")
+            except NotificationPublishError as pub_err:
+                stored = pub_err.stored or []
+                logger.error("Failed to publish batch notification",
+                            user_count=len(stored),
+                            error=str(pub_err),
+                            channel=notification_publisher.channel)
+
+            if len(stored) < len(items):
+                stored_ids = set(stored)
+                logger.error("Some recommendations failed to store in Redis",
+                            failed_user_ids=[user_id for user_id, _, _ in items if user_id not in stored_ids])
+            return stored
+        except Exception as e:
+            logger.error("Error storing batch of recommendations in Redis",
+                        user_count=len(responses),
+                        error=str(e))
+            log_exception("llm_service", e, {"user_ids": list(responses), "operation": "store_many_redis"})
+            return []
+
     def get_recommendations_from_redis(self, user_id: str) -> Dict[str, Any]:
         """Retrieve recommendations from Redis with pipelining support"""
         try:
@@ -1778,6 +2431,88 @@ class LLMService:
                         error=str(e))
             log_exception("llm_service", e, {"user_ids": user_ids, "operation": "get_multiple_redis"})
             return {}
+
+    @staticmethod
+    def input_fingerprint(user_context: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Digests of the prompt inputs: one per data source plus ``inputs`` covering all three."""
+        context = user_context or {}
+        parts = {
+            source: UserEmbeddingCache.fingerprint(context.get(source))
+            for source in ("user_profile", "location_data", "interaction_data")
+        }
+        parts["inputs"] = UserEmbeddingCache.fingerprint(
+            parts["user_profile"], parts["location_data"], parts["interaction_data"]
+        )
+        return parts
+
+    def plan_incremental_refresh(self, user_contexts: Dict[str, Dict[str, Any]], max_age_seconds: float) -> Dict[str, Dict[str, Any]]:
+        """Decide per user how much of a refresh the stored recommendations need.
+
+        Compares each user's current inputs with the ``input_fingerprint`` of their
+        stored payload. Payloads older than ``max_age_seconds`` (or without a
+        fingerprint) are always regenerated. Returns
+        ``{user_id: {"action": "extend" | "rescore" | "regenerate", "cached": payload}}``:
+        ``extend`` when nothing changed, ``rescore`` when only interaction data changed.
+        """
+        cached = self.get_multiple_recommendations(list(user_contexts))
+        now = time.time()
+        plan = {}
+        for user_id, user_context in user_contexts.items():
+            payload = cached.get(user_id)
+            action = "regenerate"
+            stored = (payload or {}).get("input_fingerprint")
+            try:
+                age = now - float(payload.get("generated_at")) if payload else None
+            except (TypeError, ValueError):
+                age = None
+            if (isinstance(stored, dict) and payload.get("success") is not False
+                    and age is not None and age <= max_age_seconds):
+                current = self.input_fingerprint(user_context)
+                if stored.get("inputs") == current["inputs"]:
+                    action = "extend"
+                elif all(stored.get(source) == current[source] for source in ("user_profile", "location_data")):
+                    action = "rescore"
+            plan[user_id] = {"action": action, "cached": payload if action != "regenerate" else None}
+        return plan
+
+    def extend_recommendations_ttl(self, user_ids: List[str], ttl: int = 86400) -> List[str]:
+        """Reset the TTL of stored recommendations without rewriting them.
+
+        Returns the user ids whose recommendations still existed.
+        """
+        if not user_ids:
+            return []
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.expire(f"recommendations:{user_id}", ttl)
+            results = pipe.execute()
+        extended = [user_id for user_id, ok in zip(user_ids, results) if ok]
+        logger.info("Extended recommendation TTLs",
+                   user_count=len(extended),
+                   ttl_seconds=ttl)
+        return extended
+
+    def rescore_recommendations(self, cached: Dict[str, Any], user_id: str, user_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Re-rank stored recommendations against new interaction data without calling the LLM.
+
+        ``generated_at`` is kept, so the freshness budget still counts from the
+        last LLM generation.
+        """
+        recommendations = json.loads(json.dumps(cached.get("recommendations") or {}, default=str))
+        current_city = cached.get("current_city") or "Barcelona"
+        ranking_context = self._prepare_ranking_context(user_id, user_context)
+        for category, items in recommendations.items():
+            if isinstance(items, list) and items:
+                self._rank_category(category, items, ranking_context, user_id, current_city)
+        metadata = dict(cached.get("metadata") or {})
+        metadata["total_recommendations"] = sum(len(items) for items in recommendations.values() if isinstance(items, list))
+        return {
+            **cached,
+            "recommendations": recommendations,
+            "metadata": metadata,
+            "rescored_at": time.time(),
+            "input_fingerprint": self.input_fingerprint(user_context)
+        }
     
     def clear_recommendations(self, user_id: str = None):
         """Clear recommendations from Redis"""
@@ -1824,7 +2559,7 @@ class LLMService:
             
             start_time = time.time()
             
-            recommendations = await self._call_llm_api(prompt, user_id, current_city)
+            recommendations = await self._call_llm_api(prompt, user_id, current_city, user_context=user_context)
             
             processing_time = time.time() - start_time
             
@@ -1845,7 +2580,7 @@ class LLMService:
             }
             
             if user_id:
-                self._store_in_redis(user_id, response)
+                await asyncio.to_thread(self._store_in_redis, user_id, response)
             
             logger.info(f"Generated {response['metadata']['total_recommendations']} async recommendations for user {user_id}")
             return recommendations
@@ -1886,20 +2621,14 @@ class LLMService:
             logger.error(f"Error storing async recommendations: {str(e)}")
             return False
 
-    def generate_recommendations_sync(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", location_context: Optional[Dict[str, Any]] = None, date_range: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def generate_recommendations_sync(self, prompt: str, user_id: str = None, current_city: str = "Barcelona", location_context: Optional[Dict[str, Any]] = None, date_range: Optional[Dict[str, Any]] = None, user_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Synchronous wrapper for generate_recommendations
+        Synchronous wrapper for generate_recommendations (runs on the worker's long-lived loop)
         """
-        import asyncio
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(
-                    self.generate_recommendations(prompt, user_id, current_city, location_context, date_range)
-                )
-            finally:
-                loop.close()
+            return loop_runner.run(
+                self.generate_recommendations(prompt, user_id, current_city, location_context, date_range, user_context=user_context)
+            )
         except Exception as e:
             logger.error(f"Error in sync generate_recommendations: {str(e)}")
             return {
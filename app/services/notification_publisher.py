@@ -0,0 +1,160 @@
+"""
+Notification publisher.
+
+Tells the notification service that a user's recommendations are ready. The
+publisher owns one process-wide Redis connection pool on the recommendations
+database (re-created by redis-py after a Celery fork) and writes the
+recommendations through it, piggy-backing the PUBLISH on the same pipeline:
+Pub/Sub channels are not scoped to a Redis database, so the SETEX and the
+PUBLISH go out on one pooled connection in a single round-trip. Batch refreshes
+write every user's recommendations and one grouped notification the same way.
+
+Example:
+    >>> notification_publisher.store_and_publish(
+    ...     "recommendations:user123", 86400, payload, "user123")
+"""
+import json
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger("notification_publisher")
+
+NOTIFICATION_CHANNEL = "notifications:user"
+# Database the recommendations are stored in (see LLMService)
+RECOMMENDATIONS_DB = 1
+DEFAULT_NOTIFICATION_CONTENT = "Your new recommendations are ready!"
+
+
+class NotificationPublishError(Exception):
+    """The data was stored but the ready notification could not be published."""
+
+    def __init__(self, error: Exception, stored: Optional[List[str]] = None):
+        super().__init__(str(error))
+        self.error = error
+        # Users whose data was written (batch stores only)
+        self.stored = stored
+
+
+class NotificationPublisher:
+    """Stores recommendations and publishes ``recommendations ready`` over a pooled connection."""
+
+    def __init__(
+        self,
+        channel: str = NOTIFICATION_CHANNEL,
+        redis_client: Optional[redis.Redis] = None,
+        db: int = RECOMMENDATIONS_DB
+    ):
+        self.channel = channel
+        self.db = db
+        self._client = redis_client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> redis.Redis:
+        """Long-lived client on a shared pool, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    pool = redis.ConnectionPool(
+                        host=settings.redis_host,
+                        port=getattr(settings, "redis_port", 6379),
+                        password=getattr(settings, "redis_password", None),
+                        db=self.db,
+                        decode_responses=True,
+                        socket_connect_timeout=3,
+                        socket_timeout=5,
+                        health_check_interval=30,
+                        max_connections=getattr(settings, "notification_publisher_max_connections", 20)
+                    )
+                    self._client = redis.Redis(connection_pool=pool)
+        return self._client
+
+    @staticmethod
+    def encode(user_id: str, content: Any = DEFAULT_NOTIFICATION_CONTENT) -> str:
+        return json.dumps({
+            "type": "notification",
+            "user_id": str(user_id),
+            "message": {"content": content},
+        })
+
+    @staticmethod
+    def encode_batch(user_ids: Sequence[str], content: Any = DEFAULT_NOTIFICATION_CONTENT) -> str:
+        """One notification addressed to several users."""
+        return json.dumps({
+            "type": "notification_batch",
+            "user_ids": [str(user_id) for user_id in user_ids],
+            "message": {"content": content},
+        })
+
+    def publish(self, user_id: str, content: Any = DEFAULT_NOTIFICATION_CONTENT) -> int:
+        """Publish a notification on its own; returns the number of receivers."""
+        return self.client.publish(self.channel, self.encode(user_id, content))
+
+    def store_and_publish(
+        self,
+        key: str,
+        ttl_seconds: int,
+        value: str,
+        user_id: str,
+        content: Any = DEFAULT_NOTIFICATION_CONTENT
+    ) -> int:
+        """SETEX ``key`` and publish the notification in one pipelined round-trip.
+
+        Raises the write error if the SETEX failed, or ``NotificationPublishError``
+        if only the PUBLISH failed (the data is stored). Returns the receiver count.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(key, ttl_seconds, value)
+        pipe.publish(self.channel, self.encode(user_id, content))
+        stored, receivers = pipe.execute(raise_on_error=False)
+        if isinstance(stored, Exception):
+            raise stored
+        if isinstance(receivers, Exception):
+            raise NotificationPublishError(receivers)
+        return receivers
+
+    def store_many_and_publish(
+        self,
+        items: Sequence[Tuple[str, str, str]],
+        ttl_seconds: int,
+        content: Any = DEFAULT_NOTIFICATION_CONTENT
+    ) -> Tuple[List[str], int]:
+        """SETEX every ``(user_id, key, value)`` and publish one grouped notification.
+
+        Everything goes out in a single pipelined round-trip. Returns the user ids
+        whose write succeeded and the receiver count; raises ``NotificationPublishError``
+        (carrying the stored user ids) if only the PUBLISH failed.
+        """
+        if not items:
+            return [], 0
+        pipe = self.client.pipeline(transaction=False)
+        for _, key, value in items:
+            pipe.setex(key, ttl_seconds, value)
+        pipe.publish(self.channel, self.encode_batch([user_id for user_id, _, _ in items], content))
+        results = pipe.execute(raise_on_error=False)
+        stored = [
+            user_id for (user_id, _, _), result in zip(items, results)
+            if not isinstance(result, Exception)
+        ]
+        receivers = results[-1]
+        if isinstance(receivers, Exception):
+            raise NotificationPublishError(receivers, stored=stored)
+        return stored, receivers
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.connection_pool.disconnect()
+                except Exception as e:
+                    logger.warning("Failed to close notification publisher pool", error=str(e))
+                self._client = None
+
+
+# Global publisher instance
+notification_publisher = NotificationPublisher()
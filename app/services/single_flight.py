@@ -0,0 +1,181 @@
+"""
+Single-flight coalescing for recommendation generation.
+
+Duplicate requests for the same user and inputs (a double-clicked API call, or
+a Celery refresh overlapping an API request) should share one LLM round-trip.
+Callers in the same process await the one in-flight future; across processes
+the first caller takes a short Redis lease, and callers that find the lease
+held wait for the leader to publish its result instead of generating again.
+Redis calls run in a worker thread so a slow Redis never stalls the event loop.
+
+Example:
+    >>> flight = SingleFlight(namespace="recommendations")
+    >>> key = flight.make_key(user_id, prompt, city, location_context, date_range)
+    >>> result = await flight.run(key, lambda: generate(...), redis_client=client)
+"""
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.logging import get_logger
+
+logger = get_logger("single_flight")
+
+# Delete the lease only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """In-process futures plus a Redis lease to coalesce identical work."""
+
+    def __init__(
+        self,
+        namespace: str = "recommendations",
+        lease_seconds: float = 180.0,
+        wait_timeout: float = 150.0,
+        poll_interval: float = 0.25,
+        result_ttl: int = 60
+    ):
+        self.namespace = namespace
+        self.lease_seconds = float(lease_seconds)
+        self.wait_timeout = float(wait_timeout)
+        self.poll_interval = float(poll_interval)
+        self.result_ttl = int(result_ttl)
+        self._inflight: Dict[Tuple[int, str], "asyncio.Future"] = {}
+        self.leaders = 0
+        self.local_followers = 0
+        self.remote_followers = 0
+
+    @staticmethod
+    def make_key(
+        user_id: Optional[str],
+        prompt: str,
+        current_city: Optional[str],
+        location_context: Optional[Dict[str, Any]] = None,
+        date_range: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Digest of (user, prompt hash, city, location/date context)."""
+        prompt_hash = hashlib.blake2b((prompt or "").encode("utf-8"), digest_size=16).hexdigest()
+        payload = json.dumps(
+            [user_id, prompt_hash, current_city, location_context, date_range],
+            sort_keys=True, default=str, separators=(",", ":")
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _lease_key(self, key: str) -> str:
+        return f"{self.namespace}:singleflight:lease:{key}"
+
+    def _result_key(self, key: str) -> str:
+        return f"{self.namespace}:singleflight:result:{key}"
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        redis_client: Any = None,
+        share: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        """Run ``fn`` once per ``key`` across concurrent callers.
+
+        ``share`` decides whether a result may be handed to callers in other
+        processes (e.g. only successful responses).
+        """
+        loop = asyncio.get_running_loop()
+        local_key = (id(loop), key)
+        existing = self._inflight.get(local_key)
+        if existing is not None and not existing.done():
+            self.local_followers += 1
+            logger.info("Joining in-flight generation", key=key)
+            return await asyncio.shield(existing)
+
+        future = loop.create_future()
+        self._inflight[local_key] = future
+        try:
+            result = await self._run_distributed(key, fn, redis_client, share)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so an unobserved failure does not log a warning
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(local_key) is future:
+                del self._inflight[local_key]
+
+    async def _run_distributed(self, key: str, fn: Callable[[], Awaitable[Any]], redis_client: Any, share: Callable[[Any], bool]) -> Any:
+        if redis_client is None:
+            return await fn()
+        token = uuid.uuid4().hex
+        lease_key = self._lease_key(key)
+        deadline = time.monotonic() + self.wait_timeout
+        waiting = False
+        while True:
+            if waiting:
+                # The lease holder publishes its result before releasing the lease
+                shared = await asyncio.to_thread(self._read_result, redis_client, key)
+                if shared is not None:
+                    self.remote_followers += 1
+                    logger.info("Using result generated by another process", key=key)
+                    return shared
+            try:
+                acquired = await asyncio.to_thread(redis_client.set, lease_key, token, nx=True, px=int(self.lease_seconds * 1000))
+            except Exception as e:
+                logger.warning("Single-flight lease unavailable, generating locally", key=key, error=str(e))
+                return await fn()
+            if acquired:
+                return await self._lead(key, fn, redis_client, token, share)
+            if time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for in-flight generation, generating locally", key=key)
+                return await fn()
+            waiting = True
+            await asyncio.sleep(self.poll_interval)
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]], redis_client: Any, token: str, share: Callable[[Any], bool]) -> Any:
+        self.leaders += 1
+        try:
+            result = await fn()
+            if share(result):
+                try:
+                    await asyncio.to_thread(redis_client.setex, self._result_key(key), self.result_ttl, json.dumps(result, default=str))
+                except Exception as e:
+                    logger.warning("Failed to publish single-flight result", key=key, error=str(e))
+            return result
+        finally:
+            try:
+                await asyncio.to_thread(redis_client.eval, _RELEASE_SCRIPT, 1, self._lease_key(key), token)
+            except Exception as e:
+                logger.warning("Failed to release single-flight lease", key=key, error=str(e))
+
+    def _read_result(self, redis_client: Any, key: str) -> Optional[Any]:
+        try:
+            raw = redis_client.get(self._result_key(key))
+            if not raw:
+                return None
+            if isinstance(raw, bytes):
+                raw = raw.decode("utf-8")
+            return json.loads(raw)
+        except Exception as e:
+            logger.warning("Failed to read single-flight result", key=key, error=str(e))
+            return None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "local_followers": self.local_followers,
+            "remote_followers": self.remote_followers,
+        }
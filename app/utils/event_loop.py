@@ -0,0 +1,132 @@
+"""
+Long-lived event loop for synchronous callers.
+
+Celery tasks are synchronous, and running each coroutine on a fresh loop throws
+away everything bound to that loop when it closes: pooled HTTP clients, async
+Redis pools, caches and background flushers. ``LoopRunner`` keeps one loop
+alive in a daemon thread for the lifetime of a worker process (started from
+``worker_process_init``) and runs submitted coroutines on it, so that state
+survives from one task to the next. Until it is started - in the API process,
+scripts and tests - ``run`` falls back to a temporary loop per call.
+
+Example:
+    >>> loop_runner.start()
+    >>> result = loop_runner.run(llm_service.generate_recommendations(prompt, user_id))
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Coroutine, Optional
+
+from app.core.logging import get_logger
+
+logger = get_logger("event_loop")
+
+
+class LoopRunner:
+    """Runs coroutines from synchronous code on one loop owned by a background thread."""
+
+    def __init__(self, name: str = "worker-event-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        # A loop inherited through fork has no thread behind it in the child
+        return (
+            self._loop is not None
+            and self._thread is not None
+            and self._thread.is_alive()
+            and self._pid == os.getpid()
+        )
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._loop if self.is_running else None
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread for this process (idempotent)."""
+        with self._lock:
+            if self.is_running:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_loop() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            thread.start()
+            started.wait()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+            logger.info("Worker event loop started", pid=self._pid)
+            return loop
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """Run ``coro`` to completion and return its result.
+
+        Uses the long-lived loop when it is running, otherwise a temporary loop.
+        """
+        loop = self.loop
+        if loop is None:
+            return self._run_temporary(coro)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("LoopRunner.run() called from its own event loop; await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Coroutine did not finish within {timeout} seconds")
+
+    @staticmethod
+    def _run_temporary(coro: Coroutine[Any, Any, Any]) -> Any:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Cancel outstanding tasks, stop the loop and join its thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            running = self.is_running
+            self._loop = self._thread = self._pid = None
+        if not running:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_pending(), loop).result(timeout)
+        except Exception as e:
+            logger.warning("Failed to cancel pending tasks on worker event loop", error=str(e))
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("Worker event loop thread did not stop in time")
+            return
+        loop.close()
+        logger.info("Worker event loop stopped")
+
+    @staticmethod
+    async def _cancel_pending() -> None:
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global runner; started per worker process by app.workers.celery_app
+loop_runner = LoopRunner()
@@ -0,0 +1,78 @@
+"""
+Stable hashing featurizer shared by the ranking encoders.
+
+Python's builtin ``hash()`` is salted per process (PYTHONHASHSEED), so vectors
+built with it differ between Celery workers and cannot be cached or shared.
+This module hashes tokens with unkeyed BLAKE2b (64-bit digest), memoizes the
+result per token in a bounded table, and emits NumPy arrays directly:
+
+- ``vector(text, dim)``: dense signed-count vector (the fallback encoder)
+- ``sparse(text, dim)``: aggregated index/value arrays
+- ``token_ids(text, vocab_size)``: EmbeddingBag ids (the torch two-tower path)
+
+Bump ``FEATURIZER_VERSION`` whenever the token -> (index, sign) mapping changes;
+persisted vectors are namespaced by it.
+"""
+import hashlib
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+
+FEATURIZER_VERSION = "fz1"
+TOKEN_MEMO_SIZE = 65536
+_SIGN_BIT = np.uint64(63)
+
+
+@lru_cache(maxsize=TOKEN_MEMO_SIZE)
+def stable_token_hash(token: str) -> int:
+    """64-bit hash of a token that is identical in every process."""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def tokenize(text: str) -> List[str]:
+    if not isinstance(text, str) or not text:
+        return []
+    return text.lower().split()
+
+
+def _token_hashes(tokens: List[str]) -> np.ndarray:
+    return np.fromiter((stable_token_hash(t) for t in tokens), dtype=np.uint64, count=len(tokens))
+
+
+def token_slots(text: str, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-token (index, sign) arrays for ``text`` in a ``dim``-sized space."""
+    tokens = tokenize(text)
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    hashes = _token_hashes(tokens)
+    indices = (hashes % np.uint64(dim)).astype(np.int64)
+    signs = np.where((hashes >> _SIGN_BIT) & np.uint64(1), -1.0, 1.0)
+    return indices, signs
+
+
+def vector(text: str, dim: int = 128) -> np.ndarray:
+    """Dense hashed bag-of-words vector (signed token counts)."""
+    indices, signs = token_slots(text, dim)
+    if indices.size == 0:
+        return np.zeros(dim)
+    return np.bincount(indices, weights=signs, minlength=dim).astype(np.float64)
+
+
+def sparse(text: str, dim: int = 128) -> Tuple[np.ndarray, np.ndarray]:
+    """Aggregated non-zero (indices, values) of ``vector(text, dim)``."""
+    indices, signs = token_slots(text, dim)
+    if indices.size == 0:
+        return indices, signs
+    unique, inverse = np.unique(indices, return_inverse=True)
+    values = np.bincount(inverse, weights=signs)
+    keep = values != 0.0
+    return unique[keep], values[keep]
+
+
+def token_ids(text: str, vocab_size: int, max_tokens: int = 256) -> List[int]:
+    """Stable token ids in ``[0, vocab_size)`` for embedding lookups."""
+    tokens = tokenize(text)[:max_tokens]
+    if not tokens:
+        return []
+    return (_token_hashes(tokens) % np.uint64(vocab_size)).astype(np.int64).tolist()
@@ -0,0 +1,116 @@
+"""
+Incremental extraction of category arrays from a streamed JSON body.
+
+The recommendation provider answers with one object holding an array per
+category (``{"movies": [...], "music": [...], ...}``, optionally wrapped in a
+``{"result": ...}`` envelope). ``CategoryStreamParser`` is fed text chunks as
+they arrive and yields each category's items as soon as that array closes, so
+ranking can start on the first category while later ones are still streaming.
+Scanning is resumable: a chunk boundary inside a string or nested object costs
+nothing beyond the bytes already read.
+
+Example:
+    >>> parser = CategoryStreamParser()
+    >>> for chunk in chunks:
+    ...     for category, items in parser.feed(chunk):
+    ...         rank(category, items)
+"""
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Accepted category keys and the canonical category they map to
+CATEGORY_ALIASES: Dict[str, str] = {
+    "movies": "movies",
+    "music": "music",
+    "places": "places",
+    "place": "places",
+    "events": "events",
+    "event": "events",
+}
+
+_KEY_RE = re.compile(r'"(' + "|".join(CATEGORY_ALIASES) + r')"\s*:\s*\[')
+
+
+class CategoryStreamParser:
+    """Resumable scanner that emits ``(category, items)`` per completed array."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._seen: set = set()
+        # State of the array currently being captured
+        self._category: Optional[str] = None
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self) -> str:
+        """Everything received so far."""
+        return self._buffer
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted(self._seen)
+
+    def feed(self, chunk: str) -> List[Tuple[str, List]]:
+        if not chunk:
+            return []
+        self._buffer += chunk
+        completed: List[Tuple[str, List]] = []
+        while True:
+            if self._category is None:
+                match = _KEY_RE.search(self._buffer, self._pos)
+                if match is None:
+                    # Keep scanning from just before the tail in case a key is split
+                    self._pos = max(self._pos, len(self._buffer) - 32)
+                    return completed
+                self._category = CATEGORY_ALIASES[match.group(1)]
+                self._start = match.end() - 1
+                self._pos = match.end()
+                self._depth = 1
+                self._in_string = False
+                self._escape = False
+            end = self._scan_array()
+            if end is None:
+                return completed
+            category, self._category = self._category, None
+            try:
+                items = json.loads(self._buffer[self._start:end])
+            except ValueError:
+                continue
+            if category in self._seen or not isinstance(items, list):
+                continue
+            self._seen.add(category)
+            completed.append((category, items))
+
+    def _scan_array(self) -> Optional[int]:
+        """Advance through the open array; return its end offset once balanced."""
+        buf = self._buffer
+        i = self._pos
+        depth, in_string, escape = self._depth, self._in_string, self._escape
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            i += 1
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "[{":
+                depth += 1
+            elif ch in "]}":
+                depth -= 1
+                if depth == 0:
+                    self._pos = i
+                    return i
+        self._pos = i
+        self._depth, self._in_string, self._escape = depth, in_string, escape
+        return None
@@ -2,12 +2,16 @@ from typing import Dict, Any, List, Optional
 from app.core.logging import get_logger
 from app.models.schemas import UserProfile, LocationData, InteractionData
 from app.core.constants import RecommendationType
+import re
 import time
 from num2words import num2words
 
 class PromptBuilder:
     """Ranking-based prompt builder for nuanced recommendations with complete JSON structure"""
     
+    TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S UTC"
+    _TIME_OF_DAY_RE = re.compile(r"(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2} UTC")
+    
     def __init__(self):
         self.logger = get_logger(self.__class__.__name__)
     
@@ -388,7 +392,7 @@ Respond ONLY with the JSON object in this exact format:
         current_state = "Catalonia"
         country = "Spain"
         engagement_score = 0.5
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+        timestamp = time.strftime(self.TIMESTAMP_FORMAT, time.gmtime())
         
         # Track what data is available
         available_data = []
@@ -620,6 +624,15 @@ Respond ONLY with the JSON object in this exact format."""
     def _get_json_structure_requirements(self) -> str:
         return "The JSON structure must match exactly the provided template, with all fields populated appropriately."
 
+    @classmethod
+    def strip_timestamps(cls, prompt: str) -> str:
+        """Prompt text with the generation time of day removed, leaving only the date.
+        
+        Fallback and custom prompts embed the second they were built, so two
+        otherwise identical prompts differ unless compared this way.
+        """
+        return cls._TIME_OF_DAY_RE.sub(r"\1", prompt or "")
+    
     def build_custom_prompt(self, base_prompt: str, current_city: str = "Barcelona", max_results: int = 10) -> str:
         """Wrap a provided base prompt with the same JSON template and strict rules.
         Ensures the LLM returns the exact JSON object shape like build_fallback_prompt.
@@ -627,7 +640,7 @@ Respond ONLY with the JSON object in this exact format."""
         if not isinstance(base_prompt, str) or not base_prompt.strip():
             # Fallback to a minimal directive if the custom prompt is invalid
             base_prompt = "Provide personalized recommendations based on the following request."
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+        timestamp = time.strftime(self.TIMESTAMP_FORMAT, time.gmtime())
         guidance = f"""You are an expert recommendation system generating personalized suggestions as of {timestamp}.
 
 USER REQUEST:
@@ -0,0 +1,145 @@
+"""
+Async-native execution for I/O-bound Celery tasks.
+
+Recommendation refreshes spend nearly all their time waiting on the LLM API and
+Redis, so one prefork process per in-flight task wastes memory. With
+``CELERY_ASYNC_MODE`` enabled the worker runs the ``threads`` pool and tasks
+built on ``AsyncTask`` are ``async def`` bodies that all run on the process's
+single long-lived event loop (``app.utils.event_loop.loop_runner``). Pool threads
+only wait on a future, so hundreds of refreshes are multiplexed in one process;
+``InFlightLimiter`` caps how many coroutines execute at once
+(``CELERY_ASYNC_MAX_IN_FLIGHT``). Outside async mode the same tasks still work
+and run on a temporary loop per call.
+
+Example:
+    >>> @celery_app.task(bind=True, base=AsyncTask, name="refresh_user_async")
+    ... async def refresh_user_async(self, user_id):
+    ...     return await llm_service.generate_recommendations(prompt, user_id)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional
+
+from celery import Task
+from celery._state import _task_stack
+from celery.exceptions import Ignore, Retry
+from celery.utils.time import get_exponential_backoff_interval
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.utils.event_loop import loop_runner
+
+logger = get_logger("async_execution")
+
+# Request of the Celery task a coroutine belongs to. Celery keeps requests on a
+# thread-local stack, but async task bodies run on the event loop thread.
+_current_request: ContextVar[Optional[Any]] = ContextVar("async_task_request", default=None)
+
+
+def async_mode_enabled() -> bool:
+    return getattr(settings, "celery_async_mode", False) is True
+
+
+class InFlightLimiter:
+    """Caps the number of async task bodies executing at once on an event loop."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak = 0
+        self.completed = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            semaphore.release()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak": self.peak,
+            "completed": self.completed,
+        }
+
+
+# Shared by every AsyncTask in this process
+in_flight_limiter = InFlightLimiter(getattr(settings, "celery_async_max_in_flight", 200))
+
+
+class AsyncTask(Task):
+    """Celery task base whose ``run`` is a coroutine function.
+
+    The coroutine is executed on the worker event loop under the in-flight limit;
+    ``self.request`` inside it resolves to the request of the call that started it.
+    Celery's ``autoretry_for`` wrapper only sees the coroutine object, so the
+    same retry policy is applied here to exceptions raised by the awaited body.
+    """
+
+    def _get_request(self):
+        request = _current_request.get()
+        return request if request is not None else super()._get_request()
+
+    request = property(_get_request)
+
+    def __call__(self, *args, **kwargs):
+        # The worker pushes the request before calling us; direct calls do not
+        pushed = self.request_stack.top is None
+        if pushed:
+            _task_stack.push(self)
+            self.push_request(args=args, kwargs=kwargs)
+        try:
+            return loop_runner.run(self._run_in_request(self.request, args, kwargs))
+        except (Ignore, Retry):
+            raise
+        except tuple(getattr(self, "dont_autoretry_for", ())):
+            raise
+        except tuple(getattr(self, "autoretry_for", ())) as exc:
+            raise self._autoretry(exc)
+        finally:
+            if pushed:
+                self.pop_request()
+                _task_stack.pop()
+
+    def _autoretry(self, exc: BaseException) -> BaseException:
+        """Schedule a retry the way Celery's autoretry wrapper does for sync tasks."""
+        retry_kwargs = dict(getattr(self, "retry_kwargs", None) or {})
+        retry_backoff = float(getattr(self, "retry_backoff", False))
+        if retry_backoff:
+            retry_kwargs["countdown"] = get_exponential_backoff_interval(
+                factor=int(max(1.0, retry_backoff)),
+                retries=self.request.retries,
+                maximum=int(getattr(self, "retry_backoff_max", 600)),
+                full_jitter=getattr(self, "retry_jitter", True)
+            )
+        return self.retry(exc=exc, **retry_kwargs)
+
+    async def _run_in_request(self, request: Any, args: tuple, kwargs: dict) -> Any:
+        # Each submitted coroutine runs in its own context copy, so this is per call
+        _current_request.set(request)
+        async with in_flight_limiter.slot():
+            return await self.run(*args, **kwargs)
@@ -15,6 +15,7 @@ from app.services.cis_service import CISService
 from app.services.llm_service import llm_service
 from app.services.cache_service import cache_service
 from app.utils.prompt_builder import PromptBuilder
+from app.utils.event_loop import loop_runner
 import time
 
 logger = get_logger("async_celery_tasks")
@@ -25,14 +26,9 @@ class AsyncTaskExecutor:
     
     @staticmethod
     def run_async(coro):
-        """Run async coroutine in new event loop"""
+        """Run async coroutine on the worker's long-lived event loop"""
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(coro)
-            finally:
-                loop.close()
+            return loop_runner.run(coro)
         except Exception as e:
             logger.error("Async execution failed", error=str(e))
             raise
@@ -1,9 +1,25 @@
 """
 Celery application configuration
+
+Work is split across priority queues so interactive refreshes never wait behind
+scheduled bulk work: ``interactive`` (API-triggered), ``bulk_refresh``
+(scheduled batches) and ``maintenance`` (cleanup), next to the legacy
+``user_processing`` default queue. Run one worker per queue to give each its
+own concurrency from Settings, e.g.
+``celery -A app.workers.celery_app worker -Q interactive``.
+
+Celery beat runs ``schedule_users_refresh`` every
+``RECOMMENDATION_REFRESH_INTERVAL_MINUTES`` (0 disables the scheduled refresh).
 """
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Union
+
 from celery import Celery
+from celery.signals import celeryd_init, task_revoked, worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from kombu import Exchange, Queue
 from app.core.config import settings
 from app.core.logging import get_logger
+from app.utils.event_loop import loop_runner
 
 # Configure Celery
 celery_app = Celery(
@@ -47,6 +63,160 @@ celery_app.conf.update(
     worker_cancel_long_running_tasks_on_connection_loss=True,  # Cancel long tasks on connection loss
 )
 
+# Priority queues and routing
+DEFAULT_QUEUE = "user_processing"
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk_refresh"
+MAINTENANCE_QUEUE = "maintenance"
+MAX_PRIORITY = 10
+
+QUEUE_CONCURRENCY_SETTINGS = {
+    INTERACTIVE_QUEUE: "celery_interactive_concurrency",
+    BULK_QUEUE: "celery_bulk_concurrency",
+    MAINTENANCE_QUEUE: "celery_maintenance_concurrency",
+}
+
+# Only the new queues are declared with x-max-priority: RabbitMQ rejects redeclaring
+# an existing queue (user_processing) with different arguments (PRECONDITION_FAILED)
+celery_app.conf.update(
+    task_queues=(Queue(DEFAULT_QUEUE, Exchange(DEFAULT_QUEUE, type="direct"), routing_key=DEFAULT_QUEUE),) + tuple(
+        Queue(name, Exchange(name, type="direct"), routing_key=name, max_priority=MAX_PRIORITY)
+        for name in (INTERACTIVE_QUEUE, BULK_QUEUE, MAINTENANCE_QUEUE)
+    ),
+    # process_user_comprehensive has no static route: callers choose the queue
+    # (the API passes INTERACTIVE_QUEUE to enqueue)
+    task_routes={
+        "process_users_batch": {"queue": BULK_QUEUE},
+        "schedule_users_refresh": {"queue": BULK_QUEUE},
+        "cleanup_expired_cache": {"queue": MAINTENANCE_QUEUE},
+    },
+    task_default_priority=5,
+)
+
+
+def refresh_beat_schedule(interval_minutes: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    """Beat entry for the scheduled bulk refresh, or none when the interval is not positive."""
+    if not interval_minutes or int(interval_minutes) <= 0:
+        return {}
+    interval = timedelta(minutes=int(interval_minutes))
+    return {
+        "schedule-users-refresh": {
+            "task": "schedule_users_refresh",
+            "schedule": interval,
+            # A trigger still queued when the next one fires is redundant
+            "options": {"queue": BULK_QUEUE, "expires": interval.total_seconds()},
+        }
+    }
+
+
+celery_app.conf.beat_schedule = refresh_beat_schedule(
+    getattr(settings, "recommendation_refresh_interval_minutes", 0)
+)
+
+# Async execution mode: pool threads only wait on coroutines that all share one
+# event loop, so the thread count is the in-flight limit rather than a CPU budget
+if getattr(settings, "celery_async_mode", False) is True:
+    celery_app.conf.update(
+        worker_pool="threads",
+        worker_concurrency=settings.celery_async_max_in_flight,
+    )
+
 # Configure logging
 logger = get_logger("celery")
 
+
+def enqueue(
+    task: Any,
+    args: Optional[Iterable[Any]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    queue: Optional[str] = None,
+    priority: Optional[int] = None,
+    deadline: Optional[Union[float, datetime]] = None,
+    **options: Any
+):
+    """Enqueue ``task``, optionally with a deadline.
+
+    ``deadline`` is seconds from now or an absolute datetime. A task still queued
+    past its deadline is revoked by the worker instead of being executed late.
+    """
+    if isinstance(deadline, (int, float)):
+        deadline = datetime.now(timezone.utc) + timedelta(seconds=deadline)
+    if queue is not None:
+        options["queue"] = queue
+    if priority is not None:
+        options["priority"] = max(0, min(MAX_PRIORITY, int(priority)))
+    return task.apply_async(args=list(args or []), kwargs=kwargs or {}, expires=deadline, **options)
+
+
+def queue_concurrency(queues: Union[str, Iterable[str], None]) -> Optional[int]:
+    """Worker concurrency for a set of dedicated queues, or None if any has no setting."""
+    if not queues:
+        return None
+    names = queues.split(",") if isinstance(queues, str) else list(queues)
+    total = 0
+    for name in (n.strip() for n in names):
+        setting = QUEUE_CONCURRENCY_SETTINGS.get(name)
+        if setting is None:
+            return None
+        total += int(getattr(settings, setting))
+    return total or None
+
+
+@celeryd_init.connect
+def apply_queue_concurrency(sender=None, conf=None, options=None, **kwargs):
+    """Size a worker that consumes only dedicated queues from the per-queue settings."""
+    options = options or {}
+    if options.get("concurrency") or getattr(settings, "celery_async_mode", False) is True:
+        return
+    concurrency = queue_concurrency(options.get("queues"))
+    if concurrency and conf is not None:
+        conf.worker_concurrency = concurrency
+        logger.info("Worker concurrency set from queue settings", queues=options.get("queues"), concurrency=concurrency)
+
+
+@task_revoked.connect
+def log_expired_task(sender=None, request=None, expired=False, **kwargs):
+    """Deadline-expired tasks are dropped by the worker; record that they were."""
+    if expired:
+        logger.info("Dropped task past its deadline",
+                   task=getattr(sender, "name", None),
+                   task_id=getattr(request, "id", None))
+
+
+@worker_init.connect
+def start_async_mode_event_loop(**kwargs):
+    """The threads pool has no child processes, so async mode starts the loop here."""
+    if getattr(settings, "celery_async_mode", False) is True:
+        start_worker_event_loop()
+
+
+@worker_process_init.connect
+def start_worker_event_loop(**kwargs):
+    """Give each worker process one event loop that outlives individual tasks."""
+    try:
+        loop_runner.start()
+    except Exception as e:
+        logger.warning("Failed to start worker event loop; tasks will use a loop per call", error=str(e))
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_pooled_connections(**kwargs):
+    """Release pooled HTTP and notification connections when a worker (process) exits."""
+    try:
+        from app.services.http_client import http_client_registry
+        if loop_runner.is_running:
+            # Clients opened on the worker loop must be closed on it
+            loop_runner.run(http_client_registry.aclose_all(), timeout=10)
+        http_client_registry.close_all()
+    except Exception as e:
+        logger.warning("Failed to close pooled HTTP clients on worker shutdown", error=str(e))
+    try:
+        from app.services.notification_publisher import notification_publisher
+        notification_publisher.close()
+    except Exception as e:
+        logger.warning("Failed to close notification publisher on worker shutdown", error=str(e))
+    try:
+        loop_runner.stop()
+    except Exception as e:
+        logger.warning("Failed to stop worker event loop", error=str(e))
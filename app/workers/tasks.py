@@ -2,10 +2,10 @@
 Async Celery tasks with proper async/await patterns
 """
 import asyncio
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from fastapi import HTTPException
 from celery import Celery
-from app.workers.celery_app import celery_app
+from app.workers.celery_app import celery_app, enqueue, BULK_QUEUE
 from app.core.logging import get_logger, log_background_task, log_exception
 from app.core.config import settings
 from app.core.constants import RecommendationType
@@ -15,6 +15,8 @@ from app.services.cis_service import CISService
 from app.services.llm_service import llm_service
 from app.services.cache_service import cache_service
 from app.utils.prompt_builder import PromptBuilder
+from app.utils.event_loop import loop_runner
+from app.workers.async_execution import AsyncTask
 import time
 
 logger = get_logger("async_celery_tasks")
@@ -25,14 +27,9 @@ class AsyncTaskExecutor:
     
     @staticmethod
     def run_async(coro):
-        """Run async coroutine in new event loop"""
+        """Run async coroutine on the worker's long-lived event loop"""
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(coro)
-            finally:
-                loop.close()
+            return loop_runner.run(coro)
         except Exception as e:
             logger.error("Async execution failed", error=str(e))
             raise
@@ -501,6 +498,71 @@ def async_generate_recommendations(self, user_id: str, recommendation_type: str,
         }
 
 
+def _comprehensive_data(user_id: str, user_profile: Any, location_data: Any, interaction_data: Any) -> Dict[str, Any]:
+    """Combine fetched user data into the structure cached as ``comprehensive_data``"""
+    return {
+        "user_id": user_id,
+        "user_profile": user_profile.model_dump() if user_profile else None,
+        "location_data": location_data.model_dump() if location_data else None,
+        "interaction_data": interaction_data.model_dump() if interaction_data else None,
+        "processed_at": time.time(),
+        "data_quality": {
+            "user_profile_available": user_profile is not None,
+            "location_data_available": location_data is not None,
+            "interaction_data_available": interaction_data is not None
+        }
+    }
+
+
+def _generation_inputs(comprehensive_data: Dict[str, Any], prompt_builder: PromptBuilder, max_results: int = 5) -> Dict[str, Any]:
+    """Build the prompt and LLM arguments for a user's comprehensive data"""
+    user_profile = comprehensive_data.get("user_profile")
+    location_data = comprehensive_data.get("location_data")
+    interaction_data = comprehensive_data.get("interaction_data")
+    rec_type = RecommendationType.PLACE
+    # Use build_recommendation_prompt when we have at least one data source; else fallback
+    if any([user_profile, location_data, interaction_data]):
+        prompt = prompt_builder.build_recommendation_prompt(
+            user_profile=user_profile,
+            location_data=location_data,
+            interaction_data=interaction_data,
+            recommendation_type=rec_type,
+            max_results=max_results
+        )
+    else:
+        prompt = prompt_builder.build_fallback_prompt(
+            user_profile=user_profile,
+            location_data=location_data,
+            interaction_data=interaction_data,
+            recommendation_type=rec_type,
+            max_results=max_results
+        )
+    current_city = (location_data or {}).get("current_location") or "Barcelona"
+
+    # Extract location context for LLM
+    location_context = None
+    if location_data:
+        location_context = {
+            "lat": location_data.get("current_lat"),
+            "lng": location_data.get("current_lng"),
+            "city": location_data.get("current_location"),
+            "country": location_data.get("current_country"),
+            "timezone": location_data.get("timezone")
+        }
+
+    return {
+        "prompt": prompt,
+        "current_city": current_city,
+        "location_context": location_context,
+        "date_range": None,
+        "user_context": {
+            "user_profile": user_profile,
+            "location_data": location_data,
+            "interaction_data": interaction_data,
+        }
+    }
+
+
 @celery_app.task(
     bind=True,
     name="process_user_comprehensive",
@@ -556,71 +618,19 @@ def process_user_comprehensive(self, user_id: str) -> Dict[str, Any]:
                 interaction_data = None
             
             # Create comprehensive data structure
-            comprehensive_data = {
-                "user_id": user_id,
-                "user_profile": user_profile.model_dump() if user_profile else None,
-                "location_data": location_data.model_dump() if location_data else None,
-                "interaction_data": interaction_data.model_dump() if interaction_data else None,
-                "processed_at": time.time(),
-                "data_quality": {
-                    "user_profile_available": user_profile is not None,
-                    "location_data_available": location_data is not None,
-                    "interaction_data_available": interaction_data is not None
-                }
-            }
+            comprehensive_data = _comprehensive_data(user_id, user_profile, location_data, interaction_data)
             
             # Cache the comprehensive data
             cache_service.set("comprehensive_data", user_id, comprehensive_data)
             
-            # Build a prompt from available data and generate recommendations, then persist to Redis
+            # Build a prompt from available data and generate recommendations; generation
+            # stores the result in Redis and publishes the ready notification
             try:
-                pb = PromptBuilder()
-                from app.core.constants import RecommendationType
-                rec_type = RecommendationType.PLACE
-                # Use build_recommendation_prompt when we have at least one data source; else fallback
-                if any([comprehensive_data.get("user_profile"), comprehensive_data.get("location_data"), comprehensive_data.get("interaction_data")]):
-                    prompt = pb.build_recommendation_prompt(
-                        user_profile=comprehensive_data.get("user_profile"),
-                        location_data=comprehensive_data.get("location_data"),
-                        interaction_data=comprehensive_data.get("interaction_data"),
-                        recommendation_type=rec_type,
-                        max_results=5
-                    )
-                else:
-                    prompt = pb.build_fallback_prompt(
-                        user_profile=comprehensive_data.get("user_profile"),
-                        location_data=comprehensive_data.get("location_data"),
-                        interaction_data=comprehensive_data.get("interaction_data"),
-                        recommendation_type=rec_type,
-                        max_results=5
-                    )
-                current_city = (comprehensive_data.get("location_data") or {}).get("current_location") or "Barcelona"
-                
-                # Extract location context and date range for LLM
-                location_context = None
-                date_range = None
-                
-                if comprehensive_data.get("location_data"):
-                    location_data = comprehensive_data["location_data"]
-                    location_context = {
-                        "lat": location_data.get("current_lat"),
-                        "lng": location_data.get("current_lng"),
-                        "city": location_data.get("current_location"),
-                        "country": location_data.get("current_country"),
-                        "timezone": location_data.get("timezone")
-                    }
-                
-                # Execute LLM generation in this sync task
                 llm_response = llm_service.generate_recommendations_sync(
-                    prompt=prompt, 
-                    user_id=user_id, 
-                    current_city=current_city,
-                    location_context=location_context,
-                    date_range=date_range
+                    user_id=user_id,
+                    **_generation_inputs(comprehensive_data, PromptBuilder())
                 )
-                if isinstance(llm_response, dict) and llm_response.get("success"):
-                    llm_service._store_in_redis(user_id, llm_response)
-                else:
+                if not (isinstance(llm_response, dict) and llm_response.get("success")):
                     logger.warning("LLM generation did not return success", user_id=user_id)
             except Exception as e:
                 logger.warning("Post-process recommendation generation failed", user_id=user_id, error=str(e))
@@ -657,6 +667,320 @@ def process_user_comprehensive(self, user_id: str) -> Dict[str, Any]:
         }
 
 
+@celery_app.task(
+    bind=True,
+    base=AsyncTask,
+    name="process_user_comprehensive_async",
+    autoretry_for=(ConnectionError, TimeoutError, HTTPException, ValueError,),
+    retry_kwargs={'max_retries': 3, 'countdown': 15},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+async def process_user_comprehensive_async(self, user_id: str) -> Dict[str, Any]:
+    """Async-native process_user_comprehensive for CELERY_ASYNC_MODE workers.
+
+    Awaits the data services and the LLM on the worker event loop instead of
+    blocking a worker process, so many users are refreshed concurrently.
+    Blocking Redis writes run in a worker thread to keep the shared loop free.
+    """
+    task_id = self.request.id
+    log_background_task("process_user_comprehensive_async", task_id, "started", user_id=user_id)
+    try:
+        logger.info("Starting async comprehensive user processing", user_id=user_id, task_id=task_id)
+        
+        contexts = await _fetch_batch_contexts([user_id], 1)
+        comprehensive_data = contexts[user_id]
+        await asyncio.to_thread(cache_service.set, "comprehensive_data", user_id, comprehensive_data)
+        
+        # Generation stores the result in Redis and publishes the ready notification
+        try:
+            llm_response = await llm_service.generate_recommendations(
+                user_id=user_id,
+                **_generation_inputs(comprehensive_data, PromptBuilder())
+            )
+            if not (isinstance(llm_response, dict) and llm_response.get("success")):
+                logger.warning("LLM generation did not return success", user_id=user_id)
+        except Exception as e:
+            logger.warning("Post-process recommendation generation failed", user_id=user_id, error=str(e))
+        
+        log_background_task("process_user_comprehensive_async", task_id, "completed", user_id=user_id)
+        logger.info("Async comprehensive user processing completed", user_id=user_id, task_id=task_id)
+        
+        return {
+            "success": True,
+            "user_id": user_id,
+            "comprehensive_data": comprehensive_data,
+            "message": "User processed comprehensively"
+        }
+        
+    except Exception as e:
+        log_background_task("process_user_comprehensive_async", task_id, "failed", user_id=user_id, error=str(e))
+        logger.error("Async comprehensive user processing failed", user_id=user_id, task_id=task_id, error=str(e))
+        log_exception("async_celery_tasks", e, {"user_id": user_id, "task": "process_user_comprehensive_async", "task_id": task_id})
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Failed to process user comprehensively"
+        }
+
+
+async def _fetch_batch_contexts(user_ids: List[str], concurrency: int) -> Dict[str, Dict[str, Any]]:
+    """Fetch profile, location and interaction data for many users concurrently"""
+    user_service = UserProfileService(timeout=120)
+    lie_service = LIEService(timeout=120)
+    cis_service = CISService(timeout=120)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(user_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            results = await asyncio.gather(
+                user_service.get_user_profile(user_id),
+                lie_service.get_location_data(user_id),
+                cis_service.get_interaction_data(user_id),
+                return_exceptions=True
+            )
+        for source, result in zip(("user_profile", "location_data", "interaction_data"), results):
+            if isinstance(result, Exception):
+                logger.warning("Batch context fetch failed", user_id=user_id, source=source, error=str(result))
+        user_profile, location_data, interaction_data = (
+            None if isinstance(result, Exception) else result for result in results
+        )
+        return _comprehensive_data(user_id, user_profile, location_data, interaction_data)
+
+    contexts = await asyncio.gather(*(fetch(user_id) for user_id in user_ids))
+    return dict(zip(user_ids, contexts))
+
+
+async def _generate_batch(user_ids: List[str], contexts: Dict[str, Dict[str, Any]], concurrency: int) -> Dict[str, Dict[str, Any]]:
+    """Generate recommendations for many users with bounded LLM concurrency, without storing them."""
+    prompt_builder = PromptBuilder()
+    inputs = {user_id: _generation_inputs(contexts[user_id], prompt_builder) for user_id in user_ids}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    responses: Dict[str, Dict[str, Any]] = {}
+
+    async def generate(user_id: str) -> None:
+        try:
+            async with semaphore:
+                response = await llm_service.generate_recommendations(user_id=user_id, store=False, **inputs[user_id])
+        except Exception as e:
+            logger.warning("Batch recommendation generation failed", user_id=user_id, error=str(e))
+            return
+        if isinstance(response, dict) and response.get("success"):
+            responses[user_id] = response
+        else:
+            logger.warning("LLM generation did not return success", user_id=user_id)
+
+    await asyncio.gather(*(generate(user_id) for user_id in user_ids))
+    return responses
+
+
+def _incremental_refresh(user_ids: List[str], contexts: Dict[str, Dict[str, Any]]) -> Tuple[List[str], Dict[str, Dict[str, Any]], List[str]]:
+    """Refresh what can be refreshed without the LLM.
+
+    Users whose inputs are unchanged and whose stored recommendations are within
+    the freshness budget only get their TTL extended; users whose interaction
+    data alone changed get their stored items rescored. Returns the extended
+    user ids, the rescored payloads and the users that still need generation.
+    """
+    if not getattr(settings, "incremental_refresh_enabled", True):
+        return [], {}, list(user_ids)
+    try:
+        plan = llm_service.plan_incremental_refresh(
+            {user_id: contexts[user_id] for user_id in user_ids},
+            float(getattr(settings, "incremental_refresh_max_age_seconds", 21600))
+        )
+    except Exception as e:
+        logger.warning("Incremental refresh planning failed, regenerating all", user_count=len(user_ids), error=str(e))
+        return [], {}, list(user_ids)
+
+    actions = {user_id: plan.get(user_id, {}).get("action") for user_id in user_ids}
+    unchanged = [user_id for user_id in user_ids if actions[user_id] == "extend"]
+    regenerate = [user_id for user_id in user_ids if actions[user_id] not in ("extend", "rescore")]
+    rescored: Dict[str, Dict[str, Any]] = {}
+    for user_id in (user_id for user_id in user_ids if actions[user_id] == "rescore"):
+        try:
+            rescored[user_id] = llm_service.rescore_recommendations(plan[user_id]["cached"], user_id, contexts[user_id])
+        except Exception as e:
+            logger.warning("Rescoring stored recommendations failed", user_id=user_id, error=str(e))
+            regenerate.append(user_id)
+
+    extended = []
+    if unchanged:
+        try:
+            extended = llm_service.extend_recommendations_ttl(unchanged)
+        except Exception as e:
+            logger.warning("Extending recommendation TTLs failed", user_count=len(unchanged), error=str(e))
+    extended_ids = set(extended)
+    # Recommendations that expired since they were read are generated afresh
+    regenerate.extend(user_id for user_id in unchanged if user_id not in extended_ids)
+    return extended, rescored, regenerate
+
+
+@celery_app.task(
+    bind=True,
+    name="process_users_batch",
+    autoretry_for=(ConnectionError, TimeoutError,),
+    retry_kwargs={'max_retries': 3, 'countdown': 15},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def process_users_batch(self, user_ids: List[str]) -> Dict[str, Any]:
+    """Refresh recommendations for a chunk of users with shared, batched I/O.
+
+    Contexts are fetched concurrently, users whose inputs have not changed skip
+    the LLM (see ``_incremental_refresh``), LLM calls run with bounded
+    concurrency, and all results are written in one pipelined SETEX batch with
+    one grouped notification.
+    """
+    task_id = self.request.id
+    unique_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id))
+    log_background_task("process_users_batch", task_id, "started", user_count=len(unique_ids))
+    
+    try:
+        logger.info("Starting batch user processing", user_count=len(unique_ids), task_id=task_id)
+        if not unique_ids:
+            return {"success": True, "processed": 0, "stored": 0, "failed_user_ids": [], "message": "No users to process"}
+        
+        contexts = AsyncTaskExecutor.run_async(_fetch_batch_contexts(
+            unique_ids, int(getattr(settings, "batch_refresh_fetch_concurrency", 20))
+        ))
+        cache_service.set_multiple("comprehensive_data", contexts)
+        extended, rescored, to_generate = _incremental_refresh(unique_ids, contexts)
+        responses = dict(rescored)
+        if to_generate:
+            responses.update(AsyncTaskExecutor.run_async(_generate_batch(
+                to_generate, contexts, int(getattr(settings, "batch_refresh_llm_concurrency", 8))
+            )))
+        stored = llm_service.store_many_in_redis(responses) if responses else []
+        refreshed_ids = set(stored) | set(extended)
+        failed = [user_id for user_id in unique_ids if user_id not in refreshed_ids]
+        
+        log_background_task("process_users_batch", task_id, "completed",
+                           user_count=len(unique_ids),
+                           stored_count=len(stored))
+        logger.info("Batch user processing completed",
+                   user_count=len(unique_ids),
+                   stored_count=len(stored),
+                   extended_count=len(extended),
+                   rescored_count=len(rescored),
+                   generated_count=len(to_generate),
+                   failed_count=len(failed),
+                   task_id=task_id)
+        
+        return {
+            "success": True,
+            "processed": len(unique_ids),
+            "stored": len(stored),
+            "extended": len(extended),
+            "rescored": len(rescored),
+            "generated": len(to_generate),
+            "failed_user_ids": failed,
+            "message": "Users processed in batch"
+        }
+        
+    except Exception as e:
+        log_background_task("process_users_batch", task_id, "failed", user_count=len(unique_ids), error=str(e))
+        logger.error("Batch user processing failed", user_count=len(unique_ids), task_id=task_id, error=str(e))
+        log_exception("async_celery_tasks", e, {"user_ids": unique_ids, "task": "process_users_batch", "task_id": task_id})
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Failed to process users batch"
+        }
+
+
+# Sub-namespaces of ``recommendations:`` that hold caches rather than users
+# (LLMResponseCache, SingleFlight and UserEmbeddingCache keys)
+_INTERNAL_RECOMMENDATION_NAMESPACES = frozenset({"llm_cache", "singleflight", "embeddings"})
+
+
+def _active_user_ids(scan_count: int = 1000) -> List[str]:
+    """Users that currently have stored recommendations (``recommendations:{user_id}``)"""
+    user_ids = []
+    for key in llm_service.redis_client.scan_iter(match="recommendations:*", count=scan_count):
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+        user_id, _, suffix = key[len("recommendations:"):].partition(":")
+        if not user_id or user_id in _INTERNAL_RECOMMENDATION_NAMESPACES:
+            continue
+        # Per-type keys (recommendations:{user_id}:{type}) are not the user's entry
+        if not suffix:
+            user_ids.append(user_id)
+    return user_ids
+
+
+@celery_app.task(bind=True, name="schedule_users_refresh")
+def schedule_users_refresh(self, user_ids: Optional[List[str]] = None, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """Split the active-user population into chunks, one ``process_users_batch`` task each.
+
+    ``user_ids`` defaults to every user with stored recommendations.
+    """
+    task_id = self.request.id
+    log_background_task("schedule_users_refresh", task_id, "started")
+    try:
+        population = list(dict.fromkeys(user_ids if user_ids is not None else _active_user_ids()))
+        size = max(1, int(chunk_size or getattr(settings, "batch_refresh_chunk_size", 100)))
+        chunks = [population[i:i + size] for i in range(0, len(population), size)]
+        # Low priority with a deadline: a backlog of stale scheduled refreshes is
+        # dropped by the worker rather than run hours late
+        deadline = getattr(settings, "bulk_refresh_deadline_seconds", 3600)
+        task_ids = [
+            enqueue(process_users_batch, args=[chunk], queue=BULK_QUEUE, priority=1, deadline=deadline).id
+            for chunk in chunks
+        ]
+        
+        log_background_task("schedule_users_refresh", task_id, "completed",
+                           user_count=len(population),
+                           chunk_count=len(chunks))
+        logger.info("Scheduled batch user refresh",
+                   user_count=len(population),
+                   chunk_count=len(chunks),
+                   chunk_size=size,
+                   task_id=task_id)
+        return {
+            "success": True,
+            "user_count": len(population),
+            "chunk_count": len(chunks),
+            "task_ids": task_ids,
+            "message": "Batch refresh scheduled"
+        }
+    except Exception as e:
+        log_background_task("schedule_users_refresh", task_id, "failed", error=str(e))
+        logger.error("Scheduling batch user refresh failed", task_id=task_id, error=str(e))
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Failed to schedule batch refresh"
+        }
+
+
+@celery_app.task(bind=True, name="cleanup_expired_cache")
+def cleanup_expired_cache(self) -> Dict[str, Any]:
+    """Remove cache entries left without a TTL, for every configured cache type."""
+    task_id = self.request.id
+    log_background_task("cleanup_expired_cache", task_id, "started")
+    try:
+        cleaned = {key_type: cache_service.cleanup_expired(key_type) for key_type in cache_service.cache_ttl}
+        total = sum(cleaned.values())
+        log_background_task("cleanup_expired_cache", task_id, "completed", cleaned=total)
+        return {
+            "success": True,
+            "cleaned": cleaned,
+            "total_cleaned": total,
+            "message": "Cache cleanup completed"
+        }
+    except Exception as e:
+        log_background_task("cleanup_expired_cache", task_id, "failed", error=str(e))
+        logger.error("Cache cleanup failed", task_id=task_id, error=str(e))
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Cache cleanup failed"
+        }
+
+
 # Legacy function aliases for backward compatibility with tests
 def fetch_user_data(user_id: str) -> Dict[str, Any]:
     """Legacy alias for async_fetch_user_data - calls the actual function directly"""
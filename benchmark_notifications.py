@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Load generator and latency benchmark for notification_service.py
+
+Starts one or more local notification service instances (uvicorn
+subprocesses) against a Redis server, or an in-process fakeredis stand-in with
+--fake-redis, connects N simulated WebSocket clients and measures:
+
+- end-to-end delivery latency (p50/p95/p99) and throughput for notifications
+  injected through POST /notify/stream/{user_id} and the notifications:user
+  pub/sub channel
+- resident memory per connection on the instances
+- time to replay pending notifications when offline users reconnect
+
+The report is JSON (stdout, or --output) so runs can be compared over time.
+
+Example:
+    python benchmark_notifications.py --clients 500 --instances 2 --messages 2000 --fake-redis
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import redis.asyncio as aioredis
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    websockets = None
+    WEBSOCKETS_AVAILABLE = False
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    psutil = None
+    PSUTIL_AVAILABLE = False
+
+PUBSUB_CHANNEL = "notifications:user"
+PENDING_PREFIX = "notifications:pending:"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds from a list of seconds."""
+    ms = [value * 1000 for value in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of a process, 0 if it cannot be read."""
+    try:
+        if PSUTIL_AVAILABLE:
+            return psutil.Process(pid).memory_info().rss
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    return 0
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_redis(port: int):
+    """Serve fakeredis on ``port`` from a daemon thread."""
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_instances(count: int, redis_host: str, redis_port: int, log_level: str) -> List[Dict]:
+    """Launch ``count`` notification service instances on free ports."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    instances = []
+    for index in range(count):
+        port = free_port()
+        env = os.environ.copy()
+        env.update({
+            "INSTANCE_ID": f"bench_{index}_{uuid.uuid4().hex[:6]}",
+            "REDIS_HOST": redis_host,
+            "REDIS_PORT": str(redis_port),
+            "LOG_LEVEL": log_level.upper(),
+        })
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "notification_service:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", log_level],
+            cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        instances.append({"process": process, "port": port, "url": f"http://127.0.0.1:{port}"})
+    return instances
+
+
+async def wait_until_healthy(instances: List[Dict], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        for instance in instances:
+            while True:
+                try:
+                    if (await client.get(f"{instance['url']}/health")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Instance on port {instance['port']} did not become healthy")
+                await asyncio.sleep(0.2)
+
+
+def stop_instances(instances: List[Dict]):
+    for instance in instances:
+        instance["process"].terminate()
+    for instance in instances:
+        try:
+            instance["process"].wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            instance["process"].kill()
+
+
+class BenchClient:
+    """One simulated WebSocket user recording when each benchmark message arrives."""
+
+    def __init__(self, user_id: str, url: str):
+        self.user_id = user_id
+        self.url = url
+        self.received: Dict[str, float] = {}
+        self.duplicates = 0
+        self._connection = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        self._connection = await websockets.connect(f"{self.url}/ws/{self.user_id}", max_size=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self._connection:
+                now = time.time()
+                try:
+                    frame = json.loads(raw)
+                except ValueError:
+                    continue
+                message = frame.get("message") if isinstance(frame, dict) else None
+                bench_id = message.get("bench_id") if isinstance(message, dict) else None
+                if bench_id is None:
+                    continue
+                if bench_id in self.received:
+                    self.duplicates += 1
+                else:
+                    self.received[bench_id] = now
+        except Exception:
+            pass
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+async def connect_clients(clients: List[BenchClient], concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(client: BenchClient):
+        async with semaphore:
+            await client.connect()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connect(client) for client in clients))
+    return time.perf_counter() - start
+
+
+async def wait_for_delivery(clients: Dict[str, BenchClient], expected: Dict[str, str], timeout: float):
+    """Wait until every ``bench_id -> user_id`` in ``expected`` has been received."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(bench_id in clients[user_id].received for bench_id, user_id in expected.items()):
+            return
+        await asyncio.sleep(0.05)
+
+
+def delivery_report(clients: Dict[str, BenchClient], sent: Dict[str, tuple]) -> Dict:
+    """Latency/throughput report for ``bench_id -> (user_id, sent_at)``."""
+    latencies = []
+    last_received = None
+    for bench_id, (user_id, sent_at) in sent.items():
+        received_at = clients[user_id].received.get(bench_id)
+        if received_at is not None:
+            latencies.append(received_at - sent_at)
+            last_received = max(last_received or received_at, received_at)
+    first_sent = min((sent_at for _, sent_at in sent.values()), default=None)
+    elapsed = (last_received - first_sent) if last_received and first_sent else 0.0
+    return {
+        "sent": len(sent),
+        "delivered": len(latencies),
+        "lost": len(sent) - len(latencies),
+        "duplicates": sum(client.duplicates for client in clients.values()),
+        "throughput_msgs_per_s": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+async def inject_stream(instances: List[Dict], user_ids: List[str], count: int, concurrency: int) -> Dict[str, tuple]:
+    """POST ``count`` notifications to random users through random instances."""
+    sent: Dict[str, tuple] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        async def post(index: int):
+            user_id = random.choice(user_ids)
+            instance = random.choice(instances)
+            bench_id = f"stream-{index}"
+            async with semaphore:
+                sent_at = time.time()
+                await client.post(
+                    f"{instance['url']}/notify/stream/{user_id}",
+                    json={"message": {"content": "benchmark", "bench_id": bench_id}}
+                )
+            sent[bench_id] = (user_id, sent_at)
+
+        await asyncio.gather(*(post(index) for index in range(count)))
+    return sent
+
+
+async def inject_pubsub(redis: aioredis.Redis, user_ids: List[str], count: int) -> Dict[str, tuple]:
+    sent: Dict[str, tuple] = {}
+    for index in range(count):
+        user_id = random.choice(user_ids)
+        bench_id = f"pubsub-{index}"
+        sent[bench_id] = (user_id, time.time())
+        await redis.publish(PUBSUB_CHANNEL, json.dumps({
+            "user_id": user_id,
+            "message": {"content": "benchmark", "bench_id": bench_id}
+        }))
+    return sent
+
+
+async def measure_pending_replay(instances: List[Dict], redis: aioredis.Redis, users: int, per_user: int, timeout: float) -> Dict:
+    """Queue notifications for offline users, reconnect them and time the replay."""
+    user_ids = [f"bench_offline_{uuid.uuid4().hex[:8]}" for _ in range(users)]
+    sent: Dict[str, tuple] = {}
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        for user_id in user_ids:
+            for index in range(per_user):
+                bench_id = f"pending-{user_id}-{index}"
+                await client.post(
+                    f"{random.choice(instances)['url']}/notify/stream/{user_id}",
+                    json={"message": {"content": "benchmark", "bench_id": bench_id}}
+                )
+                sent[bench_id] = (user_id, 0.0)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        counts = [await redis.zcard(f"{PENDING_PREFIX}{user_id}") for user_id in user_ids]
+        if all(count >= per_user for count in counts):
+            break
+        await asyncio.sleep(0.1)
+
+    clients = {
+        user_id: BenchClient(user_id, instances[index % len(instances)]["url"].replace("http", "ws", 1))
+        for index, user_id in enumerate(user_ids)
+    }
+    replay_times = []
+    start = time.time()
+    await connect_clients(list(clients.values()), concurrency=50)
+    await wait_for_delivery(clients, {bench_id: user_id for bench_id, (user_id, _) in sent.items()}, timeout)
+    for user_id, client in clients.items():
+        if len(client.received) >= per_user:
+            replay_times.append(max(client.received.values()) - start)
+    delivered = sum(len(client.received) for client in clients.values())
+    await asyncio.gather(*(client.close() for client in clients.values()))
+    return {
+        "users": users,
+        "messages_per_user": per_user,
+        "delivered": delivered,
+        "complete_users": len(replay_times),
+        "replay": summarize_latencies(replay_times),
+    }
+
+
+async def run_benchmark(args) -> Dict:
+    redis_host, redis_port = args.redis_host, args.redis_port
+    fake_server = None
+    if args.fake_redis:
+        redis_port = free_port()
+        fake_server = start_fake_redis(redis_port)
+        redis_host = "127.0.0.1"
+
+    instances = start_instances(args.instances, redis_host, redis_port, args.log_level)
+    redis = aioredis.Redis(host=redis_host, port=redis_port, decode_responses=True)
+    clients: Dict[str, BenchClient] = {}
+    try:
+        await wait_until_healthy(instances)
+        baseline_rss = sum(rss_bytes(instance["process"].pid) for instance in instances)
+
+        for index in range(args.clients):
+            user_id = f"bench_user_{index}"
+            ws_url = instances[index % len(instances)]["url"].replace("http", "ws", 1)
+            clients[user_id] = BenchClient(user_id, ws_url)
+        connect_seconds = await connect_clients(list(clients.values()), args.connect_concurrency)
+        await asyncio.sleep(args.settle)
+        connected_rss = sum(rss_bytes(instance["process"].pid) for instance in instances)
+
+        user_ids = list(clients)
+        stream_sent = await inject_stream(instances, user_ids, args.messages, args.send_concurrency)
+        await wait_for_delivery(clients, {k: v[0] for k, v in stream_sent.items()}, args.timeout)
+        stream_report = delivery_report(clients, stream_sent)
+
+        for client in clients.values():
+            client.duplicates = 0
+        pubsub_sent = await inject_pubsub(redis, user_ids, args.messages)
+        await wait_for_delivery(clients, {k: v[0] for k, v in pubsub_sent.items()}, args.timeout)
+        pubsub_report = delivery_report(clients, pubsub_sent)
+
+        pending_report = await measure_pending_replay(
+            instances, redis, args.pending_users, args.pending_per_user, args.timeout
+        )
+
+        return {
+            "benchmark": "notification_service",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                "instances": args.instances,
+                "clients": args.clients,
+                "messages": args.messages,
+                "pending_users": args.pending_users,
+                "pending_per_user": args.pending_per_user,
+                "redis": "fakeredis" if fake_server else f"{redis_host}:{redis_port}",
+            },
+            "connections": {
+                "connected": args.clients,
+                "connect_seconds": round(connect_seconds, 3),
+                "connections_per_s": round(args.clients / connect_seconds, 2) if connect_seconds else 0.0,
+                "instances_rss_bytes": connected_rss,
+                "memory_per_connection_bytes": (
+                    round((connected_rss - baseline_rss) / args.clients) if args.clients else 0
+                ),
+            },
+            "stream": stream_report,
+            "pubsub": pubsub_report,
+            "pending_replay": pending_report,
+        }
+    finally:
+        await asyncio.gather(*(client.close() for client in clients.values()), return_exceptions=True)
+        await redis.close()
+        stop_instances(instances)
+        if fake_server is not None:
+            fake_server.shutdown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the notification service")
+    parser.add_argument("--instances", type=int, default=1, help="Number of service instances to start")
+    parser.add_argument("--clients", type=int, default=200, help="Simulated WebSocket clients")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages per injection mode")
+    parser.add_argument("--pending-users", type=int, default=20, help="Offline users for the replay test")
+    parser.add_argument("--pending-per-user", type=int, default=10, help="Pending messages per offline user")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--send-concurrency", type=int, default=50)
+    parser.add_argument("--settle", type=float, default=1.0, help="Seconds to wait after connecting")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-phase delivery timeout")
+    parser.add_argument("--redis-host", default=os.getenv("REDIS_HOST", "localhost"))
+    parser.add_argument("--redis-port", type=int, default=int(os.getenv("REDIS_PORT", 6379)))
+    parser.add_argument("--fake-redis", action="store_true", help="Use an in-process fakeredis server")
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not WEBSOCKETS_AVAILABLE:
+        print("The 'websockets' package is required (pip install websockets)", file=sys.stderr)
+        return 1
+    report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
 from typing import Dict, Optional, Set, List, Union
 import asyncio
+import bisect
+import hashlib
+import heapq
 import json
 import logging
 import time
 import uuid
 import socket
 import os
+import zlib
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from dataclasses import dataclass
@@ -15,10 +20,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import redis.asyncio as aioredis
 from redis.asyncio.connection import ConnectionPool
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_client import Gauge, CollectorRegistry
 
+try:
+    import orjson
+    _ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    _ORJSON_AVAILABLE = False
+
 # Configure logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 logging.basicConfig(
@@ -35,10 +47,17 @@ REDIS_DB = 0
 
 # Redis Keys and Channels
 NOTIFICATIONS_STREAM = "notifications:stream"
+BROADCAST_STREAM = "notifications:broadcast"
+BROADCAST_RESULTS_PREFIX = "notifications:broadcast_results:"
+SEGMENT_PREFIX = "notifications:segment:"
 INSTANCE_CHANNEL_PREFIX = "notifications:instance"
+CONTROL_CHANNEL = "notifications:control"
 CONNECTIONS_KEY = "websocket:connections"
 PENDING_NOTIFICATIONS_PREFIX = "notifications:pending:"
 PENDING_USERS_KEY = "notifications:pending_users"
+PENDING_DUE_PREFIX = "notifications:pending_due:"
+INSTANCES_KEY = "notifications:instances"
+SWEEP_LEADER_KEY = "notifications:sweep_leader"
 DEAD_LETTER_KEY = "notifications:dead_letter"
 CONSUMER_GROUP = "notification_processors"
 
@@ -48,16 +67,104 @@ MAX_RECONNECT_ATTEMPTS = 10
 HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", 30))
 CLIENT_TIMEOUT_MULTIPLIER = int(os.getenv("CLIENT_TIMEOUT_MULTIPLIER", 3))
 CLIENT_TIMEOUT = HEARTBEAT_INTERVAL * CLIENT_TIMEOUT_MULTIPLIER
+HEARTBEAT_TICK = float(os.getenv("HEARTBEAT_TICK", 1))
+HEARTBEAT_CONCURRENCY = max(1, int(os.getenv("HEARTBEAT_CONCURRENCY", 200)))
+STALE_SWEEP_INTERVAL = int(os.getenv("STALE_SWEEP_INTERVAL", HEARTBEAT_INTERVAL))
 MESSAGE_TTL_HOURS = int(os.getenv("MESSAGE_TTL_HOURS", 24))
 MAX_PENDING_MESSAGES = int(os.getenv("MAX_PENDING_MESSAGES", 100))
+PENDING_MAX_ATTEMPTS = max(1, int(os.getenv("PENDING_MAX_ATTEMPTS", 3)))
 PENDING_RETRY_INTERVAL = int(os.getenv("PENDING_RETRY_INTERVAL", 300))  # 5 minutes
+PENDING_REPLAY_BATCH_SIZE = max(1, int(os.getenv("PENDING_REPLAY_BATCH_SIZE", 50)))
+PENDING_SCHEDULER_INTERVAL = float(os.getenv("PENDING_SCHEDULER_INTERVAL", 5))
+PENDING_RETRY_CONCURRENCY = max(1, int(os.getenv("PENDING_RETRY_CONCURRENCY", 32)))
+PENDING_RETRY_BATCH = max(1, int(os.getenv("PENDING_RETRY_BATCH", 1000)))
+PENDING_SCAN_COUNT = max(1, int(os.getenv("PENDING_SCAN_COUNT", 500)))
+PENDING_DUE_PARTITIONS = max(1, int(os.getenv("PENDING_DUE_PARTITIONS", 128)))
+PENDING_RECONCILE_INTERVAL = int(os.getenv("PENDING_RECONCILE_INTERVAL", 600))
+INSTANCE_TTL = max(PENDING_SCHEDULER_INTERVAL * 3, 30)
+HASH_RING_REPLICAS = int(os.getenv("HASH_RING_REPLICAS", 64))
+STREAM_BATCH_SIZE = max(1, int(os.getenv("STREAM_BATCH_SIZE", 100)))
+STREAM_WORKERS = max(1, int(os.getenv("STREAM_WORKERS", 16)))
+STREAM_CLAIM_IDLE_MS = int(os.getenv("STREAM_CLAIM_IDLE_MS", 60000))
+STREAM_CLAIM_INTERVAL = float(os.getenv("STREAM_CLAIM_INTERVAL", 30))
+ROUTING_CACHE_TTL = float(os.getenv("ROUTING_CACHE_TTL", 300))
+ROUTING_CACHE_MAX_ENTRIES = max(1, int(os.getenv("ROUTING_CACHE_MAX_ENTRIES", 100000)))
+FANOUT_BATCH_WINDOW_MS = float(os.getenv("FANOUT_BATCH_WINDOW_MS", 5))
+FANOUT_BATCH_MAX_MESSAGES = max(1, int(os.getenv("FANOUT_BATCH_MAX_MESSAGES", 100)))
+FANOUT_BATCH_MAX_BYTES = max(1, int(os.getenv("FANOUT_BATCH_MAX_BYTES", 256 * 1024)))
+# Instances older than fanout_batch drop those frames; enable once every instance is upgraded
+FANOUT_BATCH_FRAMES = os.getenv("FANOUT_BATCH_FRAMES", "false").lower() == "true"
+BROADCAST_STREAM_MAXLEN = int(os.getenv("BROADCAST_STREAM_MAXLEN", 10000))
+BROADCAST_CONCURRENCY = max(1, int(os.getenv("BROADCAST_CONCURRENCY", 500)))
+BROADCAST_MAX_USERS = int(os.getenv("BROADCAST_MAX_USERS", 100000))
+BROADCAST_RESULT_TIMEOUT_MS = int(os.getenv("BROADCAST_RESULT_TIMEOUT_MS", 2000))
+BROADCAST_MAX_WAIT_MS = int(os.getenv("BROADCAST_MAX_WAIT_MS", 10000))
+BROADCAST_PENDING_BATCH = max(1, int(os.getenv("BROADCAST_PENDING_BATCH", 500)))
+# Consecutive listener failures before /health reports the instance degraded
+BROADCAST_UNHEALTHY_AFTER = max(1, int(os.getenv("BROADCAST_UNHEALTHY_AFTER", 3)))
+BROADCAST_MAX_BACKOFF = float(os.getenv("BROADCAST_MAX_BACKOFF", 60))
+BROADCAST_RESULT_TTL = 3600
 MAX_MESSAGE_SIZE = int(os.getenv("MAX_MESSAGE_SIZE", 1024 * 1024))  # 1MB
 ENABLE_DEBUG = os.getenv("ENABLE_DEBUG", "false").lower() == "true"
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+
+def encode_frame(message) -> str:
+    """Serialize a message once into the text frame sent to WebSocket clients"""
+    if _ORJSON_AVAILABLE:
+        return orjson.dumps(message, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def decorate_frame(frame: str, **fields) -> str:
+    """Set top-level fields on an encoded JSON object
+    
+    New fields are spliced in without re-encoding the body. If the frame may
+    already contain one of them it is decoded once so the value is replaced
+    rather than duplicated.
+    """
+    body = frame.rstrip()
+    if not fields or not body.endswith("}"):
+        return frame
+    if any(f'"{key}"' in body for key in fields):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            data.update(fields)
+            return encode_frame(data)
+    head = body[:-1].rstrip()
+    separator = "" if head.endswith("{") else ","
+    return f"{head}{separator}{encode_frame(fields)[1:-1]}}}"
+
+def pending_due_partition(user_id: str) -> int:
+    """Partition of the retry schedule a user's due entry lives in"""
+    return zlib.crc32(user_id.encode("utf-8")) % PENDING_DUE_PARTITIONS
+
+def pending_due_key(partition: int) -> str:
+    return f"{PENDING_DUE_PREFIX}{partition}"
+
+# Pending members written before they were stored as frames: json.dumps of a
+# {"user_id", "message", "timestamp", "attempts", ...} record
+LEGACY_PENDING_PREFIX = '{"user_id": '
 
 class NotificationPayload(BaseModel):
     message: Union[dict, str, list, int, float] = {"content": "Your new recommendations are ready!"}
     type: str = "notification"
 
+class BroadcastPayload(NotificationPayload):
+    """Notification for a cohort: an explicit user list or a segment id
+    
+    A segment is a Redis set at ``notifications:segment:{segment_id}``; the
+    special segment ``all`` targets every connected user.
+    
+    Listed ``user_ids`` that are not connected anywhere get the notification
+    stored as pending. Segment broadcasts are best-effort: only users connected
+    when an instance processes the entry receive them.
+    """
+    user_ids: Optional[List[str]] = None
+    segment_id: Optional[str] = None
+    wait_ms: int = Field(default=BROADCAST_RESULT_TIMEOUT_MS, ge=0, le=BROADCAST_MAX_WAIT_MS)
+
 @dataclass
 class PendingNotification:
     """Structure for pending notifications"""
@@ -68,6 +175,246 @@ class PendingNotification:
     max_attempts: int = 3
     notification_id: Optional[str] = None
 
+class RoutingTable:
+    """In-process user -> instance routes, fed by connect/disconnect broadcasts
+    
+    Entries expire after ``ROUTING_CACHE_TTL`` and the least recently used
+    ones are evicted beyond ``max_entries``. A miss or expired entry means the
+    caller should fall back to ``CONNECTIONS_KEY`` in Redis.
+    """
+    
+    def __init__(self, ttl: float = ROUTING_CACHE_TTL, max_entries: int = ROUTING_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._routes: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._routes)
+    
+    def get(self, user_id: str) -> Optional[str]:
+        entry = self._routes.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._routes[user_id]
+            self.misses += 1
+            return None
+        self._routes.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+    
+    def set(self, user_id: str, instance_id: str):
+        self._routes[user_id] = (instance_id, time.monotonic() + self.ttl)
+        self._routes.move_to_end(user_id)
+        while len(self._routes) > self.max_entries:
+            self._routes.popitem(last=False)
+    
+    def invalidate(self, user_id: str, instance_id: Optional[str] = None):
+        """Drop a route; with ``instance_id``, only if it still points there"""
+        entry = self._routes.get(user_id)
+        if entry is not None and (instance_id is None or entry[0] == instance_id):
+            del self._routes[user_id]
+    
+    def clear(self):
+        self._routes.clear()
+    
+    def apply_event(self, event: dict):
+        user_id = event.get("user_id")
+        instance_id = event.get("instance_id")
+        if not user_id or not instance_id:
+            return
+        if event.get("type") == "connect":
+            self.set(user_id, instance_id)
+        elif event.get("type") == "disconnect":
+            self.invalidate(user_id, instance_id)
+    
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._routes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+class IdleTracker:
+    """Min-heap of per-connection check deadlines
+    
+    Rescheduling pushes a new heap entry and leaves the old one behind; stale
+    entries are skipped when popped and the heap is compacted once they
+    dominate it.
+    """
+    
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._due: Dict[str, float] = {}
+    
+    def __len__(self) -> int:
+        return len(self._due)
+    
+    def schedule(self, user_id: str, due: float):
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(due, user_id) for user_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+    
+    def remove(self, user_id: str):
+        self._due.pop(user_id, None)
+    
+    def pop_due(self, now: float) -> List[str]:
+        """Remove and return users whose deadline has passed"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            due, user_id = heapq.heappop(self._heap)
+            if self._due.get(user_id) == due:
+                del self._due[user_id]
+                expired.append(user_id)
+        return expired
+    
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+class FanoutBatcher:
+    """Coalesces fanout messages bound for the same instance into one frame
+    
+    Messages are buffered per target instance and published as a single
+    ``fanout_batch`` frame after ``FANOUT_BATCH_WINDOW_MS``, or as soon as the
+    buffer reaches ``FANOUT_BATCH_MAX_MESSAGES`` / ``FANOUT_BATCH_MAX_BYTES``.
+    ``send`` resolves to the number of subscribers that received the frame.
+    A window of 0, or ``FANOUT_BATCH_FRAMES`` off (the default during a rolling
+    deploy), publishes every message on its own as a legacy ``fanout`` frame.
+    """
+    
+    def __init__(
+        self,
+        connection_manager: "DistributedConnectionManager",
+        window_ms: float = FANOUT_BATCH_WINDOW_MS,
+        max_messages: int = FANOUT_BATCH_MAX_MESSAGES,
+        max_bytes: int = FANOUT_BATCH_MAX_BYTES,
+        batch_frames: bool = FANOUT_BATCH_FRAMES
+    ):
+        self.manager = connection_manager
+        self.window = max(0.0, window_ms) / 1000 if batch_frames else 0.0
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._buffers: Dict[str, List] = {}
+        self._sizes: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.frames_sent = 0
+        self.messages_sent = 0
+    
+    async def send(self, target_instance: str, user_id: str, message: dict) -> int:
+        if self.window <= 0:
+            return await self._publish_single(target_instance, user_id, message)
+        
+        entry = encode_frame({"user_id": user_id, "message": message})
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        buffer = self._buffers.setdefault(target_instance, [])
+        buffer.append((entry, future))
+        self._sizes[target_instance] = self._sizes.get(target_instance, 0) + len(entry)
+        if len(buffer) >= self.max_messages or self._sizes[target_instance] >= self.max_bytes:
+            await self.flush(target_instance)
+        elif target_instance not in self._timers:
+            self._timers[target_instance] = loop.call_later(
+                self.window, lambda: asyncio.ensure_future(self.flush(target_instance))
+            )
+        return await future
+    
+    async def flush(self, target_instance: str):
+        timer = self._timers.pop(target_instance, None)
+        if timer is not None:
+            timer.cancel()
+        buffer = self._buffers.pop(target_instance, [])
+        self._sizes.pop(target_instance, None)
+        if not buffer:
+            return
+        try:
+            receivers = await self._publish(target_instance, [entry for entry, _ in buffer])
+        except Exception as e:
+            for _, future in buffer:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in buffer:
+            if not future.done():
+                future.set_result(receivers)
+    
+    async def flush_all(self):
+        for target_instance in list(self._buffers):
+            await self.flush(target_instance)
+    
+    async def _publish_single(self, target_instance: str, user_id: str, message: dict) -> int:
+        frame = encode_frame({
+            "type": "fanout",
+            "user_id": user_id,
+            "message": message,
+            "source_instance": INSTANCE_ID
+        })
+        receivers = await self.manager.redis.publish(f"{INSTANCE_CHANNEL_PREFIX}:{target_instance}", frame)
+        self.frames_sent += 1
+        self.messages_sent += 1
+        return receivers
+    
+    async def _publish(self, target_instance: str, entries: List[str]) -> int:
+        # Entries are already JSON; splice them into the frame instead of re-encoding
+        frame = (
+            f'{{"type": "fanout_batch", "source_instance": {json.dumps(INSTANCE_ID)}, '
+            f'"messages": [{", ".join(entries)}]}}'
+        )
+        receivers = await self.manager.redis.publish(f"{INSTANCE_CHANNEL_PREFIX}:{target_instance}", frame)
+        self.frames_sent += 1
+        self.messages_sent += len(entries)
+        return receivers
+    
+    def get_stats(self) -> Dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "messages_sent": self.messages_sent,
+            "buffered": sum(len(buffer) for buffer in self._buffers.values())
+        }
+
+# Acknowledge processed pending notifications in one round-trip.
+# KEYS: pending zset, pending users set, dead letter list, retry due zset
+# ARGV: user_id, score for re-queued members, next retry time, #removed,
+#       #dead-lettered, removed members..., dead-lettered members...,
+#       (old, new) re-queued pairs...
+# Members are only dead-lettered or re-queued if this call removed them, so two
+# instances retrying the same user cannot duplicate a notification.
+PENDING_ACK_SCRIPT = """
+local n_remove = tonumber(ARGV[4])
+local n_dlq = tonumber(ARGV[5])
+local i = 6
+for _ = 1, n_remove do
+    redis.call('ZREM', KEYS[1], ARGV[i])
+    i = i + 1
+end
+for _ = 1, n_dlq do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('LPUSH', KEYS[3], ARGV[i])
+    end
+    i = i + 1
+end
+while i < #ARGV do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('ZADD', KEYS[1], ARGV[2], ARGV[i + 1])
+    end
+    i = i + 2
+end
+local remaining = redis.call('ZCARD', KEYS[1])
+if remaining == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[4], ARGV[1])
+else
+    redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+end
+return remaining
+"""
+
 class DistributedConnectionManager:
     """Manages WebSocket connections with distributed state in Redis"""
     
@@ -77,6 +424,10 @@ class DistributedConnectionManager:
         self.last_activity: Dict[str, float] = {}
         self.redis_pool = redis_pool
         self.redis: aioredis.Redis = aioredis.Redis(connection_pool=self.redis_pool)
+        self._pending_ack_script = None
+        self.routes = RoutingTable()
+        self.fanout_batcher = FanoutBatcher(self)
+        self.idle_tracker = IdleTracker()
     
     async def connect(self, websocket: WebSocket, user_id: str):
         """Register user connection locally and in Redis"""
@@ -85,6 +436,7 @@ class DistributedConnectionManager:
             self.local_connections[user_id] = websocket
             self.connection_times[user_id] = time.time()
             self.last_activity[user_id] = time.time()
+            self.idle_tracker.schedule(user_id, time.time() + HEARTBEAT_INTERVAL)
             
             connection_data = {
                 "instance_id": INSTANCE_ID,
@@ -93,6 +445,7 @@ class DistributedConnectionManager:
             }
             
             await self.redis.hset(CONNECTIONS_KEY, user_id, json.dumps(connection_data))
+            await self.broadcast_route("connect", user_id)
             logger.info(f"User {user_id} connected to instance {INSTANCE_ID}. Local connections: {len(self.local_connections)}")
             await self.deliver_pending_notifications(user_id)
         except Exception as e:
@@ -106,19 +459,36 @@ class DistributedConnectionManager:
                 self.local_connections.pop(user_id)
                 self.connection_times.pop(user_id, None)
                 self.last_activity.pop(user_id, None)
+                self.idle_tracker.remove(user_id)
                 await self.redis.hdel(CONNECTIONS_KEY, user_id)
+                await self.broadcast_route("disconnect", user_id)
                 logger.info(f"User {user_id} disconnected from instance {INSTANCE_ID}. Local connections: {len(self.local_connections)}")
         except Exception as e:
             logger.error(f"Error disconnecting user {user_id}: {e}")
     
-    async def send_message_local(self, user_id: str, message: dict) -> bool:
-        """Send message to locally connected user"""
+    async def broadcast_route(self, event_type: str, user_id: str):
+        """Tell other instances' routing tables where this user is (or was) connected"""
+        try:
+            await self.redis.publish(CONTROL_CHANNEL, json.dumps({
+                "type": event_type,
+                "user_id": user_id,
+                "instance_id": INSTANCE_ID
+            }))
+        except Exception as e:
+            logger.warning(f"Failed to broadcast {event_type} route for user {user_id}: {e}")
+    
+    async def forward_to_instance(self, target_instance: str, user_id: str, message: dict) -> int:
+        """Queue a message for another instance's fanout batch; returns the number of subscribers reached"""
+        return await self.fanout_batcher.send(target_instance, user_id, message)
+    
+    async def send_message_local(self, user_id: str, message: Union[dict, str]) -> bool:
+        """Send a message, or a frame already built by ``encode_frame``, to a locally connected user"""
         if user_id not in self.local_connections:
             return False
         
         websocket = self.local_connections[user_id]
         try:
-            await websocket.send_json(message)
+            await websocket.send_text(message if isinstance(message, str) else encode_frame(message))
             logger.debug(f"Message sent to local user {user_id}: {message}")
             self.last_activity[user_id] = time.time()
             return True
@@ -127,101 +497,203 @@ class DistributedConnectionManager:
             await self.disconnect(user_id)
             return False
     
-    async def send_message_distributed(self, user_id: str, message: dict) -> bool:
+    async def send_message_distributed(self, user_id: str, message: Union[dict, str], store_on_failure: bool = True) -> bool:
         """Send message to user across distributed instances"""
         try:
             if await self.send_message_local(user_id, message):
                 return True
             
+            cached_instance = self.routes.get(user_id)
+            if cached_instance and cached_instance != INSTANCE_ID:
+                if await self.forward_to_instance(cached_instance, user_id, message):
+                    logger.debug(f"Message forwarded to cached instance {cached_instance} for user {user_id}")
+                    return True
+                # Nobody listens on that instance's channel any more
+                self.routes.invalidate(user_id, cached_instance)
+            
             connection_data = await self.redis.hget(CONNECTIONS_KEY, user_id)
             if connection_data:
                 try:
                     conn_info = json.loads(connection_data)
                     target_instance = conn_info.get("instance_id")
                     if target_instance != INSTANCE_ID:
-                        instance_channel = f"{INSTANCE_CHANNEL_PREFIX}:{target_instance}"
-                        fanout_message = {
-                            "type": "fanout",
-                            "user_id": user_id,
-                            "message": message,
-                            "source_instance": INSTANCE_ID
-                        }
-                        await self.redis.publish(instance_channel, json.dumps(fanout_message))
+                        self.routes.set(user_id, target_instance)
+                        await self.forward_to_instance(target_instance, user_id, message)
                         logger.debug(f"Message forwarded to instance {target_instance} for user {user_id}")
                         return True
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid connection data for user {user_id}: {e}")
                     await self.redis.hdel(CONNECTIONS_KEY, user_id)
             
-            await self.store_pending_notification(user_id, message)
+            if store_on_failure:
+                await self.store_pending_notification(user_id, message)
             return False
         except Exception as e:
             logger.error(f"Error sending distributed message to user {user_id}: {e}")
             return False
     
-    async def store_pending_notification(self, user_id: str, message: dict):
-        """Store notification for offline user"""
+    async def store_undelivered_fanout(self, user_id: str, messages: List[dict]):
+        """Keep forwarded messages for a user who is not connected here
+        
+        The sender counted the publish as delivered (its cached route may be
+        stale), so nothing else stores them. They are queued as pending and the
+        stale route is withdrawn from every routing table.
+        """
+        await self.broadcast_route("disconnect", user_id)
+        for message in messages:
+            await self.store_pending_notification(user_id, message)
+    
+    async def store_pending_notification(self, user_id: str, message: Union[dict, str]):
+        """Store notification for offline user in a single MULTI/EXEC round-trip
+        
+        The member is the frame replay will send (``is_pending`` and the
+        original timestamp included), so reconnects never re-encode it.
+        """
         try:
-            key = f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}"
-            pending_notification = {
-                "user_id": user_id,
-                "message": message,
-                "timestamp": datetime.utcnow().isoformat(),
-                "attempts": 0,
-                "max_attempts": 3,
-                "notification_id": message.get("notification_id", str(uuid.uuid4()))
-            }
-            
-            score = time.time()
-            member = json.dumps(pending_notification)
-            await self.redis.zadd(key, {member: score})
-            await self.redis.expire(key, MESSAGE_TTL_HOURS * 3600)
-            await self.redis.sadd(PENDING_USERS_KEY, user_id)
-            await self.redis.zremrangebyrank(key, MAX_PENDING_MESSAGES, -1)
+            pipe = self.redis.pipeline(transaction=True)
+            self._queue_pending(pipe, user_id, self._pending_member(message), time.time())
+            await pipe.execute()
             logger.info(f"Stored pending notification for offline user {user_id}")
         except Exception as e:
             logger.error(f"Error storing pending notification for user {user_id}: {e}")
     
+    async def store_pending_many(self, user_ids: List[str], message: Union[dict, str]) -> int:
+        """Store one notification as pending for many users, one MULTI/EXEC per batch
+        
+        Each user's copy is the shared frame with their ``user_id`` spliced in.
+        Returns the number of users it was stored for.
+        """
+        if not user_ids:
+            return 0
+        member = self._pending_member(message)
+        score = time.time()
+        stored = 0
+        try:
+            for start in range(0, len(user_ids), BROADCAST_PENDING_BATCH):
+                batch = user_ids[start:start + BROADCAST_PENDING_BATCH]
+                pipe = self.redis.pipeline(transaction=True)
+                for user_id in batch:
+                    self._queue_pending(pipe, user_id, decorate_frame(member, user_id=user_id), score)
+                await pipe.execute()
+                stored += len(batch)
+        except Exception as e:
+            logger.error(f"Error storing pending notifications for {len(user_ids)} users: {e}")
+        return stored
+    
+    @staticmethod
+    def _pending_member(message: Union[dict, str]) -> str:
+        frame = message if isinstance(message, str) else encode_frame(message)
+        fields = {
+            "is_pending": True,
+            "original_timestamp": datetime.utcnow().isoformat(),
+            "delivery_attempts": 0
+        }
+        if '"notification_id"' not in frame:
+            fields["notification_id"] = str(uuid.uuid4())
+        return decorate_frame(frame, **fields)
+    
+    @staticmethod
+    def _queue_pending(pipe, user_id: str, member: str, score: float):
+        key = f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}"
+        pipe.zadd(key, {member: score})
+        pipe.expire(key, MESSAGE_TTL_HOURS * 3600)
+        pipe.sadd(PENDING_USERS_KEY, user_id)
+        pipe.zadd(pending_due_key(pending_due_partition(user_id)), {user_id: score + PENDING_RETRY_INTERVAL}, nx=True)
+        pipe.zremrangebyrank(key, MAX_PENDING_MESSAGES, -1)
+    
+    async def ack_pending(
+        self,
+        user_id: str,
+        remove: Optional[List[str]] = None,
+        dead_letter: Optional[List[str]] = None,
+        requeue: Optional[List[tuple]] = None
+    ) -> int:
+        """Remove, dead-letter and re-queue pending members atomically.
+        
+        Drops the user from the pending set and retry schedule once nothing is
+        left, otherwise schedules the next retry. Returns the number of
+        notifications still pending.
+        """
+        if self._pending_ack_script is None:
+            self._pending_ack_script = self.redis.register_script(PENDING_ACK_SCRIPT)
+        key = f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}"
+        remove = remove or []
+        dead_letter = dead_letter or []
+        now = time.time()
+        args = [user_id, now, now + PENDING_RETRY_INTERVAL, len(remove), len(dead_letter), *remove, *dead_letter]
+        for old, new in requeue or []:
+            args.extend((old, new))
+        remaining = await self._pending_ack_script(
+            keys=[key, PENDING_USERS_KEY, DEAD_LETTER_KEY, pending_due_key(pending_due_partition(user_id))],
+            args=args,
+            client=self.redis
+        )
+        return int(remaining or 0)
+    
     async def deliver_pending_notifications(self, user_id: str):
-        """Deliver all pending notifications for a user"""
+        """Replay pending notifications in batches, acknowledging each batch in one round-trip"""
         try:
             key = f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}"
-            pending_members = await self.redis.zrange(key, 0, -1)
-            if not pending_members:
-                return
-            
-            logger.info(f"Delivering {len(pending_members)} pending notifications to user {user_id}")
-            delivered = []
-            for member in pending_members:
-                try:
-                    notification_data = json.loads(member)
-                    message = notification_data.get("message", {"content": "Your new recommendations are ready!"})
-                    message["is_pending"] = True
-                    message["original_timestamp"] = notification_data.get("timestamp")
+            total_delivered = 0
+            while True:
+                pending_members = await self.redis.zrange(key, 0, PENDING_REPLAY_BATCH_SIZE - 1)
+                if not pending_members:
+                    break
+                
+                logger.info(f"Delivering {len(pending_members)} pending notifications to user {user_id}")
+                delivered = []
+                invalid = []
+                send_failed = False
+                for member in pending_members:
+                    frame = self._pending_frame(member)
+                    if frame is None:
+                        logger.error(f"Invalid pending notification data for user {user_id}")
+                        invalid.append(member)
+                        continue
                     
-                    if await self.send_message_local(user_id, message):
+                    if await self.send_message_local(user_id, frame):
                         delivered.append(member)
                     else:
+                        send_failed = True
                         break
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid pending notification data: {e}")
-                    continue
+                
+                if delivered or invalid:
+                    await self.ack_pending(user_id, remove=delivered + invalid)
+                total_delivered += len(delivered)
+                if send_failed or len(pending_members) < PENDING_REPLAY_BATCH_SIZE:
+                    break
             
-            if delivered:
-                await self.redis.zrem(key, *delivered)
-                if await self.redis.zcard(key) == 0:
-                    await self.redis.srem(PENDING_USERS_KEY, user_id)
-                logger.info(f"Delivered {len(delivered)} pending notifications to user {user_id}")
+            if total_delivered:
+                logger.info(f"Delivered {total_delivered} pending notifications to user {user_id}")
         except Exception as e:
             logger.error(f"Error delivering pending notifications for user {user_id}: {e}")
     
+    @staticmethod
+    def _pending_frame(member: str) -> Optional[str]:
+        """Frame to send for a pending member, or None if the member is unusable"""
+        if member.startswith(LEGACY_PENDING_PREFIX):
+            try:
+                notification_data = json.loads(member)
+            except json.JSONDecodeError:
+                return None
+            message = notification_data.get("message", {"content": "Your new recommendations are ready!"})
+            return decorate_frame(
+                encode_frame(message),
+                is_pending=True,
+                original_timestamp=notification_data.get("timestamp")
+            )
+        # Stored pre-encoded: sent as is
+        if member.startswith("{") and member.endswith("}"):
+            return member
+        return None
+    
     async def retry_pending_for_user(self, user_id: str) -> int:
         """Retry pending notifications for a user, increment attempts on failure"""
         try:
             key = f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}"
             pending_members = await self.redis.zrange(key, 0, -1)
             if not pending_members:
-                await self.redis.srem(PENDING_USERS_KEY, user_id)
+                await self.ack_pending(user_id)
                 return 0
             
             processed = 0
@@ -231,38 +703,38 @@ class DistributedConnectionManager:
             
             for member in pending_members:
                 try:
+                    legacy = member.startswith(LEGACY_PENDING_PREFIX)
                     notification_data = json.loads(member)
-                    message = notification_data.get("message", {"content": "Your new recommendations are ready!"})
-                    attempts = notification_data.get("attempts", 0)
+                    if not isinstance(notification_data, dict):
+                        raise json.JSONDecodeError("pending member is not an object", member, 0)
+                    if legacy:
+                        message = notification_data.get("message", {"content": "Your new recommendations are ready!"})
+                        attempts = notification_data.get("attempts", 0)
+                        max_attempts = notification_data.get("max_attempts", PENDING_MAX_ATTEMPTS)
+                    else:
+                        message = member
+                        attempts = notification_data.get("delivery_attempts", 0)
+                        max_attempts = PENDING_MAX_ATTEMPTS
                     
-                    if await self.send_message_distributed(user_id, message):
+                    # The member is already stored; a failed attempt must not re-queue a copy
+                    if await self.send_message_distributed(user_id, message, store_on_failure=False):
                         to_remove.append(member)
                         processed += 1
                     else:
                         attempts += 1
-                        if attempts >= notification_data.get("max_attempts", 3):
+                        if attempts >= max_attempts:
                             to_dlq.append(member)
-                            await self.redis.lpush(DEAD_LETTER_KEY, member)
                             logger.warning(f"Moved failed notification to DLQ for user {user_id}: attempts {attempts}")
-                        else:
+                        elif legacy:
                             notification_data["attempts"] = attempts
-                            new_member = json.dumps(notification_data)
-                            to_update.append((member, new_member))
+                            to_update.append((member, json.dumps(notification_data)))
+                        else:
+                            to_update.append((member, decorate_frame(member, delivery_attempts=attempts)))
                 except json.JSONDecodeError:
                     to_remove.append(member)
                     continue
             
-            if to_remove:
-                await self.redis.zrem(key, *to_remove)
-            for old, new in to_update:
-                await self.redis.zrem(key, old)
-                await self.redis.zadd(key, {new: time.time()})
-            if to_dlq:
-                await self.redis.zrem(key, *to_dlq)
-            
-            if await self.redis.zcard(key) == 0:
-                await self.redis.srem(PENDING_USERS_KEY, user_id)
-            
+            await self.ack_pending(user_id, remove=to_remove, dead_letter=to_dlq, requeue=to_update)
             return processed
         except Exception as e:
             logger.error(f"Error retrying pending notifications for user {user_id}: {e}")
@@ -307,29 +779,125 @@ async def setup_redis_streams():
     except Exception as e:
         logger.error(f"Failed to setup Redis Streams: {e}")
 
+class StreamWorkerPool:
+    """Processes stream entries concurrently while keeping per-user order
+    
+    Entries are partitioned onto a fixed set of queues by ``user_id``; each
+    queue has a single worker, so one user's notifications are delivered in
+    stream order while different users proceed in parallel. ``process_batch``
+    returns once every entry of the batch is handled and acknowledges them
+    with one XACK.
+    """
+    
+    def __init__(self, redis: aioredis.Redis, workers: int = STREAM_WORKERS):
+        self.redis = redis
+        self.queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(max(1, workers))]
+        self._tasks: List[asyncio.Task] = []
+    
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def partition(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode("utf-8")) % len(self.queues)
+    
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            msg_id, fields, future = await queue.get()
+            try:
+                done = await process_stream_message(self.redis, msg_id, fields, ack=False)
+                if not future.done():
+                    future.set_result(done)
+            except Exception as e:
+                if not future.done():
+                    future.set_result(False)
+                logger.error(f"Stream worker failed on {msg_id}: {e}")
+            finally:
+                queue.task_done()
+    
+    async def process_batch(self, entries) -> int:
+        """Deliver ``(msg_id, fields)`` entries and XACK the handled ones in one call"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for msg_id, fields in entries:
+            if not fields:
+                # Entry was trimmed from the stream while pending; just acknowledge it
+                future = loop.create_future()
+                future.set_result(True)
+            else:
+                user_id = str(fields.get("user_id", "")).strip()
+                future = loop.create_future()
+                self.queues[self.partition(user_id)].put_nowait((msg_id, fields, future))
+            futures.append((msg_id, future))
+        if not futures:
+            return 0
+        await asyncio.gather(*(future for _, future in futures))
+        acked = [msg_id for msg_id, future in futures if future.result()]
+        if acked:
+            await self.redis.xack(NOTIFICATIONS_STREAM, CONSUMER_GROUP, *acked)
+        return len(acked)
+
+async def claim_stale_stream_entries(pool: StreamWorkerPool, consumer_id: str, start_id: str = "0-0") -> str:
+    """XAUTOCLAIM entries idle in dead consumers' pending lists and process them
+    
+    Returns the cursor to resume from on the next call.
+    """
+    result = await pool.redis.xautoclaim(
+        NOTIFICATIONS_STREAM,
+        CONSUMER_GROUP,
+        consumer_id,
+        min_idle_time=STREAM_CLAIM_IDLE_MS,
+        start_id=start_id,
+        count=STREAM_BATCH_SIZE
+    )
+    next_id, entries = result[0], result[1]
+    if entries:
+        handled = await pool.process_batch(entries)
+        logger.info(f"Claimed {len(entries)} stale stream entries, acknowledged {handled}")
+    return next_id or "0-0"
+
 async def redis_streams_consumer():
-    """Enhanced Redis Streams consumer with message acknowledgment"""
+    """Redis Streams consumer with a per-user ordered worker pool and batched acknowledgment"""
     consumer_id = f"{INSTANCE_ID}_{uuid.uuid4().hex[:8]}"
     reconnect_attempts = 0
     
     while reconnect_attempts < MAX_RECONNECT_ATTEMPTS:
+        pool = None
         try:
             redis = manager.redis
+            pool = StreamWorkerPool(redis)
             logger.info(f"Redis Streams consumer {consumer_id} started")
             reconnect_attempts = 0
+            claim_cursor = "0-0"
+            next_claim = time.time()
             
             while True:
                 try:
+                    if time.time() >= next_claim:
+                        next_claim = time.time() + STREAM_CLAIM_INTERVAL
+                        try:
+                            claim_cursor = await claim_stale_stream_entries(pool, consumer_id, claim_cursor)
+                        except Exception as e:
+                            if "NOGROUP" in str(e):
+                                raise
+                            logger.warning(f"Failed to claim stale stream entries: {e}")
                     messages = await redis.xreadgroup(
                         CONSUMER_GROUP,
                         consumer_id,
                         {NOTIFICATIONS_STREAM: '>'},
-                        count=10,
+                        count=STREAM_BATCH_SIZE,
                         block=1000
                     )
-                    for stream, msgs in messages:
-                        for msg_id, fields in msgs:
-                            await process_stream_message(redis, msg_id, fields)
+                    for stream, msgs in messages or []:
+                        await pool.process_batch(msgs)
                 except Exception as e:
                     if "NOGROUP" in str(e):
                         await setup_redis_streams()
@@ -346,9 +914,16 @@ async def redis_streams_consumer():
                 break
             delay = min(REDIS_RETRY_DELAY * (2 ** reconnect_attempts), 60)
             await asyncio.sleep(delay)
+        finally:
+            if pool is not None:
+                await pool.stop()
 
-async def process_stream_message(redis: aioredis.Redis, msg_id: str, fields: dict):
-    """Process message from Redis Stream"""
+async def process_stream_message(redis: aioredis.Redis, msg_id: str, fields: dict, ack: bool = True) -> bool:
+    """Process message from Redis Stream
+    
+    Returns True once the entry is handled (delivered, stored as pending or
+    rejected as invalid). With ``ack=False`` the caller acknowledges it.
+    """
     try:
         user_id = fields.get("user_id", "").strip()
         message_data = fields.get("message", {"content": "Your new recommendations are ready!"})
@@ -357,8 +932,9 @@ async def process_stream_message(redis: aioredis.Redis, msg_id: str, fields: dic
         
         if not user_id or not message_data:
             logger.warning(f"Invalid stream message {msg_id}: {fields}")
-            await redis.xack(NOTIFICATIONS_STREAM, CONSUMER_GROUP, msg_id)
-            return
+            if ack:
+                await redis.xack(NOTIFICATIONS_STREAM, CONSUMER_GROUP, msg_id)
+            return True
         
         try:
             message_content = json.loads(message_data)
@@ -380,12 +956,15 @@ async def process_stream_message(redis: aioredis.Redis, msg_id: str, fields: dic
         else:
             logger.info(f"Stream notification {msg_id} stored as pending for user {user_id}")
         
-        await redis.xack(NOTIFICATIONS_STREAM, CONSUMER_GROUP, msg_id)
+        if ack:
+            await redis.xack(NOTIFICATIONS_STREAM, CONSUMER_GROUP, msg_id)
+        return True
     except Exception as e:
         logger.error(f"Error processing stream message {msg_id}: {e}")
+        return False
 
 async def instance_fanout_listener():
-    """Listen for fanout messages directed to this instance"""
+    """Listen for fanout messages directed to this instance and routing broadcasts"""
     instance_channel = f"{INSTANCE_CHANNEL_PREFIX}:{INSTANCE_ID}"
     reconnect_attempts = 0
     
@@ -393,13 +972,18 @@ async def instance_fanout_listener():
         try:
             redis = manager.redis
             pubsub = redis.pubsub()
-            await pubsub.subscribe(instance_channel)
-            logger.info(f"Instance fanout listener subscribed to {instance_channel}")
+            await pubsub.subscribe(instance_channel, CONTROL_CHANNEL)
+            # Route events may have been missed while unsubscribed
+            manager.routes.clear()
+            logger.info(f"Instance fanout listener subscribed to {instance_channel} and {CONTROL_CHANNEL}")
             reconnect_attempts = 0
             
             async for message in pubsub.listen():
                 if message and message.get("type") == "message":
-                    await process_fanout_message(message)
+                    if message.get("channel") == CONTROL_CHANNEL:
+                        process_control_message(message)
+                    else:
+                        await process_fanout_message(message)
         except asyncio.CancelledError:
             logger.info("Instance fanout listener cancelled")
             break
@@ -414,15 +998,53 @@ async def instance_fanout_listener():
         finally:
             try:
                 if 'pubsub' in locals():
-                    await pubsub.unsubscribe(instance_channel)
+                    await pubsub.unsubscribe(instance_channel, CONTROL_CHANNEL)
                     await pubsub.close()
             except Exception as e:
                 logger.warning(f"Error closing fanout pubsub: {e}")
 
+def process_control_message(message: dict):
+    """Apply a connect/disconnect broadcast to the local routing table"""
+    try:
+        manager.routes.apply_event(json.loads(message.get("data", "{}")))
+    except (json.JSONDecodeError, TypeError, AttributeError) as e:
+        logger.warning(f"Invalid control message: {e}")
+
+async def deliver_fanout_batch(data: dict) -> int:
+    """Deliver a ``fanout_batch`` frame: users in parallel, each user's messages in order"""
+    by_user: Dict[str, List[dict]] = {}
+    for entry in data.get("messages") or []:
+        user_id = entry.get("user_id") if isinstance(entry, dict) else None
+        if not user_id or not entry.get("message"):
+            logger.warning(f"Invalid fanout batch entry: {entry}")
+            continue
+        by_user.setdefault(user_id, []).append(entry["message"])
+    
+    async def deliver_user(user_id: str, messages: List[dict]) -> int:
+        delivered = 0
+        for notification_message in messages:
+            if not await manager.send_message_local(user_id, notification_message):
+                logger.warning(f"Failed to deliver fanout message to user {user_id} - user not locally connected, storing as pending")
+                await manager.store_undelivered_fanout(user_id, messages[delivered:])
+                break
+            delivered += 1
+        return delivered
+    
+    results = await asyncio.gather(*(deliver_user(user_id, messages) for user_id, messages in by_user.items()))
+    delivered = sum(results)
+    logger.info(
+        f"Fanout batch from instance {data.get('source_instance')}: "
+        f"delivered {delivered} messages to {len(by_user)} local users"
+    )
+    return delivered
+
 async def process_fanout_message(message: dict):
     """Process fanout message for local delivery"""
     try:
         data = json.loads(message.get("data", "{}"))
+        if data.get("type") == "fanout_batch":
+            await deliver_fanout_batch(data)
+            return
         if data.get("type") != "fanout":
             return
         
@@ -438,44 +1060,202 @@ async def process_fanout_message(message: dict):
         if success:
             logger.info(f"Fanout message delivered to local user {user_id} from instance {source_instance}")
         else:
-            logger.warning(f"Failed to deliver fanout message to user {user_id} - user not locally connected")
+            logger.warning(f"Failed to deliver fanout message to user {user_id} - user not locally connected, storing as pending")
+            await manager.store_undelivered_fanout(user_id, [notification_message])
     except json.JSONDecodeError as e:
         logger.warning(f"Invalid JSON in fanout message: {e}")
     except Exception as e:
         logger.error(f"Error processing fanout message: {e}")
 
-async def heartbeat_task():
-    """Send periodic heartbeat and cleanup stale connections"""
-    while True:
-        try:
-            await asyncio.sleep(HEARTBEAT_INTERVAL)
-            current_time = time.time()
-            disconnected_users = []
-            
-            for user_id in list(manager.last_activity.keys()):
-                if current_time - manager.last_activity.get(user_id, 0) > CLIENT_TIMEOUT:
-                    disconnected_users.append(user_id)
+async def resolve_broadcast_targets(fields: dict) -> List[str]:
+    """Local users a broadcast entry is addressed to"""
+    local_users = list(manager.local_connections.keys())
+    if not local_users:
+        return []
+    segment_id = fields.get("segment_id")
+    if segment_id == "all":
+        return local_users
+    if segment_id:
+        matches = await manager.redis.smismember(f"{SEGMENT_PREFIX}{segment_id}", local_users)
+        return [user_id for user_id, member in zip(local_users, matches) if member]
+    wanted = set(json.loads(fields.get("user_ids") or "[]"))
+    return [user_id for user_id in local_users if user_id in wanted]
+
+def broadcast_frame(fields: dict, broadcast_id: str) -> str:
+    """Frame shared by every recipient of a broadcast entry (without ``user_id``)"""
+    try:
+        message_content = json.loads(fields.get("message", ""))
+    except json.JSONDecodeError:
+        message_content = {"content": fields.get("message")}
+    return encode_frame({
+        "message": message_content,
+        "timestamp": fields.get("timestamp") or datetime.utcnow().isoformat(),
+        "type": fields.get("type", "notification"),
+        "notification_id": broadcast_id,
+        "broadcast_id": broadcast_id
+    })
+
+async def store_broadcast_for_offline_users(fields: dict, broadcast_id: str, user_ids: List[str]) -> int:
+    """Keep a broadcast as pending for listed users who are not connected to any instance"""
+    if not user_ids:
+        return 0
+    connections = await manager.redis.hmget(CONNECTIONS_KEY, user_ids)
+    offline = [user_id for user_id, connection in zip(user_ids, connections or []) if not connection]
+    if not offline:
+        return 0
+    stored = await manager.store_pending_many(offline, broadcast_frame(fields, broadcast_id))
+    logger.info(f"Broadcast {broadcast_id} stored as pending for {stored} offline users")
+    return stored
+
+async def process_broadcast_entry(msg_id: str, fields: dict) -> int:
+    """Deliver one broadcast stream entry to matching local users and report the count"""
+    broadcast_id = fields.get("broadcast_id") or msg_id
+    delivered = 0
+    try:
+        targets = await resolve_broadcast_targets(fields)
+        if targets:
+            # Encoded once; each recipient only gets its user_id spliced in
+            frame = broadcast_frame(fields, broadcast_id)
+            semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
             
-            if manager.local_connections:
-                heartbeat_msg = {
-                    "type": "heartbeat",
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "instance_id": INSTANCE_ID
-                }
-                
-                for user_id in list(manager.local_connections.keys()):
-                    if user_id not in disconnected_users:
-                        success = await manager.send_message_local(user_id, heartbeat_msg)
-                        if not success:
-                            disconnected_users.append(user_id)
+            async def deliver(user_id: str) -> bool:
+                async with semaphore:
+                    return await manager.send_message_local(user_id, decorate_frame(frame, user_id=user_id))
             
-            for user_id in disconnected_users:
-                await manager.disconnect(user_id)
+            results = await asyncio.gather(*(deliver(user_id) for user_id in targets))
+            delivered = sum(1 for result in results if result)
+        logger.info(f"Broadcast {broadcast_id} delivered to {delivered}/{len(targets)} local users")
+    except Exception as e:
+        logger.error(f"Error processing broadcast {broadcast_id}: {e}")
+    
+    try:
+        results_key = f"{BROADCAST_RESULTS_PREFIX}{broadcast_id}"
+        pipe = manager.redis.pipeline(transaction=False)
+        pipe.hset(results_key, INSTANCE_ID, delivered)
+        pipe.expire(results_key, BROADCAST_RESULT_TTL)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to report broadcast {broadcast_id} result: {e}")
+    return delivered
+
+# Reported by /health: "starting", "healthy", "unhealthy" (failing, still retrying) or "stopped"
+broadcast_listener_status = {"state": "starting", "consecutive_failures": 0, "last_error": None}
+
+async def broadcast_listener():
+    """Read every broadcast entry (no consumer group: each instance serves its own connections)
+    
+    Failures are retried with capped exponential backoff. After
+    ``BROADCAST_UNHEALTHY_AFTER`` consecutive failures the instance reports
+    itself degraded, and after ``MAX_RECONNECT_ATTEMPTS`` the listener stops.
+    """
+    status = broadcast_listener_status
+    status.update(state="starting", consecutive_failures=0, last_error=None)
+    last_id = None
+    
+    while status["consecutive_failures"] < MAX_RECONNECT_ATTEMPTS:
+        try:
+            redis = manager.redis
+            if last_id is None:
+                latest = await redis.xrevrange(BROADCAST_STREAM, count=1)
+                last_id = latest[0][0] if latest else "0-0"
             
-            if disconnected_users:
-                logger.info(f"Cleaned up {len(disconnected_users)} stale connections")
+            while True:
+                entries = await redis.xread({BROADCAST_STREAM: last_id}, count=STREAM_BATCH_SIZE, block=1000)
+                # Only a completed read proves the connection is back
+                if status["consecutive_failures"] or status["state"] != "healthy":
+                    status.update(state="healthy", consecutive_failures=0, last_error=None)
+                for stream, msgs in entries or []:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        await process_broadcast_entry(msg_id, fields)
+        except asyncio.CancelledError:
+            logger.info("Broadcast listener cancelled")
+            break
+        except Exception as e:
+            status["consecutive_failures"] += 1
+            status["last_error"] = str(e)
+            attempts = status["consecutive_failures"]
+            logger.error(f"Broadcast listener error (attempt {attempts}): {e}")
+            if attempts >= MAX_RECONNECT_ATTEMPTS:
+                status["state"] = "stopped"
+                logger.critical("Max broadcast listener reconnection attempts reached; broadcasts will not be delivered")
+                break
+            if attempts >= BROADCAST_UNHEALTHY_AFTER:
+                status["state"] = "unhealthy"
+            await asyncio.sleep(min(REDIS_RETRY_DELAY * (2 ** attempts), BROADCAST_MAX_BACKOFF))
+
+async def run_heartbeat_tick(now: Optional[float] = None) -> Dict[str, int]:
+    """Visit only connections whose check deadline has passed
+    
+    Connections idle past ``CLIENT_TIMEOUT`` are dropped, ones idle for a
+    heartbeat interval are pinged with bounded concurrency, and recently
+    active ones are simply rescheduled.
+    """
+    now = now or time.time()
+    tracker = manager.idle_tracker
+    timed_out: List[str] = []
+    to_ping: List[str] = []
+    for user_id in tracker.pop_due(now):
+        if user_id not in manager.local_connections:
+            continue
+        last_activity = manager.last_activity.get(user_id, 0)
+        if now - last_activity > CLIENT_TIMEOUT:
+            timed_out.append(user_id)
+        elif now - last_activity >= HEARTBEAT_INTERVAL:
+            to_ping.append(user_id)
+        else:
+            tracker.schedule(user_id, last_activity + HEARTBEAT_INTERVAL)
+    
+    if to_ping:
+        heartbeat_frame = encode_frame({
+            "type": "heartbeat",
+            "timestamp": datetime.utcnow().isoformat(),
+            "instance_id": INSTANCE_ID
+        })
+        semaphore = asyncio.Semaphore(HEARTBEAT_CONCURRENCY)
+        
+        async def ping(user_id: str) -> bool:
+            async with semaphore:
+                return await manager.send_message_local(user_id, heartbeat_frame)
+        
+        results = await asyncio.gather(*(ping(user_id) for user_id in to_ping))
+        for user_id, success in zip(to_ping, results):
+            if success:
+                tracker.schedule(user_id, now + HEARTBEAT_INTERVAL)
+            else:
+                timed_out.append(user_id)
+    
+    for user_id in timed_out:
+        await manager.disconnect(user_id)
+    
+    if timed_out:
+        logger.info(f"Cleaned up {len(timed_out)} stale connections")
+    return {"pinged": len(to_ping), "disconnected": len(timed_out)}
+
+async def acquire_sweep_leadership() -> bool:
+    """Hold a short lease so only one instance sweeps the global connections hash"""
+    redis = manager.redis
+    ttl = max(int(STALE_SWEEP_INTERVAL * 2), 1)
+    if await redis.set(SWEEP_LEADER_KEY, INSTANCE_ID, nx=True, ex=ttl):
+        return True
+    leader = await redis.get(SWEEP_LEADER_KEY)
+    if (leader.decode() if isinstance(leader, bytes) else leader) == INSTANCE_ID:
+        await redis.expire(SWEEP_LEADER_KEY, ttl)
+        return True
+    return False
+
+async def heartbeat_task():
+    """Heartbeat idle connections as their deadlines pass; the sweep leader also cleans Redis"""
+    next_sweep = 0.0
+    while True:
+        try:
+            await asyncio.sleep(HEARTBEAT_TICK)
+            await run_heartbeat_tick()
             
-            await cleanup_stale_connections()
+            if time.time() >= next_sweep:
+                next_sweep = time.time() + STALE_SWEEP_INTERVAL
+                if await acquire_sweep_leadership():
+                    await cleanup_stale_connections()
         except asyncio.CancelledError:
             logger.info("Heartbeat task cancelled")
             break
@@ -504,17 +1284,176 @@ async def cleanup_stale_connections():
     except Exception as e:
         logger.error(f"Error cleaning up stale connections: {e}")
 
+class ConsistentHashRing:
+    """Maps keys onto instances; adding or removing an instance only moves its share"""
+    
+    def __init__(self, nodes, replicas: int = HASH_RING_REPLICAS):
+        self.nodes = tuple(sorted(set(nodes)))
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(max(1, replicas))
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+    
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+    
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+class PendingRetryScheduler:
+    """Retries pending notifications for the offline users owned by this instance
+    
+    The retry schedule is split into ``PENDING_DUE_PARTITIONS`` due ZSETs
+    (scored by next attempt time) and live instances, registered in
+    ``INSTANCES_KEY``, split the partitions with a consistent hash ring. A tick
+    reads only the due entries of this instance's own partitions instead of
+    paging through everyone else's. Only the sweep leader reconciles the
+    pending-users set against the schedule, so that scan runs once per
+    interval across the deployment.
+    """
+    
+    def __init__(self, connection_manager: DistributedConnectionManager, instance_id: str = INSTANCE_ID):
+        self.manager = connection_manager
+        self.instance_id = instance_id
+        self.ring = ConsistentHashRing([instance_id])
+        self._next_partition = 0
+        self.last_reconcile = 0.0
+        self._semaphore = asyncio.Semaphore(PENDING_RETRY_CONCURRENCY)
+        self.stats = {"ticks": 0, "retried_users": 0, "delivered": 0, "reconciled_users": 0}
+    
+    @staticmethod
+    def _as_str(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+    
+    @property
+    def ring(self) -> ConsistentHashRing:
+        return self._ring
+    
+    @ring.setter
+    def ring(self, ring: ConsistentHashRing):
+        self._ring = ring
+        self.partitions = [
+            partition for partition in range(PENDING_DUE_PARTITIONS)
+            if ring.owner(str(partition)) == self.instance_id
+        ]
+    
+    def owns(self, user_id: str) -> bool:
+        return self.ring.owner(str(pending_due_partition(user_id))) == self.instance_id
+    
+    async def refresh_membership(self):
+        """Heartbeat this instance and rebuild the ring when membership changes"""
+        now = time.time()
+        pipe = self.manager.redis.pipeline(transaction=False)
+        pipe.zadd(INSTANCES_KEY, {self.instance_id: now})
+        pipe.zremrangebyscore(INSTANCES_KEY, "-inf", now - INSTANCE_TTL)
+        pipe.zrange(INSTANCES_KEY, 0, -1)
+        _, _, members = await pipe.execute()
+        nodes = {self._as_str(member) for member in members or []} | {self.instance_id}
+        if nodes != set(self.ring.nodes):
+            self.ring = ConsistentHashRing(nodes)
+            logger.info(f"Pending retry ring rebuilt with {len(nodes)} instances")
+    
+    async def reconcile(self):
+        """SSCAN pending users page by page and schedule any missing from their partition's due set"""
+        redis = self.manager.redis
+        now = time.time()
+        cursor = 0
+        while True:
+            cursor, users = await redis.sscan(PENDING_USERS_KEY, cursor=cursor, count=PENDING_SCAN_COUNT)
+            by_partition: Dict[int, Dict[str, float]] = {}
+            for user_id in map(self._as_str, users):
+                by_partition.setdefault(pending_due_partition(user_id), {})[user_id] = now
+            if by_partition:
+                pipe = redis.pipeline(transaction=False)
+                for partition, entries in by_partition.items():
+                    pipe.zadd(pending_due_key(partition), entries, nx=True)
+                await pipe.execute()
+                self.stats["reconciled_users"] += sum(len(entries) for entries in by_partition.values())
+            if int(cursor) == 0:
+                break
+        self.last_reconcile = time.time()
+    
+    async def claim_due(self) -> List[str]:
+        """Collect due users from this instance's partitions and push their next attempt forward"""
+        if not self.partitions:
+            return []
+        redis = self.manager.redis
+        now = time.time()
+        # Rotate the starting partition so a capped batch does not starve the later ones
+        start = self._next_partition % len(self.partitions)
+        partitions = self.partitions[start:] + self.partitions[:start]
+        self._next_partition = start + 1
+        
+        pipe = redis.pipeline(transaction=False)
+        for partition in partitions:
+            pipe.zrangebyscore(pending_due_key(partition), "-inf", now, start=0, num=PENDING_SCAN_COUNT)
+        pages = await pipe.execute()
+        
+        claimed: Dict[int, List[str]] = {}
+        total = 0
+        for partition, page in zip(partitions, pages):
+            users = [self._as_str(user_id) for user_id in (page or [])[:PENDING_RETRY_BATCH - total]]
+            if users:
+                claimed[partition] = users
+                total += len(users)
+            if total >= PENDING_RETRY_BATCH:
+                break
+        if claimed:
+            # A retry that fails outright is picked up again next interval, not next tick
+            pipe = redis.pipeline(transaction=False)
+            for partition, users in claimed.items():
+                pipe.zadd(pending_due_key(partition), {user_id: now + PENDING_RETRY_INTERVAL for user_id in users}, xx=True)
+            await pipe.execute()
+        return [user_id for users in claimed.values() for user_id in users]
+    
+    async def _retry(self, user_id: str) -> int:
+        async with self._semaphore:
+            return await self.manager.retry_pending_for_user(user_id)
+    
+    async def run_once(self) -> int:
+        """One scheduler tick; returns the number of notifications delivered"""
+        self.stats["ticks"] += 1
+        await self.refresh_membership()
+        if time.time() - self.last_reconcile >= PENDING_RECONCILE_INTERVAL:
+            # Non-leaders wait a full interval before checking again
+            self.last_reconcile = time.time()
+            if await acquire_sweep_leadership():
+                await self.reconcile()
+        users = await self.claim_due()
+        if not users:
+            return 0
+        results = await asyncio.gather(*(self._retry(user_id) for user_id in users), return_exceptions=True)
+        delivered = sum(result for result in results if isinstance(result, int))
+        self.stats["retried_users"] += len(users)
+        self.stats["delivered"] += delivered
+        logger.info(f"Retried pending notifications for {len(users)} users, delivered {delivered}")
+        return delivered
+    
+    def get_stats(self) -> Dict:
+        return {
+            "instance_id": self.instance_id,
+            "ring_instances": list(self.ring.nodes),
+            "owned_partitions": len(self.partitions),
+            **self.stats
+        }
+
+retry_scheduler: Optional[PendingRetryScheduler] = None
+
 async def retry_pending_task():
-    """Periodically retry pending notifications for all users with pendings"""
+    """Periodically retry due pending notifications for the users this instance owns"""
+    global retry_scheduler
+    retry_scheduler = PendingRetryScheduler(manager)
     while True:
         try:
-            await asyncio.sleep(PENDING_RETRY_INTERVAL)
-            redis = manager.redis
-            users = await redis.smembers(PENDING_USERS_KEY)
-            
-            for user_id_bytes in users:
-                user_id = user_id_bytes.decode() if isinstance(user_id_bytes, bytes) else user_id_bytes
-                await manager.retry_pending_for_user(user_id)
+            await asyncio.sleep(PENDING_SCHEDULER_INTERVAL)
+            await retry_scheduler.run_once()
         except asyncio.CancelledError:
             logger.info("Retry pending task cancelled")
             break
@@ -522,6 +1461,29 @@ async def retry_pending_task():
             logger.error(f"Error in retry pending task: {e}")
 
 
+async def process_pubsub_notification(data: dict):
+    """Deliver a notifications:user payload; ``notification_batch`` names several users."""
+    # Accept either string or object for message content
+    msg = data.get("message", {"content": "Your new recommendations are ready!"})
+    msg = msg if isinstance(msg, dict) else {"content": str(msg)}
+    if data.get("type") == "notification_batch":
+        user_ids = [str(user_id).strip() for user_id in data.get("user_ids") or []]
+        notification_type = "notification"
+    else:
+        user_ids = [str(data.get("user_id", "")).strip()]
+        notification_type = data.get("type", "notification")
+    timestamp = datetime.utcnow().isoformat()
+    await asyncio.gather(*(
+        manager.send_message_distributed(user_id, {
+            "type": notification_type,
+            "user_id": user_id,
+            "message": msg,
+            "timestamp": timestamp,
+        })
+        for user_id in user_ids if user_id
+    ))
+
+
 async def pubsub_notifications_listener():
     """Subscribe to simple Pub/Sub channel notifications:user and forward messages."""
     reconnect_attempts = 0
@@ -537,17 +1499,7 @@ async def pubsub_notifications_listener():
                 if message and message.get("type") == "message":
                     try:
                         data = json.loads(message.get("data", "{}"))
-                        user_id = str(data.get("user_id", "")).strip()
-                        # Accept either string or object for message content
-                        msg = data.get("message", {"content": "Your new recommendations are ready!"})
-                        notification = {
-                            "type": data.get("type", "notification"),
-                            "user_id": user_id,
-                            "message": msg if isinstance(msg, dict) else {"content": str(msg)},
-                            "timestamp": datetime.utcnow().isoformat(),
-                        }
-                        if user_id:
-                            await manager.send_message_distributed(user_id, notification)
+                        await process_pubsub_notification(data)
                     except Exception as e:
                         logger.warning(f"Invalid pubsub payload on {channel}: {e}")
         except asyncio.CancelledError:
@@ -583,6 +1535,7 @@ async def lifespan(app: FastAPI):
         asyncio.create_task(redis_streams_consumer()),
         asyncio.create_task(instance_fanout_listener()),
         asyncio.create_task(pubsub_notifications_listener()),
+        asyncio.create_task(broadcast_listener()),
         asyncio.create_task(heartbeat_task()),
         asyncio.create_task(retry_pending_task())
     ]
@@ -623,6 +1576,11 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"Error draining stream during shutdown: {e}")
         
+        try:
+            await manager.fanout_batcher.flush_all()
+        except Exception as e:
+            logger.warning(f"Error flushing fanout batches during shutdown: {e}")
+        
         try:
             all_connections = {}
             async for user_id, conn_data in redis.hscan_iter(CONNECTIONS_KEY):
@@ -634,6 +1592,8 @@ async def lifespan(app: FastAPI):
             if instance_users:
                 await redis.hdel(CONNECTIONS_KEY, *instance_users)
                 logger.info(f"Cleaned up {len(instance_users)} connections for instance {INSTANCE_ID}")
+            # Leave the retry ring so the remaining instances take over our users
+            await redis.zrem(INSTANCES_KEY, INSTANCE_ID)
             await redis.close()
             await redis_pool.disconnect()
         except Exception as e:
@@ -755,13 +1715,15 @@ async def health_check():
         group_status = "unavailable"
     
     local_info = manager.get_local_connection_info()
+    broadcast_ok = broadcast_listener_status["state"] in ("starting", "healthy")
     return JSONResponse({
-        "status": "healthy" if redis_status == "healthy" else "degraded",
+        "status": "healthy" if redis_status == "healthy" and broadcast_ok else "degraded",
         "instance_id": INSTANCE_ID,
         "timestamp": datetime.utcnow().isoformat(),
         "redis": redis_status,
         "redis_stream": stream_status,
         "consumer_group": group_status,
+        "broadcast_listener": dict(broadcast_listener_status),
         "local_connections": local_info,
         "version": "3.1.0"
     })
@@ -803,6 +1765,9 @@ async def get_distributed_stats():
         "total_users": len(distributed_connections),
         "current_instance": INSTANCE_ID,
         "by_instance": by_instance,
+        "pending_retry": retry_scheduler.get_stats() if retry_scheduler else None,
+        "routing_cache": manager.routes.get_stats(),
+        "fanout_batches": manager.fanout_batcher.get_stats(),
         "timestamp": datetime.utcnow().isoformat()
     })
 
@@ -870,6 +1835,73 @@ async def send_direct_notification(user_id: str, payload: NotificationPayload):
             "error": str(e)
         }, status_code=500)
 
+async def collect_broadcast_results(broadcast_id: str, wait_ms: int) -> Dict:
+    """Wait up to ``wait_ms`` for every live instance to report its delivery count"""
+    redis = manager.redis
+    results_key = f"{BROADCAST_RESULTS_PREFIX}{broadcast_id}"
+    live = await redis.zrangebyscore(INSTANCES_KEY, time.time() - INSTANCE_TTL, "+inf")
+    expected = {member.decode() if isinstance(member, bytes) else member for member in live or []} | {INSTANCE_ID}
+    deadline = time.monotonic() + max(0, wait_ms) / 1000
+    while True:
+        reported = await redis.hgetall(results_key) or {}
+        by_instance = {instance_id: int(count) for instance_id, count in reported.items()}
+        if expected <= set(by_instance) or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(0.05)
+    return {
+        "delivered_total": sum(by_instance.values()),
+        "by_instance": by_instance,
+        "pending_instances": sorted(expected - set(by_instance))
+    }
+
+@app.post("/notify/broadcast")
+async def send_broadcast_notification(payload: BroadcastPayload):
+    """Notify a user list or segment with one stream entry; every instance delivers to its own connections"""
+    try:
+        if bool(payload.user_ids) == bool(payload.segment_id):
+            raise HTTPException(status_code=422, detail="Provide exactly one of user_ids or segment_id")
+        if payload.user_ids and len(payload.user_ids) > BROADCAST_MAX_USERS:
+            raise HTTPException(status_code=413, detail="Too many users")
+        message_json = json.dumps(payload.message)
+        if len(message_json) > MAX_MESSAGE_SIZE:
+            raise HTTPException(status_code=413, detail="Message too large")
+        
+        broadcast_id = str(uuid.uuid4())
+        entry = {
+            "broadcast_id": broadcast_id,
+            "message": message_json,
+            "type": payload.type,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if payload.segment_id:
+            entry["segment_id"] = payload.segment_id
+        else:
+            entry["user_ids"] = json.dumps(sorted(set(payload.user_ids)))
+        
+        stream_id = await manager.redis.xadd(
+            BROADCAST_STREAM, entry, maxlen=BROADCAST_STREAM_MAXLEN, approximate=True
+        )
+        stored_pending = 0
+        if payload.user_ids:
+            stored_pending = await store_broadcast_for_offline_users(entry, broadcast_id, sorted(set(payload.user_ids)))
+        results = await collect_broadcast_results(broadcast_id, payload.wait_ms)
+        return JSONResponse({
+            "success": True,
+            "broadcast_id": broadcast_id,
+            "stream_id": stream_id,
+            "delivery_method": "redis_stream_broadcast",
+            "stored_pending": stored_pending,
+            **results
+        })
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error sending broadcast notification: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=500)
+
 if ENABLE_DEBUG:
     @app.get("/debug/pending/{user_id}")
     async def debug_list_pending(user_id: str):
@@ -892,6 +1924,7 @@ if __name__ == "__main__":
         port=9000,
         reload=False, # Set to True if you want auto-reload in development(always False in production)
         log_level="info",
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
         ssl_keyfile=ssl_keyfile if ssl_keyfile and ssl_certfile else None,
         ssl_certfile=ssl_certfile if ssl_keyfile and ssl_certfile else None
     )
\ No newline at end of file
@@ -56,6 +56,26 @@ def check_celery_app_exists(root_dir):
         print(f"❌ Failed to import Celery app: {e}")
         return False
 
+def celery_worker_command(root_dir, queues, hostname, extra_args=""):
+    """Command line for a Celery worker consuming ``queues``."""
+    return (
+        f"cd {root_dir} && "
+        "celery -A app.workers.celery_app worker "
+        "--loglevel=info "
+        f"{extra_args}"
+        f"--queues={queues} "
+        f"--hostname={hostname}@%h "
+        "--prefetch-multiplier=1 "
+        "--without-gossip "
+        "--without-mingle "
+        "--without-heartbeat "
+        "--pool=prefork "
+        "--max-tasks-per-child=1000 "
+        "--time-limit=300 "
+        "--soft-time-limit=240 "
+        "--max-memory-per-child=200000"
+    )
+
 def main():
     # Get project root
     root_dir = os.getcwd()
@@ -98,37 +118,43 @@ def main():
     run_command(f"RABBITMQ_NODE_PORT=5672 {rabbitmq_server} -detached", env=env)
     time.sleep(5)  # Give RabbitMQ time to start
 
-    # --- Start Celery Worker ---
+    # --- Start Celery Workers ---
+    # Interactive (API-triggered) refreshes, scheduled bulk batches and
+    # maintenance each get their own worker so none queues behind another.
+    # No --concurrency: the celeryd_init hook sizes each one from its
+    # CELERY_*_CONCURRENCY setting (or the async-mode in-flight limit)
+    from app.workers.celery_app import INTERACTIVE_QUEUE, BULK_QUEUE, MAINTENANCE_QUEUE, queue_concurrency
+    workers = []
+    for label, queue, hostname in (
+        ("Interactive Celery Worker", INTERACTIVE_QUEUE, "interactive"),
+        ("Bulk Refresh Celery Worker", BULK_QUEUE, "bulk"),
+        ("Maintenance Celery Worker", MAINTENANCE_QUEUE, "maintenance"),
+    ):
+        print(f"⚙️ Starting {label} (concurrency {queue_concurrency(queue)})...")
+        worker = run_command(celery_worker_command(root_dir, queue, hostname), cwd=root_dir, background=True, env=env)
+        print(f"📝 {label} PID: {worker.pid}")
+        workers.append((label, worker))
+
     print("⚙️ Starting Celery Worker...")
-    # Use the correct import path - app.workers.celery_app
-    worker_cmd = (
-        f"cd {root_dir} && "
-        "celery -A app.workers.celery_app worker "  # Changed from workers.celery_app to app.workers.celery_app
-        "--loglevel=info "
-        "--concurrency=4 "
-        "--queues=user_processing,user_processing_alt "
-        "--hostname=worker_alt@%h "
-        "--prefetch-multiplier=1 "
-        "--without-gossip "
-        "--without-mingle "
-        "--without-heartbeat "
-        "--pool=prefork "
-        "--max-tasks-per-child=1000 "
-        "--time-limit=300 "
-        "--soft-time-limit=240 "
-        "--autoscale=1,10 "
-        "--max-memory-per-child=200000"
+    # Legacy default queues
+    worker_cmd = celery_worker_command(
+        root_dir,
+        "user_processing,user_processing_alt",
+        "worker_alt",
+        extra_args="--concurrency=4 --autoscale=1,10 "
     )
     celery_worker = run_command(worker_cmd, cwd=root_dir, background=True, env=env)
     print(f"📝 Celery Worker PID: {celery_worker.pid}")
+    workers.append(("Celery Worker", celery_worker))
     
     # Capture and log stderr for debugging
     time.sleep(2)
-    if celery_worker.poll() is not None:
-        stdout, stderr = celery_worker.communicate()
-        print(f"❌ Celery Worker failed to start. Error: {stderr}")
-    else:
-        print("✅ Celery Worker started successfully")
+    for label, worker in workers:
+        if worker.poll() is not None:
+            stdout, stderr = worker.communicate()
+            print(f"❌ {label} failed to start. Error: {stderr}")
+        else:
+            print(f"✅ {label} started successfully")
 
     # --- Start Celery Beat ---
     print("⏰ Starting Celery Beat...")
@@ -9,6 +9,11 @@ from typing import Dict, Any, Generator
 import json
 import os
 import sys
+import tempfile
+
+# Keep the suite's item vectors out of the shared default /tmp/portal_engine path
+os.environ.setdefault("ITEM_VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="portal_engine_item_vectors_"))
+
 from app.api.dependencies import (
     get_user_profile_service,
     get_lie_service,
@@ -388,6 +393,15 @@ def setup_test_environment():
             del os.environ[key]
 
 
+@pytest.fixture(autouse=True)
+def reset_http_client_registry():
+    """Drop pooled HTTP clients so each test sees its own patched httpx client."""
+    from app.services.http_client import http_client_registry
+    http_client_registry._clients.clear()
+    yield
+    http_client_registry._clients.clear()
+
+
 # Database and external service mocking
 @pytest.fixture(autouse=True)
 def mock_external_services():
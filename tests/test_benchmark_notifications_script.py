@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import benchmark_notifications
+
+
+def test_percentile_interpolates():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert benchmark_notifications.percentile(values, 0) == 1.0
+    assert benchmark_notifications.percentile(values, 50) == 2.5
+    assert benchmark_notifications.percentile(values, 100) == 4.0
+    assert benchmark_notifications.percentile([], 99) == 0.0
+
+
+def test_summarize_latencies_reports_milliseconds():
+    summary = benchmark_notifications.summarize_latencies([0.001, 0.002, 0.003])
+    assert summary["count"] == 3
+    assert summary["p50_ms"] == 2.0
+    assert summary["max_ms"] == 3.0
+    assert summary["mean_ms"] == 2.0
+    assert benchmark_notifications.summarize_latencies([])["count"] == 0
+
+
+def test_rss_bytes_unknown_pid_is_zero():
+    assert benchmark_notifications.rss_bytes(-1) == 0
+
+
+def test_delivery_report_counts_lost_and_duplicates():
+    client = benchmark_notifications.BenchClient("u1", "ws://localhost")
+    client.received = {"a": 10.5, "b": 11.0}
+    client.duplicates = 2
+    sent = {"a": ("u1", 10.0), "b": ("u1", 10.0), "c": ("u1", 10.0)}
+    report = benchmark_notifications.delivery_report({"u1": client}, sent)
+    assert report["sent"] == 3
+    assert report["delivered"] == 2
+    assert report["lost"] == 1
+    assert report["duplicates"] == 2
+    assert report["throughput_msgs_per_s"] == 2.0
+    assert report["latency"]["max_ms"] == 1000.0
+
+
+def test_main_writes_json_report(monkeypatch, tmp_path):
+    async def fake_run(args):
+        return {"benchmark": "notification_service", "clients": args.clients}
+
+    monkeypatch.setattr(benchmark_notifications, "run_benchmark", fake_run)
+    monkeypatch.setattr(benchmark_notifications, "WEBSOCKETS_AVAILABLE", True)
+    output = tmp_path / "report.json"
+    assert benchmark_notifications.main(["--clients", "7", "--output", str(output)]) == 0
+    assert json.loads(output.read_text()) == {"benchmark": "notification_service", "clients": 7}
+
+
+def test_main_requires_websockets(monkeypatch):
+    monkeypatch.setattr(benchmark_notifications, "WEBSOCKETS_AVAILABLE", False)
+    assert benchmark_notifications.main([]) == 1
@@ -20,17 +20,36 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from notification_service import (
     app,
     DistributedConnectionManager,
+    encode_frame,
+    decorate_frame,
     NotificationPayload,
     PendingNotification,
     setup_redis_streams,
     redis_streams_consumer,
     process_stream_message,
+    StreamWorkerPool,
+    claim_stale_stream_entries,
     instance_fanout_listener,
     process_fanout_message,
+    process_control_message,
+    RoutingTable,
+    FanoutBatcher,
+    BroadcastPayload,
+    process_broadcast_entry,
+    broadcast_listener,
+    broadcast_listener_status,
     heartbeat_task,
+    run_heartbeat_tick,
+    acquire_sweep_leadership,
+    IdleTracker,
     cleanup_stale_connections,
     retry_pending_task,
+    ConsistentHashRing,
+    PendingRetryScheduler,
+    pending_due_key,
+    pending_due_partition,
     pubsub_notifications_listener,
+    process_pubsub_notification,
     lifespan,
     websocket_endpoint,
     health_check,
@@ -42,17 +61,28 @@ from notification_service import (
     REDIS_HOST,
     REDIS_PORT,
     NOTIFICATIONS_STREAM,
+    BROADCAST_MAX_WAIT_MS,
+    BROADCAST_STREAM,
+    BROADCAST_RESULTS_PREFIX,
+    SEGMENT_PREFIX,
     INSTANCE_CHANNEL_PREFIX,
+    CONTROL_CHANNEL,
     CONNECTIONS_KEY,
+    SWEEP_LEADER_KEY,
     PENDING_NOTIFICATIONS_PREFIX,
     PENDING_USERS_KEY,
+    PENDING_DUE_PARTITIONS,
+    INSTANCES_KEY,
     DEAD_LETTER_KEY,
     CONSUMER_GROUP,
+    STREAM_BATCH_SIZE,
+    STREAM_CLAIM_IDLE_MS,
     HEARTBEAT_INTERVAL,
     CLIENT_TIMEOUT,
     MESSAGE_TTL_HOURS,
     MAX_PENDING_MESSAGES,
     PENDING_RETRY_INTERVAL,
+    PENDING_REPLAY_BATCH_SIZE,
     MAX_MESSAGE_SIZE,
     ENABLE_DEBUG,
     MAX_RECONNECT_ATTEMPTS,
@@ -94,12 +124,20 @@ def mock_redis():
     redis.xadd = AsyncMock(return_value="test_stream_id")
     redis.xreadgroup = AsyncMock(return_value=[])
     redis.xack = AsyncMock(return_value=1)
+    redis.xautoclaim = AsyncMock(return_value=["0-0", [], []])
     redis.xinfo_stream = AsyncMock(return_value={"length": 0})
     redis.xinfo_groups = AsyncMock(return_value=[])
     redis.xgroup_create = AsyncMock(return_value="OK")
     redis.lpush = AsyncMock(return_value=1)
     redis.close = AsyncMock()
     
+    # Pipelined / scripted pending store
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[1, True, 1, 0])
+    redis.pipeline = Mock(return_value=pipe)
+    redis.pending_ack = AsyncMock(return_value=0)
+    redis.register_script = Mock(return_value=redis.pending_ack)
+    
     # PubSub operations
     mock_pubsub = AsyncMock()
     mock_pubsub.subscribe = AsyncMock()
@@ -111,12 +149,20 @@ def mock_redis():
     return redis
 
 
+def pending_ack_call(redis):
+    """Return (keys, args) of the single pending-ack script call."""
+    redis.pending_ack.assert_awaited_once()
+    kwargs = redis.pending_ack.call_args.kwargs
+    return kwargs["keys"], kwargs["args"]
+
+
 @pytest.fixture
 def mock_websocket():
     """Mock WebSocket connection."""
     websocket = Mock(spec=WebSocket)
     websocket.accept = AsyncMock()
     websocket.send_json = AsyncMock()
+    websocket.send_text = AsyncMock()
     websocket.receive_text = AsyncMock()
     websocket.close = AsyncMock()
     return websocket
@@ -153,6 +199,38 @@ def sample_pending_notification():
     )
 
 
+class TestFrames:
+    """Test pre-serialised WebSocket frames."""
+    
+    def test_encode_frame_matches_json(self):
+        message = {"content": "café", "n": 1, "nested": {"a": [1, 2]}, 5: "int key"}
+        assert json.loads(encode_frame(message)) == {"content": "café", "n": 1, "nested": {"a": [1, 2]}, "5": "int key"}
+    
+    @pytest.mark.parametrize("orjson_available", [True, False])
+    def test_decorate_frame_splices_fields(self, orjson_available):
+        with patch('notification_service._ORJSON_AVAILABLE', orjson_available):
+            frame = encode_frame({"content": "m", "meta": {"k": "}"}})
+            decorated = decorate_frame(frame, is_pending=True, original_timestamp="t")
+            assert json.loads(decorated) == {"content": "m", "meta": {"k": "}"}, "is_pending": True, "original_timestamp": "t"}
+            assert json.loads(decorate_frame(encode_frame({}), user_id="u1")) == {"user_id": "u1"}
+        # Frames that are not objects, or no fields, pass through untouched
+        assert decorate_frame('"text"', user_id="u1") == '"text"'
+        assert decorate_frame(frame) == frame
+    
+    def test_decorate_frame_replaces_existing_keys(self):
+        frame = encode_frame({"content": "m", "user_id": "old", "nested": {"is_pending": 1}})
+        decorated = decorate_frame(frame, user_id="u1", is_pending=True)
+        assert decorated.count('"user_id"') == 1
+        assert json.loads(decorated) == {"content": "m", "user_id": "u1", "nested": {"is_pending": 1}, "is_pending": True}
+    
+    @pytest.mark.asyncio
+    async def test_send_message_local_sends_prebuilt_frame(self, connection_manager, mock_websocket):
+        connection_manager.local_connections["u1"] = mock_websocket
+        frame = encode_frame({"content": "m"})
+        assert await connection_manager.send_message_local("u1", frame) is True
+        mock_websocket.send_text.assert_awaited_once_with(frame)
+
+
 class TestNotificationPayload:
     """Test NotificationPayload model."""
     
@@ -286,7 +364,8 @@ class TestDistributedConnectionManager:
         result = await connection_manager.send_message_local(user_id, message)
         
         assert result is True
-        mock_websocket.send_json.assert_called_once_with(message)
+        mock_websocket.send_text.assert_called_once()
+        assert json.loads(mock_websocket.send_text.call_args.args[0]) == message
         assert user_id in connection_manager.last_activity
     
     @pytest.mark.asyncio
@@ -305,7 +384,7 @@ class TestDistributedConnectionManager:
         user_id = "test_user_1"
         message = {"content": "Test message"}
         connection_manager.local_connections[user_id] = mock_websocket
-        mock_websocket.send_json.side_effect = Exception("Send failed")
+        mock_websocket.send_text.side_effect = Exception("Send failed")
         
         with patch.object(connection_manager, 'disconnect', new_callable=AsyncMock) as mock_disconnect:
             result = await connection_manager.send_message_local(user_id, message)
@@ -348,6 +427,52 @@ class TestDistributedConnectionManager:
             mock_send_local.assert_called_once_with(user_id, message)
             connection_manager.redis.publish.assert_called_once()
     
+    @pytest.mark.asyncio
+    async def test_send_message_distributed_uses_routing_cache(self, connection_manager):
+        """A cached route skips the HGET; the HGET result is cached for next time."""
+        user_id = "test_user_1"
+        connection_manager.redis.hget.return_value = json.dumps({"instance_id": "remote_instance"})
+        
+        with patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=False):
+            assert await connection_manager.send_message_distributed(user_id, {"content": "1"}) is True
+            assert await connection_manager.send_message_distributed(user_id, {"content": "2"}) is True
+        
+        connection_manager.redis.hget.assert_awaited_once_with(CONNECTIONS_KEY, user_id)
+        channels = [c.args[0] for c in connection_manager.redis.publish.call_args_list]
+        assert channels == [f"{INSTANCE_CHANNEL_PREFIX}:remote_instance"] * 2
+        assert connection_manager.routes.get_stats()["hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_send_message_distributed_stale_route_falls_back(self, connection_manager):
+        """A cached instance with no subscribers is dropped and Redis is consulted."""
+        user_id = "test_user_1"
+        connection_manager.routes.set(user_id, "dead_instance")
+        connection_manager.redis.publish.side_effect = [0, 1]
+        connection_manager.redis.hget.return_value = json.dumps({"instance_id": "new_instance"})
+        
+        with patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=False):
+            result = await connection_manager.send_message_distributed(user_id, {"content": "m"})
+        
+        assert result is True
+        connection_manager.redis.hget.assert_awaited_once()
+        channels = [c.args[0] for c in connection_manager.redis.publish.call_args_list]
+        assert channels == [f"{INSTANCE_CHANNEL_PREFIX}:dead_instance", f"{INSTANCE_CHANNEL_PREFIX}:new_instance"]
+        assert connection_manager.routes.get(user_id) == "new_instance"
+    
+    @pytest.mark.asyncio
+    async def test_connect_disconnect_broadcast_routes(self, connection_manager, mock_websocket):
+        """Connect and disconnect are announced on the control channel."""
+        with patch.object(connection_manager, 'deliver_pending_notifications', new_callable=AsyncMock):
+            await connection_manager.connect(mock_websocket, "test_user_1")
+        await connection_manager.disconnect("test_user_1")
+        
+        events = [json.loads(c.args[1]) for c in connection_manager.redis.publish.call_args_list
+                  if c.args[0] == CONTROL_CHANNEL]
+        assert [(e["type"], e["user_id"], e["instance_id"]) for e in events] == [
+            ("connect", "test_user_1", INSTANCE_ID),
+            ("disconnect", "test_user_1", INSTANCE_ID)
+        ]
+    
     @pytest.mark.asyncio
     async def test_send_message_distributed_invalid_connection_data(self, connection_manager):
         """Test distributed message sending with invalid connection data."""
@@ -402,10 +527,18 @@ class TestDistributedConnectionManager:
         
         await connection_manager.store_pending_notification(user_id, message)
         
-        connection_manager.redis.zadd.assert_called_once()
-        connection_manager.redis.expire.assert_called_once()
-        connection_manager.redis.sadd.assert_called_once_with(PENDING_USERS_KEY, user_id)
-        connection_manager.redis.zremrangebyrank.assert_called_once()
+        connection_manager.redis.pipeline.assert_called_once_with(transaction=True)
+        pipe = connection_manager.redis.pipeline.return_value
+        assert pipe.zadd.call_count == 2
+        due_call = pipe.zadd.call_args_list[1]
+        assert due_call.args[0] == pending_due_key(pending_due_partition(user_id))
+        assert list(due_call.args[1]) == [user_id]
+        assert due_call.kwargs == {"nx": True}
+        pipe.expire.assert_called_once_with(f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}", MESSAGE_TTL_HOURS * 3600)
+        pipe.sadd.assert_called_once_with(PENDING_USERS_KEY, user_id)
+        pipe.zremrangebyrank.assert_called_once_with(f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}", MAX_PENDING_MESSAGES, -1)
+        pipe.execute.assert_awaited_once()
+        connection_manager.redis.zadd.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_store_pending_notification_with_id(self, connection_manager):
@@ -415,19 +548,56 @@ class TestDistributedConnectionManager:
         
         await connection_manager.store_pending_notification(user_id, message)
         
-        connection_manager.redis.zadd.assert_called_once()
+        pipe = connection_manager.redis.pipeline.return_value
         # Check if custom_id is used
-        call_args = connection_manager.redis.zadd.call_args[0][1]
+        call_args = pipe.zadd.call_args_list[0][0][1]
         member = list(call_args.keys())[0]
         data = json.loads(member)
         assert data["notification_id"] == "custom_id"
     
+    @pytest.mark.asyncio
+    async def test_pending_members_are_replayed_without_re_encoding(self, connection_manager):
+        """The stored member is the exact frame sent on reconnect."""
+        user_id = "test_user_1"
+        await connection_manager.store_pending_notification(user_id, {"content": "hello", "type": "notification"})
+        member = list(connection_manager.redis.pipeline.return_value.zadd.call_args_list[0].args[1])[0]
+        frame = json.loads(member)
+        assert frame["content"] == "hello" and frame["is_pending"] is True
+        assert frame["delivery_attempts"] == 0 and frame["notification_id"] and frame["original_timestamp"]
+        
+        connection_manager.redis.zrange.return_value = [member]
+        with patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=True) as mock_send_local, \
+             patch('notification_service.encode_frame') as mock_encode:
+            await connection_manager.deliver_pending_notifications(user_id)
+        
+        mock_send_local.assert_awaited_once_with(user_id, member)
+        mock_encode.assert_not_called()
+        _, args = pending_ack_call(connection_manager.redis)
+        assert args[3:] == [1, 0, member]
+    
+    @pytest.mark.asyncio
+    async def test_retry_pending_frame_bumps_attempts_in_place(self, connection_manager):
+        """A failed retry of a stored frame replaces its attempt count instead of duplicating it."""
+        user_id = "test_user_1"
+        member = decorate_frame(encode_frame({"content": "hi"}), is_pending=True, delivery_attempts=0, notification_id="n1")
+        connection_manager.redis.zrange.return_value = [member]
+        
+        with patch.object(connection_manager, 'send_message_distributed', new_callable=AsyncMock, return_value=False) as mock_send:
+            assert await connection_manager.retry_pending_for_user(user_id) == 0
+        
+        mock_send.assert_awaited_once_with(user_id, member, store_on_failure=False)
+        _, args = pending_ack_call(connection_manager.redis)
+        old_member, new_member = args[5:]
+        assert old_member == member
+        assert new_member.count('"delivery_attempts"') == 1
+        assert json.loads(new_member) == {"content": "hi", "is_pending": True, "delivery_attempts": 1, "notification_id": "n1"}
+    
     @pytest.mark.asyncio
     async def test_store_pending_notification_redis_failure(self, connection_manager):
         """Test storing pending notification when Redis fails."""
         user_id = "test_user_1"
         message = {"content": "Test pending message"}
-        connection_manager.redis.zadd.side_effect = Exception("Redis error")
+        connection_manager.redis.pipeline.return_value.execute.side_effect = Exception("Redis error")
         
         await connection_manager.store_pending_notification(user_id, message)
         # Should not raise, just log error
@@ -452,10 +622,21 @@ class TestDistributedConnectionManager:
             await connection_manager.deliver_pending_notifications(user_id)
             
             mock_send_local.assert_called_once()
-            call_args = mock_send_local.call_args[0][1]
+            call_args = json.loads(mock_send_local.call_args[0][1])
+            assert call_args["content"] == "Test pending message"
             assert call_args["is_pending"] is True
             assert "original_timestamp" in call_args
-            connection_manager.redis.zrem.assert_called_once()
+            keys, args = pending_ack_call(connection_manager.redis)
+            assert keys == [
+                f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}",
+                PENDING_USERS_KEY,
+                DEAD_LETTER_KEY,
+                pending_due_key(pending_due_partition(user_id))
+            ]
+            assert args[0] == user_id
+            assert args[2] == pytest.approx(args[1] + PENDING_RETRY_INTERVAL)
+            assert args[3:] == [1, 0, pending_data]
+            connection_manager.redis.zrem.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_deliver_pending_notifications_with_invalid(self, connection_manager, mock_websocket):
@@ -476,7 +657,9 @@ class TestDistributedConnectionManager:
             await connection_manager.deliver_pending_notifications(user_id)
             
             mock_send_local.assert_called_once()
-            connection_manager.redis.zrem.assert_called_once_with(f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}", valid_pending)
+            # Undecodable entries are dropped with the delivered batch
+            _, args = pending_ack_call(connection_manager.redis)
+            assert args[3:] == [2, 0, valid_pending, "invalid_json"]
     
     @pytest.mark.asyncio
     async def test_deliver_pending_notifications_send_fail(self, connection_manager, mock_websocket):
@@ -506,7 +689,7 @@ class TestDistributedConnectionManager:
             await connection_manager.deliver_pending_notifications(user_id)
             
             mock_send_local.assert_called_once()  # Only first attempted, break after fail
-            connection_manager.redis.zrem.assert_not_called()
+            connection_manager.redis.pending_ack.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_deliver_pending_notifications_no_pendings(self, connection_manager):
@@ -517,7 +700,7 @@ class TestDistributedConnectionManager:
         await connection_manager.deliver_pending_notifications(user_id)
         
         # Should not call any send methods
-        connection_manager.redis.zrem.assert_not_called()
+        connection_manager.redis.pending_ack.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_deliver_pending_notifications_redis_failure(self, connection_manager):
@@ -528,6 +711,22 @@ class TestDistributedConnectionManager:
         await connection_manager.deliver_pending_notifications(user_id)
         # Should not raise
     
+    @pytest.mark.asyncio
+    async def test_deliver_pending_notifications_batched(self, connection_manager):
+        """Replay reads and acknowledges one batch per round-trip until drained."""
+        user_id = "test_user_1"
+        members = [json.dumps({"user_id": user_id, "message": {"content": str(i)}, "timestamp": "t"}) for i in range(5)]
+        connection_manager.redis.zrange.side_effect = [members[0:2], members[2:4], members[4:]]
+        
+        with patch('notification_service.PENDING_REPLAY_BATCH_SIZE', 2), \
+             patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=True) as mock_send_local:
+            await connection_manager.deliver_pending_notifications(user_id)
+        
+        assert mock_send_local.await_count == 5
+        assert [c.args[1:] for c in connection_manager.redis.zrange.call_args_list] == [(0, 1)] * 3
+        acked = [c.kwargs["args"][5:] for c in connection_manager.redis.pending_ack.call_args_list]
+        assert acked == [members[0:2], members[2:4], members[4:]]
+    
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_success(self, connection_manager, mock_websocket):
         """Test successful retry of pending notifications."""
@@ -549,7 +748,8 @@ class TestDistributedConnectionManager:
             
             assert result == 1
             mock_send_distributed.assert_called_once()
-            connection_manager.redis.zrem.assert_called_once()
+            _, args = pending_ack_call(connection_manager.redis)
+            assert args[3:] == [1, 0, pending_data]
     
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_fail_increment_attempts(self, connection_manager):
@@ -570,13 +770,14 @@ class TestDistributedConnectionManager:
             result = await connection_manager.retry_pending_for_user(user_id)
             
             assert result == 0
-            mock_send_distributed.assert_called_once()
-            connection_manager.redis.zrem.assert_called_once()  # old
-            connection_manager.redis.zadd.assert_called_once()
-            call_args = connection_manager.redis.zadd.call_args[0][1]
-            new_member = list(call_args.keys())[0]
+            mock_send_distributed.assert_called_once_with(user_id, ANY, store_on_failure=False)
+            _, args = pending_ack_call(connection_manager.redis)
+            assert args[3:5] == [0, 0]
+            old_member, new_member = args[5:]
+            assert old_member == pending_data
             data = json.loads(new_member)
             assert data["attempts"] == 2
+            connection_manager.redis.zadd.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_max_attempts_reached(self, connection_manager):
@@ -597,7 +798,10 @@ class TestDistributedConnectionManager:
             result = await connection_manager.retry_pending_for_user(user_id)
             
             assert result == 0
-            connection_manager.redis.lpush.assert_called_once_with(DEAD_LETTER_KEY, pending_data)
+            keys, args = pending_ack_call(connection_manager.redis)
+            assert keys[2] == DEAD_LETTER_KEY
+            assert args[3:] == [0, 1, pending_data]
+            connection_manager.redis.lpush.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_invalid_data(self, connection_manager):
@@ -608,7 +812,8 @@ class TestDistributedConnectionManager:
         result = await connection_manager.retry_pending_for_user(user_id)
         
         assert result == 0
-        connection_manager.redis.zrem.assert_called_once_with(f"{PENDING_NOTIFICATIONS_PREFIX}{user_id}", "invalid_json")
+        _, args = pending_ack_call(connection_manager.redis)
+        assert args[3:] == [1, 0, "invalid_json"]
     
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_no_pendings(self, connection_manager):
@@ -619,7 +824,10 @@ class TestDistributedConnectionManager:
         result = await connection_manager.retry_pending_for_user(user_id)
         
         assert result == 0
-        connection_manager.redis.srem.assert_called_once_with(PENDING_USERS_KEY, user_id)
+        # An empty acknowledgement clears the pending-users and due entries
+        _, args = pending_ack_call(connection_manager.redis)
+        assert args[0] == user_id
+        assert args[3:] == [0, 0]
     
     @pytest.mark.asyncio
     async def test_retry_pending_for_user_redis_failure(self, connection_manager):
@@ -901,10 +1109,14 @@ class TestRedisStreamsFunctions:
         
         with patch('notification_service.manager') as mock_manager:
             mock_manager.send_message_local = AsyncMock(return_value=False)
+            mock_manager.store_undelivered_fanout = AsyncMock()
             
             await process_fanout_message(message)
             
             mock_manager.send_message_local.assert_called_once()
+            mock_manager.store_undelivered_fanout.assert_awaited_once_with(
+                "test_user_1", [{"content": "Test fanout message"}]
+            )
 
 
 class TestPubSubFunctions:
@@ -939,6 +1151,27 @@ class TestPubSubFunctions:
             
             mock_manager.send_message_distributed.assert_not_called()
     
+    @pytest.mark.asyncio
+    async def test_process_pubsub_notification_batch(self):
+        """A notification_batch payload is delivered to every named user."""
+        with patch('notification_service.manager') as mock_manager:
+            mock_manager.send_message_distributed = AsyncMock()
+            await process_pubsub_notification({
+                "type": "notification_batch",
+                "user_ids": ["u1", "u2", ""],
+                "message": {"content": "ready"}
+            })
+            calls = mock_manager.send_message_distributed.await_args_list
+            assert [c.args[0] for c in calls] == ["u1", "u2"]
+            assert all(c.args[1]["type"] == "notification" for c in calls)
+            assert calls[1].args[1]["user_id"] == "u2"
+            assert calls[1].args[1]["message"] == {"content": "ready"}
+
+            mock_manager.send_message_distributed.reset_mock()
+            await process_pubsub_notification({"user_id": "u3", "message": "hi"})
+            args = mock_manager.send_message_distributed.await_args.args
+            assert args[0] == "u3" and args[1]["message"] == {"content": "hi"}
+    
     @pytest.mark.asyncio
     async def test_pubsub_notifications_listener_reconnect(self, mock_redis):
         """Test Pub/Sub listener reconnect logic."""
@@ -967,95 +1200,86 @@ class TestPubSubFunctions:
 class TestBackgroundTasks:
     """Test background task functions."""
     
+    def test_idle_tracker_pops_only_expired(self):
+        """Only passed deadlines are returned; rescheduled and removed entries are skipped."""
+        tracker = IdleTracker()
+        tracker.schedule("a", 10)
+        tracker.schedule("b", 20)
+        tracker.schedule("c", 30)
+        tracker.schedule("a", 25)
+        tracker.remove("c")
+        
+        assert tracker.pop_due(15) == []
+        assert tracker.next_due() == 20
+        assert tracker.pop_due(26) == ["b", "a"]
+        assert tracker.pop_due(100) == []
+        assert len(tracker) == 0 and tracker.next_due() is None
+    
     @pytest.mark.asyncio
     async def test_heartbeat_task_cleanup_stale_connections(self, connection_manager):
-        """Test heartbeat task cleanup of stale connections."""
-        current_time = time.time()
-        stale_time = current_time - (CLIENT_TIMEOUT + 100)
-        fresh_time = current_time - 10
-        
-        connection_manager.last_activity["stale_user"] = stale_time
-        connection_manager.local_connections["stale_user"] = Mock()
-        connection_manager.last_activity["fresh_user"] = fresh_time
-        connection_manager.local_connections["fresh_user"] = Mock()
+        """Due connections are dropped when timed out, pinged when idle, rescheduled when active."""
+        now = time.time()
+        activity = {
+            "stale_user": now - (CLIENT_TIMEOUT + 100),
+            "idle_user": now - HEARTBEAT_INTERVAL - 1,
+            "active_user": now - 1,
+            "not_due_user": now - (CLIENT_TIMEOUT + 100)
+        }
+        for user_id, last in activity.items():
+            connection_manager.local_connections[user_id] = Mock()
+            connection_manager.last_activity[user_id] = last
+            connection_manager.idle_tracker.schedule(user_id, now + 60 if user_id == "not_due_user" else now - 1)
         
         with patch('notification_service.manager', connection_manager), \
-             patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep, \
              patch.object(connection_manager, 'disconnect', new_callable=AsyncMock) as mock_disconnect, \
-             patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock) as mock_send_local, \
-             patch('notification_service.cleanup_stale_connections', new_callable=AsyncMock) as mock_cleanup:
-            
-            mock_send_local.side_effect = [True]  # For fresh_user
-            
-            # Simulate one iteration
-            await asyncio.sleep(0.1)
-            current_time = time.time()
-            disconnected_users = []
-            
-            for user_id in list(connection_manager.last_activity.keys()):
-                if current_time - connection_manager.last_activity.get(user_id, 0) > CLIENT_TIMEOUT:
-                    disconnected_users.append(user_id)
-            
-            if connection_manager.local_connections:
-                heartbeat_msg = {
-                    "type": "heartbeat",
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "instance_id": INSTANCE_ID
-                }
-                
-                for user_id in list(connection_manager.local_connections.keys()):
-                    if user_id not in disconnected_users:
-                        success = await connection_manager.send_message_local(user_id, heartbeat_msg)
-                        if not success:
-                            disconnected_users.append(user_id)
-            
-            for user_id in disconnected_users:
-                await connection_manager.disconnect(user_id)
-            
-            mock_send_local.assert_called_once_with("fresh_user", ANY)
-            mock_disconnect.assert_called_once_with("stale_user")
+             patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=True) as mock_send_local:
+            result = await run_heartbeat_tick(now)
+        
+        mock_send_local.assert_called_once_with("idle_user", ANY)
+        assert json.loads(mock_send_local.call_args.args[1])["type"] == "heartbeat"
+        mock_disconnect.assert_called_once_with("stale_user")
+        assert result == {"pinged": 1, "disconnected": 1}
+        assert connection_manager.idle_tracker.pop_due(now + HEARTBEAT_INTERVAL) == ["active_user", "idle_user"]
     
     @pytest.mark.asyncio
     async def test_heartbeat_task_send_fail(self, connection_manager):
-        """Test heartbeat task when send fails."""
-        current_time = time.time()
-        fresh_time = current_time - 10
-        
-        connection_manager.last_activity["fresh_user"] = fresh_time
+        """A failed heartbeat disconnects the user."""
+        now = time.time()
         connection_manager.local_connections["fresh_user"] = Mock()
+        connection_manager.last_activity["fresh_user"] = now - HEARTBEAT_INTERVAL - 1
+        connection_manager.idle_tracker.schedule("fresh_user", now)
         
         with patch('notification_service.manager', connection_manager), \
-             patch('asyncio.sleep', new_callable=AsyncMock), \
              patch.object(connection_manager, 'disconnect', new_callable=AsyncMock) as mock_disconnect, \
-             patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=False), \
-             patch('notification_service.cleanup_stale_connections', new_callable=AsyncMock):
-            
-            # Simulate one iteration
-            await asyncio.sleep(0.1)
-            current_time = time.time()
-            disconnected_users = []
-            
-            for user_id in list(connection_manager.last_activity.keys()):
-                if current_time - connection_manager.last_activity.get(user_id, 0) > CLIENT_TIMEOUT:
-                    disconnected_users.append(user_id)
-            
-            if connection_manager.local_connections:
-                heartbeat_msg = {
-                    "type": "heartbeat",
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "instance_id": INSTANCE_ID
-                }
-                
-                for user_id in list(connection_manager.local_connections.keys()):
-                    if user_id not in disconnected_users:
-                        success = await connection_manager.send_message_local(user_id, heartbeat_msg)
-                        if not success:
-                            disconnected_users.append(user_id)
-            
-            for user_id in disconnected_users:
-                await connection_manager.disconnect(user_id)
-            
-            mock_disconnect.assert_called_once_with("fresh_user")
+             patch.object(connection_manager, 'send_message_local', new_callable=AsyncMock, return_value=False):
+            await run_heartbeat_tick(now)
+        
+        mock_disconnect.assert_called_once_with("fresh_user")
+    
+    @pytest.mark.asyncio
+    async def test_heartbeat_task_sweeps_only_as_leader(self, connection_manager):
+        """The global stale sweep runs only on the instance holding the lease."""
+        connection_manager.redis.set = AsyncMock(return_value=None)
+        connection_manager.redis.get = AsyncMock(return_value="other_instance")
+        
+        with patch('notification_service.manager', connection_manager), \
+             patch('asyncio.sleep', new_callable=AsyncMock, side_effect=[None, asyncio.CancelledError()]), \
+             patch('notification_service.cleanup_stale_connections', new_callable=AsyncMock) as mock_cleanup:
+            await heartbeat_task()
+        mock_cleanup.assert_not_called()
+        
+        connection_manager.redis.get.return_value = INSTANCE_ID
+        with patch('notification_service.manager', connection_manager):
+            assert await acquire_sweep_leadership() is True
+        connection_manager.redis.expire.assert_awaited_with(SWEEP_LEADER_KEY, ANY)
+        
+        connection_manager.redis.set.return_value = True
+        with patch('notification_service.manager', connection_manager), \
+             patch('asyncio.sleep', new_callable=AsyncMock, side_effect=[None, asyncio.CancelledError()]), \
+             patch('notification_service.cleanup_stale_connections', new_callable=AsyncMock) as mock_cleanup:
+            await heartbeat_task()
+        mock_cleanup.assert_awaited_once()
+        assert connection_manager.redis.set.call_args.kwargs["nx"] is True
     
     @pytest.mark.asyncio
     async def test_cleanup_stale_connections(self, connection_manager):
@@ -1100,37 +1324,148 @@ class TestBackgroundTasks:
     
     @pytest.mark.asyncio
     async def test_retry_pending_task(self, connection_manager):
-        """Test retry pending task."""
-        connection_manager.redis.smembers.return_value = {"user_1", "user_2"}
-        
+        """Test retry pending task runs a scheduler tick per interval."""
         with patch('notification_service.manager', connection_manager), \
-             patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep, \
-             patch.object(connection_manager, 'retry_pending_for_user', new_callable=AsyncMock) as mock_retry:
-            
-            # Test the retry logic directly instead of running the infinite loop
-            users = await connection_manager.redis.smembers(PENDING_USERS_KEY)
-            
-            for user_id_bytes in users:
-                user_id = user_id_bytes.decode() if isinstance(user_id_bytes, bytes) else user_id_bytes
-                await connection_manager.retry_pending_for_user(user_id)
-            
-            # Verify that retry_pending_for_user was called for each user
-            assert mock_retry.call_count == 2
+             patch('asyncio.sleep', new_callable=AsyncMock, side_effect=[None, asyncio.CancelledError()]), \
+             patch.object(PendingRetryScheduler, 'run_once', new_callable=AsyncMock) as mock_run_once:
+            await retry_pending_task()
+        
+        mock_run_once.assert_awaited_once()
     
     @pytest.mark.asyncio
     async def test_retry_pending_task_redis_failure(self, connection_manager):
-        """Test retry pending task when Redis smembers fails."""
-        connection_manager.redis.smembers.side_effect = Exception("Redis error")
-        
+        """Test retry pending task keeps going when a tick fails."""
         with patch('notification_service.manager', connection_manager), \
-             patch('asyncio.sleep', new_callable=AsyncMock):
-            
-            # Simulate one iteration
-            try:
-                users = await connection_manager.redis.smembers(PENDING_USERS_KEY)
-            except:
-                pass
-            # No raise
+             patch('asyncio.sleep', new_callable=AsyncMock, side_effect=[None, None, asyncio.CancelledError()]), \
+             patch.object(PendingRetryScheduler, 'run_once', new_callable=AsyncMock, side_effect=Exception("Redis error")) as mock_run_once:
+            await retry_pending_task()
+        
+        assert mock_run_once.await_count == 2
+
+
+class TestPendingRetryScheduler:
+    """Test sharded pending retry scheduling."""
+    
+    def test_hash_ring_only_moves_departed_share(self):
+        users = [f"user_{i}" for i in range(2000)]
+        three = ConsistentHashRing(["a", "b", "c"])
+        two = ConsistentHashRing(["a", "b"])
+        owners = {u: three.owner(u) for u in users}
+        
+        counts = {node: list(owners.values()).count(node) for node in "abc"}
+        assert all(400 < count < 1000 for count in counts.values())
+        moved = [u for u in users if owners[u] != two.owner(u)]
+        assert moved and all(owners[u] == "c" for u in moved)
+        assert ConsistentHashRing([]).owner("user_1") is None
+    
+    @pytest.fixture
+    def scheduler(self, connection_manager):
+        redis = connection_manager.redis
+        redis.pipeline.return_value.execute.return_value = [1, 0, ["peer", INSTANCE_ID]]
+        redis.sscan = AsyncMock(return_value=(0, []))
+        return PendingRetryScheduler(connection_manager)
+    
+    @staticmethod
+    def due_pages(scheduler, users):
+        """Pipeline replies for claim_due: one due page per owned partition, in order"""
+        return [
+            [user_id for user_id in users if pending_due_partition(user_id) == partition]
+            for partition in scheduler.partitions
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_run_once_reads_only_owned_partitions(self, scheduler, connection_manager):
+        redis = connection_manager.redis
+        pipe = redis.pipeline.return_value
+        await scheduler.refresh_membership()
+        assert set(scheduler.ring.nodes) == {"peer", INSTANCE_ID}
+        assert 0 < len(scheduler.partitions) < PENDING_DUE_PARTITIONS
+        
+        users = [f"user_{i}" for i in range(200)]
+        owned = [u for u in users if scheduler.owns(u)]
+        assert 0 < len(owned) < len(users)
+        pipe.execute.side_effect = [[1, 0, ["peer", INSTANCE_ID]], self.due_pages(scheduler, owned), []]
+        
+        with patch.object(connection_manager, 'retry_pending_for_user', new_callable=AsyncMock, return_value=1) as mock_retry, \
+             patch('notification_service.acquire_sweep_leadership', new_callable=AsyncMock, return_value=False):
+            delivered = await scheduler.run_once()
+        
+        # Only the sweep leader reconciles
+        redis.sscan.assert_not_awaited()
+        assert scheduler.last_reconcile > 0
+        due_keys = [c.args[0] for c in pipe.zrangebyscore.call_args_list]
+        assert sorted(due_keys) == sorted(pending_due_key(p) for p in scheduler.partitions)
+        assert sorted(c.args[0] for c in mock_retry.call_args_list) == sorted(owned)
+        assert delivered == len(owned)
+        # Claimed users have their due time pushed forward in their own partition
+        claims = [c for c in pipe.zadd.call_args_list if c.kwargs == {"xx": True}]
+        assert sorted(u for c in claims for u in c.args[1]) == sorted(owned)
+        assert all(c.args[0] == pending_due_key(pending_due_partition(next(iter(c.args[1])))) for c in claims)
+        redis.zrangebyscore.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_claim_due_caps_batch_and_rotates_partitions(self, scheduler, connection_manager):
+        pipe = connection_manager.redis.pipeline.return_value
+        scheduler.ring = ConsistentHashRing([INSTANCE_ID])
+        users = [f"user_{i}" for i in range(20)]
+        pipe.execute.side_effect = [self.due_pages(scheduler, users), [], self.due_pages(scheduler, users), []]
+        
+        with patch('notification_service.PENDING_RETRY_BATCH', 3):
+            first = await scheduler.claim_due()
+            first_key = pipe.zrangebyscore.call_args_list[0].args[0]
+            pipe.zrangebyscore.reset_mock()
+            await scheduler.claim_due()
+        
+        assert len(first) == 3
+        assert first_key == pending_due_key(scheduler.partitions[0])
+        assert pipe.zrangebyscore.call_args_list[0].args[0] == pending_due_key(scheduler.partitions[1])
+    
+    @pytest.mark.asyncio
+    async def test_reconcile_scans_pending_users_in_pages(self, scheduler, connection_manager):
+        redis = connection_manager.redis
+        pipe = redis.pipeline.return_value
+        redis.sscan.side_effect = [(7, ["user_1", "user_2"]), (0, ["user_3"])]
+        scheduler.ring = ConsistentHashRing([INSTANCE_ID, "peer"])
+        scheduler.last_reconcile = 0
+        scheduler.refresh_membership = AsyncMock()
+        scheduler.claim_due = AsyncMock(return_value=[])
+        
+        with patch('notification_service.acquire_sweep_leadership', new_callable=AsyncMock, return_value=True):
+            await scheduler.run_once()
+        
+        assert [c.kwargs["cursor"] for c in redis.sscan.call_args_list] == [0, 7]
+        # The leader schedules every pending user, including other instances' partitions
+        scheduled = {u: c.args[0] for c in pipe.zadd.call_args_list for u in c.args[1]}
+        assert scheduled == {u: pending_due_key(pending_due_partition(u)) for u in ["user_1", "user_2", "user_3"]}
+        assert all(c.kwargs == {"nx": True} for c in pipe.zadd.call_args_list)
+        assert pipe.execute.await_count == 2
+        assert scheduler.last_reconcile > 0
+    
+    @pytest.mark.asyncio
+    async def test_retries_run_with_bounded_concurrency(self, scheduler, connection_manager):
+        scheduler.ring = ConsistentHashRing([INSTANCE_ID])
+        connection_manager.redis.pipeline.return_value.execute.side_effect = [
+            self.due_pages(scheduler, [f"user_{i}" for i in range(20)]), []
+        ]
+        scheduler.last_reconcile = time.time()
+        scheduler.refresh_membership = AsyncMock()
+        scheduler._semaphore = asyncio.Semaphore(3)
+        running = 0
+        peak = 0
+        
+        async def fake_retry(user_id):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0)
+            running -= 1
+            return 0
+        
+        with patch.object(connection_manager, 'retry_pending_for_user', side_effect=fake_retry):
+            await scheduler.run_once()
+        
+        assert peak == 3
+        assert scheduler.stats["retried_users"] == 20
 
 
 class TestStreamsConsumer:
@@ -1153,11 +1488,235 @@ class TestStreamsConsumer:
                 pass
             
             mock_sleep.assert_called()  # Retry delay
+    
+    @pytest.mark.asyncio
+    async def test_process_stream_message_deferred_ack(self, mock_redis):
+        """With ack=False the outcome is returned for the caller to acknowledge."""
+        fields = {"user_id": "test_user_1", "message": json.dumps({"content": "m"})}
+        with patch('notification_service.manager') as mock_manager:
+            mock_manager.send_message_distributed = AsyncMock(return_value=False)
+            assert await process_stream_message(mock_redis, "1-0", fields, ack=False) is True
+            mock_manager.send_message_distributed.side_effect = Exception("Send error")
+            assert await process_stream_message(mock_redis, "2-0", fields, ack=False) is False
+        assert await process_stream_message(mock_redis, "3-0", {"user_id": ""}, ack=False) is True
+        mock_redis.xack.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_worker_pool_keeps_per_user_order(self, mock_redis):
+        """Users are processed concurrently, each user's entries in stream order."""
+        delivered = []
+        in_flight = 0
+        peak = 0
+        
+        async def fake_process(redis, msg_id, fields, ack=True):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01 if fields["user_id"] == "slow" else 0)
+            delivered.append((fields["user_id"], msg_id))
+            in_flight -= 1
+            return msg_id != "fail"
+        
+        entries = []
+        for i in range(5):
+            entries.append((f"s{i}", {"user_id": "slow"}))
+            entries.append((f"f{i}", {"user_id": "fast"}))
+        entries.append(("fail", {"user_id": "other"}))
+        pool = StreamWorkerPool(mock_redis, workers=8)
+        assert pool.partition("slow") != pool.partition("fast")
+        
+        with patch('notification_service.process_stream_message', side_effect=fake_process):
+            handled = await pool.process_batch(entries)
+        await pool.stop()
+        
+        assert [m for u, m in delivered if u == "slow"] == [f"s{i}" for i in range(5)]
+        assert [m for u, m in delivered if u == "fast"] == [f"f{i}" for i in range(5)]
+        # Fast user finishes while the slow one is still sleeping
+        assert delivered.index(("fast", "f4")) < delivered.index(("slow", "s4"))
+        assert peak > 1
+        assert handled == 10
+        mock_redis.xack.assert_awaited_once()
+        acked = mock_redis.xack.call_args.args
+        assert acked[:2] == (NOTIFICATIONS_STREAM, CONSUMER_GROUP)
+        assert set(acked[2:]) == {m for m, _ in entries} - {"fail"}
+    
+    @pytest.mark.asyncio
+    async def test_claim_stale_stream_entries(self, mock_redis):
+        """Idle entries of dead consumers are claimed, processed and acknowledged."""
+        mock_redis.xautoclaim.return_value = ["9-0", [("1-0", {"user_id": "u1", "message": "m"}), ("2-0", None)]]
+        pool = StreamWorkerPool(mock_redis, workers=2)
+        
+        with patch('notification_service.process_stream_message', new_callable=AsyncMock, return_value=True) as mock_process:
+            cursor = await claim_stale_stream_entries(pool, "consumer_1")
+        await pool.stop()
+        
+        assert cursor == "9-0"
+        mock_redis.xautoclaim.assert_awaited_once_with(
+            NOTIFICATIONS_STREAM, CONSUMER_GROUP, "consumer_1",
+            min_idle_time=STREAM_CLAIM_IDLE_MS, start_id="0-0", count=STREAM_BATCH_SIZE
+        )
+        mock_process.assert_awaited_once()
+        mock_redis.xack.assert_awaited_once_with(NOTIFICATIONS_STREAM, CONSUMER_GROUP, "1-0", "2-0")
+    
+    @pytest.mark.asyncio
+    async def test_redis_streams_consumer_batches_reads_and_acks(self, mock_redis):
+        """One XREADGROUP of STREAM_BATCH_SIZE entries is acknowledged with one XACK."""
+        msgs = [(f"{i}-0", {"user_id": f"user_{i}", "message": "m"}) for i in range(3)]
+        mock_redis.xreadgroup.side_effect = [[(NOTIFICATIONS_STREAM, msgs)], asyncio.CancelledError()]
+        
+        with patch('notification_service.manager') as mock_manager, \
+             patch('notification_service.process_stream_message', new_callable=AsyncMock, return_value=True):
+            mock_manager.redis = mock_redis
+            await redis_streams_consumer()
+        
+        assert mock_redis.xreadgroup.call_args.kwargs["count"] == STREAM_BATCH_SIZE
+        mock_redis.xautoclaim.assert_awaited_once()
+        mock_redis.xack.assert_awaited_once()
+        assert set(mock_redis.xack.call_args.args[2:]) == {"0-0", "1-0", "2-0"}
 
 
 class TestFanoutListener:
     """Test instance fanout listener functions."""
     
+    @pytest.mark.asyncio
+    async def test_fanout_batcher_coalesces_per_instance(self, connection_manager):
+        """Concurrent sends to one instance go out as a single frame."""
+        batcher = FanoutBatcher(connection_manager, window_ms=5, batch_frames=True)
+        connection_manager.redis.publish.return_value = 2
+        
+        results = await asyncio.gather(
+            batcher.send("remote_a", "u1", {"content": "1"}),
+            batcher.send("remote_a", "u2", {"content": "2"}),
+            batcher.send("remote_b", "u3", {"content": "3"}),
+            batcher.send("remote_a", "u1", {"content": "4"})
+        )
+        
+        assert results == [2, 2, 2, 2]
+        frames = {c.args[0]: json.loads(c.args[1]) for c in connection_manager.redis.publish.call_args_list}
+        assert set(frames) == {f"{INSTANCE_CHANNEL_PREFIX}:remote_a", f"{INSTANCE_CHANNEL_PREFIX}:remote_b"}
+        frame = frames[f"{INSTANCE_CHANNEL_PREFIX}:remote_a"]
+        assert frame["type"] == "fanout_batch"
+        assert frame["source_instance"] == INSTANCE_ID
+        assert [(m["user_id"], m["message"]["content"]) for m in frame["messages"]] == [("u1", "1"), ("u2", "2"), ("u1", "4")]
+        assert batcher.get_stats() == {"frames_sent": 2, "messages_sent": 4, "buffered": 0}
+    
+    @pytest.mark.asyncio
+    async def test_fanout_batcher_flushes_on_size_limit(self, connection_manager):
+        """A full buffer is published without waiting for the window."""
+        batcher = FanoutBatcher(connection_manager, window_ms=60000, max_messages=2, batch_frames=True)
+        results = await asyncio.wait_for(asyncio.gather(
+            batcher.send("remote", "u1", {"content": "1"}),
+            batcher.send("remote", "u2", {"content": "2"})
+        ), timeout=1)
+        
+        assert results == [1, 1]
+        connection_manager.redis.publish.assert_awaited_once()
+        assert not batcher._timers
+    
+    @pytest.mark.asyncio
+    async def test_fanout_batcher_publish_error_reaches_senders(self, connection_manager):
+        """A failed publish fails every message of the frame."""
+        batcher = FanoutBatcher(connection_manager, window_ms=1, batch_frames=True)
+        connection_manager.redis.publish.side_effect = Exception("Redis error")
+        results = await asyncio.gather(
+            batcher.send("remote", "u1", {"content": "1"}),
+            batcher.send("remote", "u2", {"content": "2"}),
+            return_exceptions=True
+        )
+        assert all(isinstance(r, Exception) for r in results)
+    
+    @pytest.mark.asyncio
+    async def test_process_fanout_batch_delivers_in_order_per_user(self, connection_manager):
+        """Batch entries are delivered per user in order, users concurrently."""
+        delivered = []
+        
+        async def fake_send(user_id, message):
+            await asyncio.sleep(0.01 if user_id == "slow" else 0)
+            delivered.append((user_id, message["content"]))
+            return user_id != "offline"
+        
+        frame = {
+            "type": "fanout_batch",
+            "source_instance": "remote",
+            "messages": [
+                {"user_id": "slow", "message": {"content": "s1"}},
+                {"user_id": "fast", "message": {"content": "f1"}},
+                {"user_id": "offline", "message": {"content": "o1"}},
+                {"user_id": "slow", "message": {"content": "s2"}},
+                {"user_id": "fast", "message": {"content": "f2"}},
+                {"user_id": "offline", "message": {"content": "o2"}},
+                {"user_id": "", "message": {"content": "invalid"}}
+            ]
+        }
+        
+        with patch('notification_service.manager', connection_manager), \
+             patch.object(connection_manager, 'send_message_local', side_effect=fake_send), \
+             patch.object(connection_manager, 'store_pending_notification', new_callable=AsyncMock) as mock_store:
+            await process_fanout_message({"data": json.dumps(frame)})
+        
+        assert [c for u, c in delivered if u == "slow"] == ["s1", "s2"]
+        assert [c for u, c in delivered if u == "fast"] == ["f1", "f2"]
+        # Messages for a user that is not connected here are kept as pending instead
+        assert [c for u, c in delivered if u == "offline"] == ["o1"]
+        assert [c.args for c in mock_store.await_args_list] == [
+            ("offline", {"content": "o1"}), ("offline", {"content": "o2"})
+        ]
+        assert delivered.index(("fast", "f2")) < delivered.index(("slow", "s1"))
+    
+    @pytest.mark.asyncio
+    async def test_fanout_batcher_sends_legacy_frames_until_enabled(self, connection_manager):
+        """Without batch frames every message goes out as a ``fanout`` frame old instances understand."""
+        batcher = FanoutBatcher(connection_manager, window_ms=5, batch_frames=False)
+        connection_manager.redis.publish.return_value = 1
+        
+        assert await batcher.send("remote", "u1", {"content": "1"}) == 1
+        channel, raw = connection_manager.redis.publish.call_args.args
+        assert channel == f"{INSTANCE_CHANNEL_PREFIX}:remote"
+        assert json.loads(raw) == {
+            "type": "fanout", "user_id": "u1", "message": {"content": "1"}, "source_instance": INSTANCE_ID
+        }
+        assert not batcher._timers
+    
+    @pytest.mark.asyncio
+    async def test_fanout_for_user_not_connected_here_is_stored_and_route_withdrawn(self, connection_manager):
+        """A message forwarded on a stale route is stored as pending rather than lost."""
+        frame = {"type": "fanout", "user_id": "moved", "message": {"content": "hi"}, "source_instance": "remote"}
+        with patch('notification_service.manager', connection_manager), \
+             patch.object(connection_manager, 'store_pending_notification', new_callable=AsyncMock) as mock_store:
+            await process_fanout_message({"data": json.dumps(frame)})
+        
+        mock_store.assert_awaited_once_with("moved", {"content": "hi"})
+        control = json.loads(connection_manager.redis.publish.call_args.args[1])
+        assert control == {"type": "disconnect", "user_id": "moved", "instance_id": INSTANCE_ID}
+    
+    def test_routing_table_expiry_and_eviction(self):
+        """Routes expire after the TTL and least recently used ones are evicted."""
+        routes = RoutingTable(ttl=60, max_entries=2)
+        routes.set("a", "i1")
+        routes.set("b", "i1")
+        assert routes.get("a") == "i1"
+        routes.set("c", "i2")
+        assert routes.get("b") is None
+        assert len(routes) == 2
+        
+        with patch('notification_service.time.monotonic', return_value=time.monotonic() + 61):
+            assert routes.get("a") is None
+        assert routes.get_stats()["misses"] == 2
+    
+    def test_process_control_message_updates_routes(self, connection_manager):
+        """Disconnects only drop a route that still points at the sender."""
+        def event(kind, user_id, instance_id):
+            return {"data": json.dumps({"type": kind, "user_id": user_id, "instance_id": instance_id})}
+        
+        with patch('notification_service.manager', connection_manager):
+            process_control_message(event("connect", "u1", "i1"))
+            process_control_message(event("connect", "u1", "i2"))
+            process_control_message(event("disconnect", "u1", "i1"))
+            assert connection_manager.routes.get("u1") == "i2"
+            process_control_message(event("disconnect", "u1", "i2"))
+            assert connection_manager.routes.get("u1") is None
+            process_control_message({"data": "not json"})
+    
     @pytest.mark.asyncio
     async def test_instance_fanout_listener_reconnect(self, mock_redis):
         """Test fanout listener reconnect logic."""
@@ -1206,6 +1765,102 @@ class TestFanoutListener:
             assert mock_sleep.call_count == 1
 
 
+class TestBroadcastDelivery:
+    """Test per-instance broadcast delivery."""
+    
+    @pytest.fixture
+    def local_users(self, connection_manager):
+        for user_id in ("u1", "u2", "u3"):
+            connection_manager.local_connections[user_id] = Mock()
+        return connection_manager
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fields,expected", [
+        ({"user_ids": json.dumps(["u1", "u3", "remote_user"])}, {"u1", "u3"}),
+        ({"segment_id": "all"}, {"u1", "u2", "u3"}),
+        ({"segment_id": "city:barcelona"}, {"u2"}),
+    ])
+    async def test_process_broadcast_entry_targets(self, local_users, fields, expected):
+        """Only matching local connections receive the broadcast."""
+        redis = local_users.redis
+        redis.smismember = AsyncMock(side_effect=lambda key, users: [u == "u2" for u in users])
+        
+        with patch('notification_service.manager', local_users), \
+             patch.object(local_users, 'send_message_local', new_callable=AsyncMock, return_value=True) as mock_send:
+            delivered = await process_broadcast_entry("1-0", {"broadcast_id": "b1", "message": json.dumps({"content": "hi"}), **fields})
+        
+        assert delivered == len(expected)
+        assert {c.args[0] for c in mock_send.call_args_list} == expected
+        frames = {c.args[0]: json.loads(c.args[1]) for c in mock_send.call_args_list}
+        assert all(frame["user_id"] == user_id for user_id, frame in frames.items())
+        sent = next(iter(frames.values()))
+        assert sent["broadcast_id"] == "b1" and sent["message"] == {"content": "hi"}
+        if fields.get("segment_id", "all") != "all":
+            redis.smismember.assert_awaited_once_with(f"{SEGMENT_PREFIX}city:barcelona", ["u1", "u2", "u3"])
+        pipe = redis.pipeline.return_value
+        pipe.hset.assert_called_once_with(f"{BROADCAST_RESULTS_PREFIX}b1", INSTANCE_ID, len(expected))
+        pipe.execute.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_listener_reads_from_latest(self, connection_manager):
+        """Each instance reads the broadcast stream itself, starting after the latest entry."""
+        redis = connection_manager.redis
+        redis.xrevrange = AsyncMock(return_value=[("5-0", {})])
+        redis.xread = AsyncMock(side_effect=[[(BROADCAST_STREAM, [("6-0", {"segment_id": "all"})])], asyncio.CancelledError()])
+        
+        with patch('notification_service.manager', connection_manager), \
+             patch('notification_service.process_broadcast_entry', new_callable=AsyncMock) as mock_process:
+            await broadcast_listener()
+        
+        mock_process.assert_awaited_once_with("6-0", {"segment_id": "all"})
+        assert [c.args[0] for c in redis.xread.call_args_list] == [{BROADCAST_STREAM: "5-0"}, {BROADCAST_STREAM: "6-0"}]
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_listener_backs_off_then_gives_up(self, connection_manager):
+        """A Redis that never comes back gets capped backoff, a degraded status and finally a stop."""
+        redis = connection_manager.redis
+        redis.xrevrange = AsyncMock(return_value=[("5-0", {})])
+        redis.xread = AsyncMock(side_effect=ConnectionError("Connection refused"))
+        states = []
+        
+        async def sleep(delay):
+            states.append(broadcast_listener_status["state"])
+        
+        with patch('notification_service.manager', connection_manager), \
+             patch.dict(broadcast_listener_status), \
+             patch('notification_service.MAX_RECONNECT_ATTEMPTS', 5), \
+             patch('notification_service.BROADCAST_UNHEALTHY_AFTER', 2), \
+             patch('notification_service.BROADCAST_MAX_BACKOFF', 30), \
+             patch('asyncio.sleep', new_callable=AsyncMock, side_effect=sleep) as mock_sleep:
+            await asyncio.wait_for(broadcast_listener(), timeout=5)
+            final = dict(broadcast_listener_status)
+        
+        assert redis.xread.await_count == 5
+        assert [c.args[0] for c in mock_sleep.await_args_list] == [10, 20, 30, 30]
+        assert states == ["starting", "unhealthy", "unhealthy", "unhealthy"]
+        assert final["state"] == "stopped"
+        assert final["consecutive_failures"] == 5
+        assert "Connection refused" in final["last_error"]
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_listener_recovers_after_reconnect(self, connection_manager):
+        """A successful read after failures resets the failure count and status."""
+        redis = connection_manager.redis
+        redis.xrevrange = AsyncMock(return_value=[])
+        redis.xread = AsyncMock(side_effect=[
+            ConnectionError("down"), ConnectionError("down"), [], asyncio.CancelledError()
+        ])
+        
+        with patch('notification_service.manager', connection_manager), \
+             patch.dict(broadcast_listener_status), \
+             patch('notification_service.BROADCAST_UNHEALTHY_AFTER', 2), \
+             patch('asyncio.sleep', new_callable=AsyncMock):
+            await broadcast_listener()
+            final = dict(broadcast_listener_status)
+        
+        assert final == {"state": "healthy", "consecutive_failures": 0, "last_error": None}
+
+
 class TestAPIEndpoints:
     """Test FastAPI endpoints."""
     
@@ -1245,6 +1900,21 @@ class TestAPIEndpoints:
             assert data["status"] == "degraded"
             assert "unhealthy" in data["redis"]
     
+    def test_health_check_reports_failing_broadcast_listener(self, client, connection_manager, mock_redis):
+        """An instance whose broadcast listener keeps failing reports itself degraded."""
+        with patch('notification_service.manager', connection_manager), \
+             patch.dict(broadcast_listener_status, state="unhealthy", consecutive_failures=4, last_error="down"):
+            connection_manager.redis = mock_redis
+            mock_redis.ping.return_value = True
+            mock_redis.xinfo_stream.return_value = {"length": 5}
+            mock_redis.xinfo_groups.return_value = [{"name": CONSUMER_GROUP, "lag": 0}]
+            
+            data = client.get("/health").json()
+        
+        assert data["status"] == "degraded"
+        assert data["broadcast_listener"]["state"] == "unhealthy"
+        assert data["broadcast_listener"]["consecutive_failures"] == 4
+    
     def test_get_stats(self, client, connection_manager):
         """Test get stats endpoint."""
         with patch('notification_service.manager', connection_manager):
@@ -1296,6 +1966,85 @@ class TestAPIEndpoints:
             assert data["delivery_method"] == "redis_stream"
             assert "stream_id" in data
     
+    def test_send_broadcast_notification(self, client, connection_manager, mock_redis):
+        """Broadcast writes one stream entry and returns per-instance counts."""
+        with patch('notification_service.manager', connection_manager):
+            connection_manager.redis = mock_redis
+            mock_redis.xadd.return_value = "7-0"
+            mock_redis.zrangebyscore = AsyncMock(return_value=[INSTANCE_ID, "peer"])
+            mock_redis.hgetall = AsyncMock(return_value={INSTANCE_ID: "3", "peer": "2"})
+            mock_redis.hmget = AsyncMock(return_value=[INSTANCE_ID, "peer"])
+            
+            payload = BroadcastPayload(message={"content": "hi"}, user_ids=["u2", "u1", "u1"])
+            response = client.post("/notify/broadcast", json=payload.model_dump())
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["stream_id"] == "7-0"
+        assert data["delivered_total"] == 5
+        assert data["by_instance"] == {INSTANCE_ID: 3, "peer": 2}
+        assert data["pending_instances"] == []
+        mock_redis.xadd.assert_awaited_once()
+        stream, entry = mock_redis.xadd.call_args.args
+        assert stream == BROADCAST_STREAM
+        assert json.loads(entry["user_ids"]) == ["u1", "u2"]
+        assert entry["broadcast_id"] == data["broadcast_id"]
+        assert data["stored_pending"] == 0
+    
+    def test_send_broadcast_notification_stores_pending_for_offline_users(self, client, connection_manager, mock_redis):
+        """Listed users with no connection anywhere get the broadcast as pending."""
+        with patch('notification_service.manager', connection_manager):
+            connection_manager.redis = mock_redis
+            mock_redis.zrangebyscore = AsyncMock(return_value=[INSTANCE_ID])
+            mock_redis.hgetall = AsyncMock(return_value={INSTANCE_ID: "1"})
+            mock_redis.hmget = AsyncMock(return_value=[INSTANCE_ID, None, None])
+            pipe = mock_redis.pipeline.return_value
+            
+            payload = BroadcastPayload(message={"content": "hi"}, user_ids=["u1", "u2", "u3"], wait_ms=0)
+            response = client.post("/notify/broadcast", json=payload.model_dump())
+        
+        data = response.json()
+        assert data["stored_pending"] == 2
+        mock_redis.hmget.assert_awaited_once_with(CONNECTIONS_KEY, ["u1", "u2", "u3"])
+        stored = {
+            call.args[0]: json.loads(next(iter(call.args[1])))
+            for call in pipe.zadd.call_args_list
+            if call.args[0].startswith(PENDING_NOTIFICATIONS_PREFIX)
+        }
+        assert set(stored) == {f"{PENDING_NOTIFICATIONS_PREFIX}u2", f"{PENDING_NOTIFICATIONS_PREFIX}u3"}
+        frame = stored[f"{PENDING_NOTIFICATIONS_PREFIX}u2"]
+        assert frame["user_id"] == "u2"
+        assert frame["broadcast_id"] == data["broadcast_id"]
+        assert frame["notification_id"] == data["broadcast_id"]
+        assert frame["message"] == {"content": "hi"}
+        assert frame["is_pending"] is True
+    
+    def test_send_broadcast_notification_rejects_excessive_wait(self, client):
+        """wait_ms is bounded so one request cannot hold a worker open indefinitely."""
+        response = client.post("/notify/broadcast", json={"segment_id": "all", "wait_ms": BROADCAST_MAX_WAIT_MS + 1})
+        assert response.status_code == 422
+    
+    def test_send_broadcast_notification_reports_missing_instances(self, client, connection_manager, mock_redis):
+        """Instances that have not reported within wait_ms are listed as pending."""
+        with patch('notification_service.manager', connection_manager):
+            connection_manager.redis = mock_redis
+            mock_redis.zrangebyscore = AsyncMock(return_value=["peer"])
+            mock_redis.hgetall = AsyncMock(return_value={})
+            
+            payload = BroadcastPayload(segment_id="all", wait_ms=0)
+            response = client.post("/notify/broadcast", json=payload.model_dump())
+        
+        data = response.json()
+        assert data["delivered_total"] == 0
+        assert data["pending_instances"] == sorted([INSTANCE_ID, "peer"])
+    
+    @pytest.mark.parametrize("body", [{}, {"user_ids": ["u1"], "segment_id": "all"}])
+    def test_send_broadcast_notification_requires_one_target(self, client, body):
+        """Exactly one of user_ids or segment_id is required."""
+        response = client.post("/notify/broadcast", json=body)
+        assert response.status_code == 422
+    
     def test_send_stream_notification_string_message(self, client, connection_manager, mock_redis):
         """Test stream notification sending with string message."""
         payload = NotificationPayload(message="String message")
@@ -1616,7 +2365,7 @@ class TestErrorHandling:
         user_id = "test_user_1"
         message = {"content": "Test message"}
         connection_manager.local_connections[user_id] = mock_websocket
-        mock_websocket.send_json.side_effect = Exception("WebSocket send failed")
+        mock_websocket.send_text.side_effect = Exception("WebSocket send failed")
         
         with patch.object(connection_manager, 'disconnect', new_callable=AsyncMock) as mock_disconnect:
             result = await connection_manager.send_message_local(user_id, message)
@@ -1645,7 +2394,7 @@ class TestIntegrationScenarios:
         # Test message sending
         result = await connection_manager.send_message_local(user_id, message)
         assert result is True
-        mock_websocket.send_json.assert_called_with(message)
+        assert json.loads(mock_websocket.send_text.call_args.args[0]) == message
         
         # Test disconnection
         await connection_manager.disconnect(user_id)
@@ -1663,8 +2412,9 @@ class TestIntegrationScenarios:
         await connection_manager.store_pending_notification(user_id, message)
         
         # Verify storage calls
-        connection_manager.redis.zadd.assert_called_once()
-        connection_manager.redis.sadd.assert_called_once_with(PENDING_USERS_KEY, user_id)
+        pipe = mock_redis.pipeline.return_value
+        assert pipe.zadd.call_count == 2
+        pipe.sadd.assert_called_once_with(PENDING_USERS_KEY, user_id)
         
         # Test retry
         mock_redis.zrange.return_value = [json.dumps({
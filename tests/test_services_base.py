@@ -264,8 +264,10 @@ class TestBaseService:
 
             await base_service._make_request("GET", "/test")
 
-            # Verify AsyncClient was created with correct timeout
-            mock_client_class.assert_called_once_with(timeout=30)
+            # Verify the pooled AsyncClient was created with correct timeout
+            mock_client_class.assert_called_once()
+            assert mock_client_class.call_args.kwargs['timeout'] == 30
+            assert mock_client.request.call_args.kwargs['timeout'] == 30
 
     @pytest.mark.asyncio
     async def test_make_request_custom_timeout(self):
@@ -284,8 +286,10 @@ class TestBaseService:
 
             await service._make_request("GET", "/test")
 
-            # Verify AsyncClient was created with custom timeout
-            mock_client_class.assert_called_once_with(timeout=60)
+            # Verify the pooled AsyncClient was created with custom timeout
+            mock_client_class.assert_called_once()
+            assert mock_client_class.call_args.kwargs['timeout'] == 60
+            assert mock_client.request.call_args.kwargs['timeout'] == 60
 
     @pytest.mark.asyncio
     async def test_make_request_json_parsing_error(self, base_service):
@@ -0,0 +1,98 @@
+"""
+Tests for the user embedding cache
+"""
+import pytest
+import numpy as np
+from unittest.mock import MagicMock
+
+from app.services.embedding_cache import UserEmbeddingCache
+
+
+def _fake_redis():
+    """MagicMock Redis whose pipelines read/write a shared dict of hashes."""
+    store = {}
+    client = MagicMock()
+
+    def make_pipeline(transaction=False):
+        ops = []
+        pipe = MagicMock()
+        pipe.__enter__.return_value = pipe
+        pipe.hget.side_effect = lambda key, field: ops.append(lambda: store.get(key, {}).get(field))
+        pipe.hset.side_effect = lambda key, mapping: ops.append(
+            lambda: store.setdefault(key, {}).update(
+                {k: v.encode() if isinstance(v, str) else v for k, v in mapping.items()}
+            )
+        )
+        pipe.expire.side_effect = lambda key, ttl: ops.append(lambda: True)
+        pipe.execute.side_effect = lambda: [op() for op in ops]
+        return pipe
+
+    client.pipeline.side_effect = make_pipeline
+    client.delete.side_effect = lambda key: store.pop(key, None)
+    return client, store
+
+
+@pytest.mark.unit
+class TestUserEmbeddingCache:
+    """Test UserEmbeddingCache"""
+
+    def test_fingerprint_is_stable_and_input_sensitive(self):
+        a = UserEmbeddingCache.fingerprint({"b": 1, "a": [1, 2]}, "Barcelona")
+        b = UserEmbeddingCache.fingerprint({"a": [1, 2], "b": 1}, "Barcelona")
+        c = UserEmbeddingCache.fingerprint({"a": [1, 2], "b": 2}, "Barcelona")
+        assert a == b
+        assert a != c
+
+    def test_local_hit_and_fingerprint_miss(self):
+        cache = UserEmbeddingCache(redis_client=None)
+        stored = cache.set("u1", "fp1", np.arange(4, dtype=np.float64))
+        assert stored.dtype == np.float32
+        assert np.array_equal(cache.get("u1", "fp1"), stored)
+        # History changed -> different fingerprint -> miss
+        assert cache.get("u1", "fp2") is None
+        assert cache.get_stats()["hits"] == 1
+        assert cache.get_stats()["misses"] == 1
+
+    def test_lru_evicts_oldest(self):
+        cache = UserEmbeddingCache(redis_client=None, max_entries=2)
+        cache.set("u1", "fp", np.ones(2))
+        cache.set("u2", "fp", np.ones(2))
+        cache.get("u1", "fp")
+        cache.set("u3", "fp", np.ones(2))
+        assert cache.get("u2", "fp") is None
+        assert cache.get("u1", "fp") is not None
+        assert cache.get("u3", "fp") is not None
+
+    def test_redis_roundtrip_as_float32_bytes(self):
+        client, store = _fake_redis()
+        writer = UserEmbeddingCache(redis_client=client, namespace="ns", signature="s1")
+        vec = np.array([0.25, -0.5, 1.0])
+        writer.set("u1", "fp1", vec)
+        raw = store["ns:embeddings:user:s1:u1"]["vec"]
+        assert raw == vec.astype(np.float32).tobytes()
+
+        reader = UserEmbeddingCache(redis_client=client, namespace="ns", signature="s1")
+        assert np.array_equal(reader.get("u1", "fp1"), vec.astype(np.float32))
+        assert reader.get("u1", "other") is None
+
+    def test_local_only_entries_not_written_to_redis(self):
+        client, store = _fake_redis()
+        cache = UserEmbeddingCache(redis_client=client)
+        cache.set("u1", "fp", np.ones(3), kind="two_tower", shared=False)
+        assert store == {}
+        assert cache.get("u1", "fp", kind="two_tower") is not None
+
+    def test_invalidate_and_redis_errors(self):
+        client, store = _fake_redis()
+        cache = UserEmbeddingCache(redis_client=client)
+        cache.set("u1", "fp", np.ones(3))
+        cache.invalidate("u1")
+        assert store == {}
+        assert cache.get("u1", "fp") is None
+
+        broken = MagicMock()
+        broken.pipeline.side_effect = Exception("redis down")
+        cache = UserEmbeddingCache(redis_client=broken)
+        cache.set("u1", "fp", np.ones(3))
+        cache.clear_local()
+        assert cache.get("u1", "fp") is None
@@ -0,0 +1,97 @@
+"""
+Tests for the shared pooled HTTP client registry
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.http_client import HTTPClientRegistry
+
+
+def _transport(handler):
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.unit
+class TestHTTPClientRegistry:
+    """Test HTTPClientRegistry"""
+
+    def test_origin_normalization(self):
+        assert HTTPClientRegistry.origin("http://LLM.local:8080/process-text?x=1") == "http://llm.local:8080"
+        assert HTTPClientRegistry.origin("https://api.example.com") == "https://api.example.com"
+        assert HTTPClientRegistry.origin("/relative") == "/relative"
+
+    def test_limits_and_http2_follow_configuration(self):
+        registry = HTTPClientRegistry(max_connections=7, max_keepalive_connections=3, keepalive_expiry=5.0, http2=False)
+        limits = registry._limits()
+        assert limits.max_connections == 7
+        assert limits.max_keepalive_connections == 3
+        assert limits.keepalive_expiry == 5.0
+        assert registry.http2 is False
+
+    def test_client_reused_per_origin_and_loop(self):
+        registry = HTTPClientRegistry(http2=False)
+
+        async def run():
+            a = await registry.get_client("http://svc-a:8000/users/1")
+            b = await registry.get_client("http://svc-a:8000/health/")
+            c = await registry.get_client("http://svc-b:8000/x")
+            assert a is b
+            assert a is not c
+            assert registry.get_stats()["clients"] == 2
+            assert await registry.aclose_all() == 2
+            assert a.is_closed and c.is_closed
+
+        asyncio.run(run())
+
+    def test_new_loop_gets_new_client(self):
+        registry = HTTPClientRegistry(http2=False)
+        first = asyncio.run(registry.get_client("http://svc:8000"))
+        second = asyncio.run(registry.get_client("http://svc:8000"))
+        assert first is not second
+        # The client of the closed loop was forgotten, not leaked
+        assert registry.get_stats()["clients"] == 1
+
+    def test_concurrent_open_keeps_single_client(self):
+        registry = HTTPClientRegistry(http2=False)
+
+        async def run():
+            clients = await asyncio.gather(*(registry.get_client("http://svc:8000") for _ in range(5)))
+            assert len({id(c) for c in clients}) == 1
+            await registry.aclose_all()
+
+        asyncio.run(run())
+
+    def test_track_counts_requests_and_errors(self):
+        registry = HTTPClientRegistry(http2=False)
+        url = "http://svc:8000/ok"
+
+        async def run():
+            client = await registry.get_client(url)
+            client._transport = _transport(lambda request: httpx.Response(200, json={"ok": True}))
+            async with registry.track(url):
+                assert registry.get_stats()["pools"][0]["in_flight"] == 1
+                response = await client.get(url)
+            assert response.json() == {"ok": True}
+            with pytest.raises(ValueError):
+                async with registry.track(url):
+                    raise ValueError("boom")
+            pool = registry.get_stats()["pools"][0]
+            assert pool["requests"] == 2
+            assert pool["errors"] == 1
+            assert pool["in_flight"] == 0
+            await registry.aclose_all()
+
+        asyncio.run(run())
+
+    def test_close_all_from_sync_context(self):
+        registry = HTTPClientRegistry(http2=False)
+        loop = asyncio.new_event_loop()
+        try:
+            client = loop.run_until_complete(registry.get_client("http://svc:8000"))
+            assert registry.close_all() == 1
+            assert client.is_closed
+            assert registry.get_stats()["clients"] == 0
+        finally:
+            loop.close()
@@ -0,0 +1,136 @@
+"""
+Tests for the item vector store
+"""
+import pytest
+from unittest.mock import patch
+
+import numpy as np
+
+from app.services.item_vector_store import ItemVectorStore
+
+
+@pytest.mark.unit
+class TestItemVectorStore:
+    """Test ItemVectorStore"""
+
+    def test_in_memory_put_get(self):
+        store = ItemVectorStore(dim=4, capacity=8)
+        assert not store.shared
+        assert store.get("movies:inception", 1) is None
+        assert store.put("movies:inception", 1, np.array([1.0, -1.0, 0.0, 2.0]))
+        vec = store.get("movies:inception", 1)
+        assert vec.dtype == np.float32
+        assert vec.tolist() == [1.0, -1.0, 0.0, 2.0]
+        # Returned vectors are copies
+        vec += 5
+        assert store.get("movies:inception", 1).tolist() == [1.0, -1.0, 0.0, 2.0]
+
+    def test_checksum_mismatch_is_miss_and_put_replaces(self):
+        store = ItemVectorStore(dim=2, capacity=8)
+        store.put("places:park guell", 1, np.ones(2))
+        assert store.get("places:park guell", 2) is None
+        store.put("places:park guell", 2, np.zeros(2))
+        assert store.get("places:park guell", 2).tolist() == [0.0, 0.0]
+        assert len(store) == 1
+
+    def test_capacity_and_shape_limits(self):
+        store = ItemVectorStore(dim=2, capacity=1)
+        assert store.put("a", 1, np.ones(2))
+        # A full store makes room instead of refusing writes
+        assert store.put("b", 1, np.ones(2))
+        assert store.get("a", 1) is None
+        assert store.get("b", 1).tolist() == [1.0, 1.0]
+        assert not store.put("c", 1, np.ones(3))
+        assert store.get_stats()["rows_used"] == 1
+
+    def test_in_memory_compaction_reclaims_replaced_rows(self):
+        store = ItemVectorStore(dim=2, capacity=4)
+        for checksum in range(4):
+            store.put("movies:dune", checksum, np.full(2, checksum))
+        store.put("music:bach", 1, np.full(2, 9.0))
+        assert store.get_stats()["compactions"] == 1
+        assert store.get_stats()["rows_used"] == 2
+        assert store.get("movies:dune", 3).tolist() == [3.0, 3.0]
+        assert store.get("music:bach", 1).tolist() == [9.0, 9.0]
+
+    def test_shared_compaction_keeps_live_rows_and_readers_follow(self, tmp_path):
+        writer = ItemVectorStore(dim=2, capacity=8, path=str(tmp_path), signature="t")
+        reader = ItemVectorStore(dim=2, capacity=8, path=str(tmp_path), signature="t", refresh_interval=0)
+        for i in range(4):
+            writer.put(f"places:{i}", 1, np.full(2, float(i)))
+        for checksum in range(2, 6):
+            writer.put("places:0", checksum, np.full(2, 10.0 + checksum))
+        assert reader.get("places:1", 1).tolist() == [1.0, 1.0]
+
+        # Full: superseded rows for places:0 are dropped, nothing live is lost
+        assert writer.put("places:new", 1, np.full(2, 7.0))
+        stats = writer.get_stats()
+        assert stats["generation"] == 1 and stats["compactions"] == 1
+        assert stats["rows_used"] == 5
+        assert not (tmp_path / "items-t-2.f32").exists()
+
+        assert reader.get("places:new", 1).tolist() == [7.0, 7.0]
+        assert reader.get_stats()["generation"] == 1
+        assert reader.get("places:0", 5).tolist() == [15.0, 15.0]
+        assert reader.get("places:3", 1).tolist() == [3.0, 3.0]
+
+        reopened = ItemVectorStore(dim=2, capacity=8, path=str(tmp_path), signature="t")
+        assert len(reopened) == 5
+        assert reopened.get("places:new", 1).tolist() == [7.0, 7.0]
+
+    def test_shared_store_keeps_accepting_writes_past_capacity(self, tmp_path):
+        store = ItemVectorStore(dim=2, capacity=4, path=str(tmp_path), signature="t")
+        for i in range(20):
+            assert store.put(f"events:{i}", 1, np.full(2, float(i)))
+        # The newest entries survive; the oldest were evicted to make room
+        assert store.get("events:19", 1).tolist() == [19.0, 19.0]
+        assert store.get("events:0", 1) is None
+        assert store.get_stats()["rows_used"] <= 4
+
+    def test_shared_store_visible_across_instances(self, tmp_path):
+        writer = ItemVectorStore(dim=3, capacity=16, path=str(tmp_path), signature="t")
+        reader = ItemVectorStore(dim=3, capacity=16, path=str(tmp_path), signature="t")
+        assert writer.shared and reader.shared
+        assert writer.put("music:blinding lights", 7, np.array([1.0, 2.0, 3.0]))
+        # The reader picks up rows published after it opened the files
+        assert reader.get("music:blinding lights", 7).tolist() == [1.0, 2.0, 3.0]
+        assert reader.put("music:barcelona", 9, np.array([3.0, 2.0, 1.0]))
+        assert writer.get("music:barcelona", 9).tolist() == [3.0, 2.0, 1.0]
+
+        reopened = ItemVectorStore(dim=3, capacity=16, path=str(tmp_path), signature="t")
+        assert len(reopened) == 2
+        assert reopened.get_stats()["rows_used"] == 2
+
+    def test_read_path_refresh_is_rate_limited_and_skips_unchanged_files(self, tmp_path):
+        writer = ItemVectorStore(dim=2, capacity=8, path=str(tmp_path), signature="t")
+        reader = ItemVectorStore(dim=2, capacity=8, path=str(tmp_path), signature="t", refresh_interval=1.0)
+        clock = [100.0]
+        with patch("app.services.item_vector_store.time.monotonic", side_effect=lambda: clock[0]), \
+                patch.object(reader, "_refresh_index", wraps=reader._refresh_index) as refresh:
+            assert reader.get("places:1", 1) is None
+            assert refresh.call_count == 0  # nothing changed since open
+
+            writer.put("places:1", 1, np.full(2, 1.0))
+            assert reader.get("places:1", 1) is None  # inside the interval
+            assert refresh.call_count == 0
+
+            clock[0] += 1.0
+            assert reader.get("places:1", 1).tolist() == [1.0, 1.0]
+            assert refresh.call_count == 1
+
+            clock[0] += 1.0
+            assert reader.get("places:2", 1) is None
+            assert refresh.call_count == 1
+
+    def test_keys_with_line_breaks_are_cleaned(self, tmp_path):
+        store = ItemVectorStore(dim=2, capacity=4, path=str(tmp_path))
+        store.put("events:primavera\tsound\n", 1, np.ones(2))
+        reopened = ItemVectorStore(dim=2, capacity=4, path=str(tmp_path))
+        assert reopened.get("events:primavera sound", 1) is not None
+
+    def test_unusable_path_falls_back_to_memory(self, tmp_path):
+        blocker = tmp_path / "file"
+        blocker.write_text("x")
+        store = ItemVectorStore(dim=2, capacity=4, path=str(blocker / "sub"))
+        assert not store.shared
+        assert store.put("k", 1, np.ones(2))
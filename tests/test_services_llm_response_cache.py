@@ -0,0 +1,66 @@
+"""
+Tests for the LLM response cache
+"""
+import zlib
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.services.llm_response_cache import LLMResponseCache
+
+
+def _fake_redis():
+    store, ttls = {}, {}
+    client = MagicMock()
+    client.get.side_effect = lambda key: store.get(key)
+    client.setex.side_effect = lambda key, ttl, value: (store.__setitem__(key, value), ttls.__setitem__(key, ttl))
+    client.ttls = ttls
+    return client, store
+
+
+@pytest.mark.unit
+class TestLLMResponseCache:
+    """Test LLMResponseCache"""
+
+    def test_key_is_order_insensitive(self):
+        a = LLMResponseCache.key({"city": "barcelona", "preferences": ["jazz"], "date": "2024-05-01"})
+        b = LLMResponseCache.key({"date": "2024-05-01", "preferences": ["jazz"], "city": "barcelona"})
+        c = LLMResponseCache.key({"date": "2024-05-02", "preferences": ["jazz"], "city": "barcelona"})
+        assert a == b
+        assert a != c
+
+    def test_roundtrip_compressed_with_ttl(self):
+        client, store = _fake_redis()
+        cache = LLMResponseCache(redis_client=client, ttl_seconds=600, namespace="ns")
+        value = {"movies": [{"title": "Inception"}] * 20, "music": [], "places": [], "events": []}
+        assert cache.get("k") is None
+        assert cache.set("k", value)
+        raw = store["ns:llm_cache:k"]
+        assert client.ttls["ns:llm_cache:k"] == 600
+        assert len(raw) < len(str(value))
+        assert zlib.decompress(raw)
+        assert cache.get("k") == value
+        stats = cache.get_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+    def test_disabled_cache_is_a_no_op(self):
+        client, store = _fake_redis()
+        for cache in (LLMResponseCache(redis_client=client, enabled=False),
+                      LLMResponseCache(redis_client=client, ttl_seconds=0),
+                      LLMResponseCache(redis_client=None)):
+            assert not cache.set("k", {"movies": []})
+            assert cache.get("k") is None
+        assert store == {}
+
+    def test_corrupt_entries_and_errors_are_misses(self):
+        client, store = _fake_redis()
+        store["recommendations:llm_cache:k"] = b"not-zlib"
+        cache = LLMResponseCache(redis_client=client)
+        assert cache.get("k") is None
+
+        broken = MagicMock()
+        broken.get.side_effect = Exception("redis down")
+        broken.setex.side_effect = Exception("redis down")
+        cache = LLMResponseCache(redis_client=broken)
+        assert cache.get("k") is None
+        assert not cache.set("k", {"movies": []})
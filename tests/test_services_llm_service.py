@@ -1,8 +1,11 @@
+import asyncio
 import pytest
 import json
 import httpx
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
 from app.services.llm_service import LLMService
+from app.services.llm_response_cache import LLMResponseCache
+from app.services.notification_publisher import notification_publisher
 import time
 import threading
 import gc
@@ -10,6 +13,7 @@ import redis
 import math
 from datetime import datetime, timezone, timedelta
 import sys
+import numpy as np
 
 @pytest.mark.unit
 class TestLLMService:
@@ -125,6 +129,200 @@ class TestLLMService:
             assert result["error"] == "API error"
             mock_logger.error.assert_called_with("Error generating recommendations: API error")
 
+    @pytest.mark.asyncio
+    async def test_generate_recommendations_coalesces_concurrent_calls(self, llm_service):
+        """Concurrent identical requests share one LLM call."""
+        async def slow_llm(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return {"movies": [{"title": "Movie 1"}], "music": [], "places": [], "events": []}
+
+        with patch.object(llm_service, '_call_llm_api', AsyncMock(side_effect=slow_llm)) as mock_call, \
+             patch.object(llm_service, '_store_in_redis') as mock_store:
+            first, second = await asyncio.gather(
+                llm_service.generate_recommendations("test prompt", "user_123", "Barcelona"),
+                llm_service.generate_recommendations("test prompt", "user_123", "Barcelona"),
+            )
+            other_city = await llm_service.generate_recommendations("test prompt", "user_123", "Madrid")
+            assert first is second
+            assert other_city["current_city"] == "Madrid"
+            assert mock_call.call_count == 2
+            assert mock_store.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_response_cache(self, llm_service):
+        """Requests with identical generation inputs reuse the cached provider response."""
+        store = {}
+        cache_redis = MagicMock()
+        cache_redis.get.side_effect = lambda key: store.get(key)
+        cache_redis.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value)
+        llm_service._llm_response_cache = LLMResponseCache(redis_client=cache_redis)
+        with patch('httpx.AsyncClient') as mock_client, \
+             patch('app.services.llm_service.time.strftime', return_value="2024-05-01"):
+            mock_response = Mock()
+            mock_response.json.return_value = {"result": {"movies": [{"title": "Movie 1"}]}}
+            mock_response.raise_for_status = Mock()
+            post = AsyncMock(return_value=mock_response)
+            mock_client.return_value.__aenter__.return_value.post = post
+
+            first = await llm_service._call_llm_api("Suggest films", None, "Barcelona")
+            second = await llm_service._call_llm_api("Suggest films", None, "Barcelona")
+            assert post.call_count == 1
+            assert [m["title"] for m in first["movies"]] == [m["title"] for m in second["movies"]]
+            assert llm_service._llm_response_cache.get_stats()["hits"] == 1
+
+            await llm_service._call_llm_api("Suggest films", None, "Madrid")
+            await llm_service._call_llm_api("Suggest films for tonight", None, "Barcelona")
+            assert post.call_count == 3
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("build", [
+        lambda builder: builder.build_fallback_prompt(max_results=5),
+        lambda builder: builder.build_custom_prompt("Jazz bars for tonight", "Barcelona", 5),
+    ], ids=["fallback", "custom"])
+    async def test_call_llm_api_response_cache_ignores_prompt_time(self, llm_service, build):
+        """Timestamped prompts built seconds apart still share a cached response."""
+        from app.utils.prompt_builder import PromptBuilder
+
+        store = {}
+        cache_redis = MagicMock()
+        cache_redis.get.side_effect = lambda key: store.get(key)
+        cache_redis.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value)
+        llm_service._llm_response_cache = LLMResponseCache(redis_client=cache_redis)
+        builder = PromptBuilder()
+        with patch('app.utils.prompt_builder.time.gmtime', return_value=time.gmtime(1714564800)):
+            first_prompt = build(builder)
+        with patch('app.utils.prompt_builder.time.gmtime', return_value=time.gmtime(1714564807)):
+            second_prompt = build(builder)
+        assert first_prompt != second_prompt
+
+        with patch('httpx.AsyncClient') as mock_client:
+            mock_response = Mock()
+            mock_response.json.return_value = {"result": {"movies": [{"title": "Movie 1"}]}}
+            mock_response.raise_for_status = Mock()
+            post = AsyncMock(return_value=mock_response)
+            mock_client.return_value.__aenter__.return_value.post = post
+
+            await llm_service._call_llm_api(first_prompt, None, "Barcelona")
+            await llm_service._call_llm_api(second_prompt, None, "Barcelona")
+
+        assert post.call_count == 1
+        assert llm_service._llm_response_cache.get_stats()["hits"] == 1
+
+    def test_llm_cache_key_covers_personalising_inputs(self, llm_service):
+        """Users with the same interests but different personal details never share an entry."""
+        from app.utils.prompt_builder import PromptBuilder
+        from app.core.constants import RecommendationType
+
+        def inputs(name, age, home, city, engagement):
+            context = {
+                "user_profile": {"user_id": name.lower(), "name": name, "age": age, "interests": ["jazz", "art"],
+                                 "preferences": {}, "email": f"{name.lower()}@example.com"},
+                "location_data": {"user_id": name.lower(), "current_location": city, "home_location": home},
+                "interaction_data": {"user_id": name.lower(), "engagement_score": engagement},
+            }
+            prompt = PromptBuilder().build_recommendation_prompt(
+                recommendation_type=RecommendationType.PLACE, max_results=5, **context
+            )
+            return prompt, city, context
+
+        alice = inputs("Alice", 23, "Paris", "Paris", 0.9)
+        bob = inputs("Bob", 67, "Tokyo", "Paris", 0.1)
+        assert llm_service._llm_cache_key(*alice) != llm_service._llm_cache_key(*bob)
+        assert llm_service._llm_cache_key(*alice) == llm_service._llm_cache_key(*inputs("Alice", 23, "Paris", "Paris", 0.9))
+
+        prompt, city, context = alice
+        older = dict(context, user_profile=dict(context["user_profile"], age=24))
+        assert llm_service._llm_cache_key(prompt, city, context) != llm_service._llm_cache_key(prompt, city, older)
+
+    def _streaming_client(self, parts, delay_after=None, delay=0.0, content_type="application/json"):
+        """AsyncClient whose /process-text response body arrives in ``parts``."""
+        state = {"finished": False}
+
+        async def body():
+            for i, part in enumerate(parts):
+                if delay_after is not None and i == delay_after:
+                    await asyncio.sleep(delay)
+                yield part.encode()
+            state["finished"] = True
+
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, headers={"content-type": content_type}, content=body())
+        )
+        return httpx.AsyncClient(transport=transport), state
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_streaming_ranks_categories_as_they_arrive(self, llm_service):
+        """Streamed categories are ranked before the body has finished arriving."""
+        body = json.dumps({"result": {
+            "movies": [{"title": "Movie 1"}, {"title": "Movie 2"}],
+            "music": [{"title": "Song 1"}], "places": [], "events": []
+        }})
+        client, state = self._streaming_client([body[i:i + 16] for i in range(0, len(body), 16)])
+        ranked_while_streaming = {}
+        original_rank = llm_service._rank_category
+
+        def spy(category, items, *args, **kwargs):
+            ranked_while_streaming[category] = not state["finished"]
+            return original_rank(category, items, *args, **kwargs)
+
+        with patch.object(llm_service, '_llm_streaming_enabled', return_value=True), \
+             patch('app.services.llm_service.http_client_registry.get_client', AsyncMock(return_value=client)), \
+             patch.object(llm_service, '_rank_category', side_effect=spy):
+            result = await llm_service._call_llm_api("test prompt", None, "Barcelona")
+
+        assert [m["title"] for m in result["movies"]] and len(result["movies"]) == 2
+        assert all("ranking_score" in m for m in result["movies"])
+        assert len(result["music"]) == 1
+        assert ranked_while_streaming["movies"] is True
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_streaming_fills_missing_and_caches_only_complete(self, llm_service):
+        """Missing streamed categories go through _fill_missing_categories; incomplete responses are not cached."""
+        partial = json.dumps({"result": {"movies": [{"title": "Movie 1"}], "music": []}})
+        complete = json.dumps({"result": {"movies": [{"title": "Movie 1"}], "music": [], "places": [], "events": []}})
+        original_fill = llm_service._fill_missing_categories
+        for body, cached in ((partial, False), (complete, True)):
+            client, _ = self._streaming_client([body])
+            with patch.object(llm_service, '_llm_streaming_enabled', return_value=True), \
+                 patch('app.services.llm_service.http_client_registry.get_client', AsyncMock(return_value=client)), \
+                 patch.object(llm_service, '_fill_missing_categories', side_effect=original_fill) as mock_fill, \
+                 patch.object(llm_service._llm_response_cache, 'set') as mock_cache_set:
+                result = await llm_service._call_llm_api("test prompt", None, "Barcelona")
+            mock_fill.assert_awaited_once()
+            assert set(result) == {"movies", "music", "places", "events"}
+            assert [m["title"] for m in result["movies"]] == ["Movie 1"]
+            assert mock_cache_set.called is cached
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_streaming_sse_deltas(self, llm_service):
+        """Server-sent event deltas are reassembled before parsing."""
+        body = json.dumps({"movies": [{"title": "Movie 1"}], "music": [], "places": [], "events": []})
+        events = [f"data: {json.dumps({'delta': body[i:i + 10]})}\n\n" for i in range(0, len(body), 10)]
+        client, _ = self._streaming_client(events + ["data: [DONE]\n\n"], content_type="text/event-stream")
+        with patch.object(llm_service, '_llm_streaming_enabled', return_value=True), \
+             patch('app.services.llm_service.http_client_registry.get_client', AsyncMock(return_value=client)):
+            result = await llm_service._call_llm_api("test prompt", None, "Barcelona")
+        assert [m["title"] for m in result["movies"]] == ["Movie 1"]
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_streaming_partial_on_timeout(self, llm_service):
+        """A stalled stream returns the categories completed so far."""
+        parts = ['{"movies": [{"title": "Movie 1"}], ', '"music": [{"title": "Song 1"}]}']
+        client, _ = self._streaming_client(parts, delay_after=1, delay=5.0)
+        with patch.object(llm_service, '_llm_streaming_enabled', return_value=True), \
+             patch.object(llm_service, '_llm_stream_timeout', return_value=0.2), \
+             patch('app.services.llm_service.http_client_registry.get_client', AsyncMock(return_value=client)):
+            result = await llm_service._call_llm_api("test prompt", None, "Barcelona")
+        assert [m["title"] for m in result["movies"]] == ["Movie 1"]
+        assert result["music"] == [] and result["places"] == [] and result["events"] == []
+
+        client, _ = self._streaming_client(parts, delay_after=0, delay=5.0)
+        with patch.object(llm_service, '_llm_streaming_enabled', return_value=True), \
+             patch.object(llm_service, '_llm_stream_timeout', return_value=0.2), \
+             patch('app.services.llm_service.http_client_registry.get_client', AsyncMock(return_value=client)):
+            result = await llm_service._call_llm_api("test prompt", None, "Barcelona")
+        assert result == llm_service._get_fallback_recommendations()
+
     @pytest.mark.asyncio
     async def test_call_llm_api_success(self, llm_service):
         """Test successful LLM API call."""
@@ -257,7 +455,7 @@ class TestLLMService:
     def test_process_llm_recommendations_exception_path(self, llm_service):
         """Force an exception inside processing to cover error path."""
         recommendations = {"movies": [{"title": "Movie 1"}]}
-        with patch.object(llm_service, '_compute_ranking_score', side_effect=Exception("boom")):
+        with patch.object(llm_service, '_compute_ranking_scores', side_effect=Exception("boom")):
             result = llm_service._process_llm_recommendations(recommendations, "user_123")
             assert result == {"movies": [], "music": [], "places": [], "events": []}
 
@@ -268,28 +466,46 @@ class TestLLMService:
             assert result == {"movies": [], "music": [], "places": [], "events": []}
             mock_logger.info.assert_called_with("Using fallback recommendations due to API failure")
 
-    def test_store_in_redis(self, llm_service):
-        """Test storing recommendations in Redis."""
+    @pytest.fixture
+    def publisher_client(self):
+        """Pooled client of the notification publisher, which writes the recommendations."""
+        client = MagicMock()
+        with patch.object(notification_publisher, '_client', client):
+            yield client
+
+    def test_store_in_redis(self, llm_service, publisher_client):
+        """Test storing recommendations and publishing the notification in one pipeline."""
         data = {"recommendations": {"movies": []}}
+        pipe = publisher_client.pipeline.return_value
+        pipe.execute.return_value = [True, 1]
         with patch('app.services.llm_service.redis.Redis') as mock_redis_pub, \
              patch('app.services.llm_service.logger') as mock_logger:
-            mock_pub_client = MagicMock()
-            mock_redis_pub.return_value = mock_pub_client
             llm_service._store_in_redis("user_123", data)
-            llm_service.redis_client.setex.assert_called_with(
+            publisher_client.pipeline.assert_called_with(transaction=False)
+            pipe.setex.assert_called_with(
                 "recommendations:user_123", 86400, json.dumps(data, default=str)
             )
-            mock_redis_pub.assert_called_with(host="localhost", port=6379, password='', db=0, decode_responses=True, socket_connect_timeout=3, socket_timeout=5)
-            mock_pub_client.publish.assert_called()
+            channel, message = pipe.publish.call_args[0]
+            assert channel == "notifications:user"
+            assert json.loads(message)["user_id"] == "user_123"
+            pipe.execute.assert_called_once()
+            # No per-call client; the publisher's pooled connection does the write
+            mock_redis_pub.assert_not_called()
+            llm_service.redis_client.pipeline.assert_not_called()
             mock_logger.info.assert_called()
 
-    def test_store_in_redis_publish_error(self, llm_service):
+    def test_store_in_redis_serializes_once(self, llm_service, publisher_client):
+        """The payload is serialized a single time."""
+        data = {"recommendations": {"movies": []}}
+        publisher_client.pipeline.return_value.execute.return_value = [True, 1]
+        with patch('app.services.llm_service.json.dumps', wraps=json.dumps) as mock_dumps:
+            llm_service._store_in_redis("user_123", data)
+            assert sum(1 for c in mock_dumps.call_args_list if c.args and c.args[0] is data) == 1
+
+    def test_store_in_redis_publish_error(self, llm_service, publisher_client):
         """Test Redis storage with publish error."""
-        with patch('app.services.llm_service.redis.Redis') as mock_redis_pub, \
-             patch('app.services.llm_service.logger') as mock_logger:
-            mock_pub_client = MagicMock()
-            mock_pub_client.publish.side_effect = Exception("Publish error")
-            mock_redis_pub.return_value = mock_pub_client
+        publisher_client.pipeline.return_value.execute.return_value = [True, Exception("Publish error")]
+        with patch('app.services.llm_service.logger') as mock_logger:
             llm_service._store_in_redis("user_123", {"recommendations": {"movies": []}})
             assert mock_logger.error.called
             args, kwargs = mock_logger.error.call_args
@@ -297,12 +513,126 @@ class TestLLMService:
             assert kwargs.get("user_id") == "user_123"
             assert kwargs.get("error") == "Publish error"
 
-    def test_store_in_redis_setex_error(self, llm_service):
+    def test_store_in_redis_setex_error(self, llm_service, publisher_client):
         """Test Redis setex failure doesn't raise and logs error."""
-        llm_service.redis_client.setex.side_effect = Exception("setex error")
+        publisher_client.pipeline.return_value.execute.return_value = [Exception("setex error"), 1]
         with patch('app.services.llm_service.logger') as mock_logger:
             llm_service._store_in_redis("user_123", {"recommendations": {}})
             assert mock_logger.error.called
+            args, kwargs = mock_logger.error.call_args
+            assert "Error storing recommendations in Redis" in args[0]
+
+    def test_store_many_in_redis(self, llm_service, publisher_client):
+        """Several users are written in one pipeline with one grouped notification."""
+        pipe = publisher_client.pipeline.return_value
+        pipe.execute.return_value = [True, True, 1]
+        responses = {
+            "u1": {"recommendations": {"movies": []}},
+            "u2": {"recommendations": {"music": []}},
+            "bad": {"recommendations": "not-a-dict"},
+        }
+        assert llm_service.store_many_in_redis(responses) == ["u1", "u2"]
+        assert pipe.setex.call_count == 2
+        pipe.setex.assert_any_call("recommendations:u2", 86400, json.dumps(responses["u2"], default=str))
+        assert json.loads(pipe.publish.call_args[0][1])["user_ids"] == ["u1", "u2"]
+        pipe.execute.assert_called_once()
+
+    def test_store_many_in_redis_publish_error(self, llm_service, publisher_client):
+        """A failed PUBLISH still reports the stored users."""
+        publisher_client.pipeline.return_value.execute.return_value = [True, Exception("Publish error")]
+        with patch('app.services.llm_service.logger') as mock_logger:
+            assert llm_service.store_many_in_redis({"u1": {"recommendations": {"movies": []}}}) == ["u1"]
+            assert "Failed to publish batch notification" in mock_logger.error.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_generate_recommendations_without_store(self, llm_service):
+        """store=False leaves the write to the caller."""
+        with patch.object(llm_service, '_call_llm_api', AsyncMock(return_value={"movies": [], "music": [], "places": [], "events": []})), \
+             patch.object(llm_service, '_store_in_redis') as mock_store:
+            result = await llm_service.generate_recommendations("prompt", "user_123", store=False)
+            assert result["success"] is True
+            mock_store.assert_not_called()
+
+    def test_input_fingerprint(self, llm_service):
+        """Fingerprints ignore dict key order and track each data source separately."""
+        context = {"user_profile": {"age": 30, "interests": ["music"]}, "location_data": {"current_location": "Paris"},
+                   "interaction_data": {"engagement_score": 0.5}}
+        reordered = {"interaction_data": {"engagement_score": 0.5}, "location_data": {"current_location": "Paris"},
+                     "user_profile": {"interests": ["music"], "age": 30}}
+        assert llm_service.input_fingerprint(context) == llm_service.input_fingerprint(reordered)
+        changed = dict(context, interaction_data={"engagement_score": 0.9})
+        before, after = llm_service.input_fingerprint(context), llm_service.input_fingerprint(changed)
+        assert before["inputs"] != after["inputs"]
+        assert before["interaction_data"] != after["interaction_data"]
+        assert before["user_profile"] == after["user_profile"]
+
+    def test_plan_incremental_refresh(self, llm_service):
+        """Unchanged users are extended, interaction-only changes rescored, the rest regenerated."""
+        context = {"user_profile": {"age": 30}, "location_data": {"current_location": "Paris"},
+                   "interaction_data": {"engagement_score": 0.5}}
+        fingerprint = llm_service.input_fingerprint(context)
+        fresh = {"success": True, "generated_at": time.time() - 60, "recommendations": {}, "input_fingerprint": fingerprint}
+        stale = dict(fresh, generated_at=time.time() - 7200)
+        cached = {"same": fresh, "interaction": fresh, "location": fresh, "stale": stale,
+                  "legacy": {"generated_at": time.time(), "recommendations": {}}}
+        contexts = {
+            "same": context,
+            "interaction": dict(context, interaction_data={"engagement_score": 0.9}),
+            "location": dict(context, location_data={"current_location": "Rome"}),
+            "stale": context,
+            "legacy": context,
+            "missing": context,
+        }
+        with patch.object(llm_service, 'get_multiple_recommendations', return_value=cached):
+            plan = llm_service.plan_incremental_refresh(contexts, max_age_seconds=3600)
+        actions = {user_id: entry["action"] for user_id, entry in plan.items()}
+        assert actions == {"same": "extend", "interaction": "rescore", "location": "regenerate",
+                           "stale": "regenerate", "legacy": "regenerate", "missing": "regenerate"}
+        assert plan["interaction"]["cached"] is fresh
+        assert plan["stale"]["cached"] is None
+
+    def test_extend_recommendations_ttl(self, llm_service):
+        """TTLs are reset in one pipeline; keys that are gone are not reported."""
+        pipe = llm_service.redis_client.pipeline.return_value.__enter__.return_value
+        pipe.execute.return_value = [True, False]
+        assert llm_service.extend_recommendations_ttl(["u1", "u2"]) == ["u1"]
+        pipe.expire.assert_any_call("recommendations:u1", 86400)
+        assert llm_service.extend_recommendations_ttl([]) == []
+
+    def test_rescore_recommendations_keeps_generation_time(self, llm_service):
+        """Rescoring re-ranks stored items and records the new fingerprint without calling the LLM."""
+        cached = {
+            "success": True, "generated_at": 100.0, "current_city": "Paris",
+            "recommendations": {"places": [{"title": "A"}, {"title": "B"}], "movies": []},
+            "metadata": {"total_recommendations": 2},
+        }
+        context = {"user_profile": None, "location_data": None, "interaction_data": {"engagement_score": 0.9}}
+
+        def rank(category, items, ranking_context, user_id, current_city):
+            items.reverse()
+            return items
+
+        with patch.object(llm_service, '_prepare_ranking_context', return_value={}) as mock_context, \
+             patch.object(llm_service, '_rank_category', side_effect=rank) as mock_rank, \
+             patch.object(llm_service, '_call_llm_api') as mock_llm:
+            result = llm_service.rescore_recommendations(cached, "u1", context)
+        mock_llm.assert_not_called()
+        mock_context.assert_called_once_with("u1", context)
+        assert mock_rank.call_count == 1
+        assert [item["title"] for item in result["recommendations"]["places"]] == ["B", "A"]
+        assert [item["title"] for item in cached["recommendations"]["places"]] == ["A", "B"]
+        assert result["generated_at"] == 100.0 and "rescored_at" in result
+        assert result["input_fingerprint"] == llm_service.input_fingerprint(context)
+
+    @pytest.mark.asyncio
+    async def test_generated_payload_carries_input_fingerprint(self, llm_service):
+        """Responses generated from a known user context record its fingerprint."""
+        context = {"user_profile": {"age": 30}, "location_data": None, "interaction_data": None}
+        with patch.object(llm_service, '_call_llm_api', AsyncMock(return_value={"movies": [], "music": [], "places": [], "events": []})):
+            result = await llm_service.generate_recommendations("prompt", "user_123", user_context=context, store=False)
+            assert result["input_fingerprint"] == llm_service.input_fingerprint(context)
+            result = await llm_service.generate_recommendations("prompt", "user_456", store=False)
+            assert "input_fingerprint" not in result
 
     def test_get_recommendations_from_redis(self, llm_service):
         """Test retrieving recommendations from Redis."""
@@ -562,7 +892,7 @@ class TestLLMService:
         }
         
         with patch.object(llm_service, '_get_user_interaction_history', return_value={}), \
-             patch.object(llm_service, '_compute_ranking_score', side_effect=[0.1, 0.5, 0.9]), \
+             patch.object(llm_service, '_compute_ranking_scores', return_value=[0.1, 0.5, 0.9]), \
              patch.object(llm_service, '_generate_personalized_reason', return_value="Reason"):
             result = llm_service._process_llm_recommendations(recommendations, "user_123")
             
@@ -582,7 +912,7 @@ class TestLLMService:
         }
         
         with patch.object(llm_service, '_get_user_interaction_history', return_value={}), \
-             patch.object(llm_service, '_compute_ranking_score', return_value=0.5), \
+             patch.object(llm_service, '_compute_ranking_scores', side_effect=lambda items, *a, **k: [0.5] * len(items)), \
              patch.object(llm_service, '_generate_personalized_reason', return_value="Reason"):
             result = llm_service._process_llm_recommendations(recommendations, "user_123")
             
@@ -728,7 +1058,8 @@ class TestLLMService:
             ]
         }
         
-        score = llm_service._compute_ranking_score(item, "movies", history)
+        with patch.object(llm_service, '_torch_available', return_value=False):
+            score = llm_service._compute_ranking_score(item, "movies", history)
         # Should be lower due to negative interaction
         assert score < 0.5
 
@@ -752,8 +1083,9 @@ class TestLLMService:
         future_item = {"name": "Future Event", "date": future_date}
         past_item = {"name": "Past Event", "date": past_date}
 
-        future_score = llm_service._compute_ranking_score(future_item, "events", {})
-        past_score = llm_service._compute_ranking_score(past_item, "events", {})
+        with patch.object(llm_service, '_torch_available', return_value=False):
+            future_score = llm_service._compute_ranking_score(future_item, "events", {})
+            past_score = llm_service._compute_ranking_score(past_item, "events", {})
 
         assert 0.0 <= past_score <= 1.5
         assert past_score <= future_score
@@ -1221,10 +1553,206 @@ class TestLLMService:
             assert "movies" in result
 
     def test_compute_ranking_score_exception_fallback(self, llm_service):
-        with patch.object(llm_service, '_build_user_embedding', side_effect=Exception("boom")):
+        with patch.object(llm_service, '_torch_available', return_value=False), \
+             patch.object(llm_service, '_build_user_embedding', side_effect=Exception("boom")):
             score = llm_service._compute_ranking_score({"title": "X"}, "movies", {})
             assert score == 0.5
 
+    def test_compute_ranking_scores_matches_single_item_path(self, llm_service):
+        history = llm_service._get_user_interaction_history("user_123")
+        user_profile = {"interests": ["jazz", "museum"], "preferences": {"style": "very likely urban"}}
+        location_data = {"current_location": {"city": "Barcelona"}}
+        items = [
+            {"title": "Jazz Night", "genre": "Jazz", "rating": "8.5/10", "year": "2020"},
+            {"title": "Urban Park", "genre": "Drama", "distance_from_user": 3},
+            {"title": "Plain"},
+            {},
+        ]
+        batch = llm_service._compute_ranking_scores(items, "movies", history, user_profile, location_data, {})
+        single = [
+            llm_service._compute_ranking_score(item, "movies", history, user_profile, location_data, {})
+            for item in items
+        ]
+        assert batch == pytest.approx(single)
+
+    def test_compute_ranking_scores_empty_and_fallback(self, llm_service):
+        assert llm_service._compute_ranking_scores([], "movies", {}) == []
+        with patch.object(llm_service, '_torch_available', return_value=False), \
+             patch.object(llm_service, '_user_embedding_array', side_effect=Exception("boom")):
+            scores = llm_service._compute_ranking_scores([{"title": "X"}, {"title": "Y"}], "movies", {})
+            assert scores == [0.5, 0.5]
+
+    def test_get_user_vector_uses_embedding_cache(self, llm_service):
+        from app.services.embedding_cache import UserEmbeddingCache
+        llm_service._embedding_cache = UserEmbeddingCache(redis_client=None)
+        history = llm_service._get_user_interaction_history("user_123")
+        profile = {"interests": ["jazz"]}
+        first = llm_service._get_user_vector("user_123", profile, {}, history, {})
+        with patch.object(llm_service, '_user_embedding_array') as mock_build:
+            second = llm_service._get_user_vector("user_123", profile, {}, history, {})
+            assert not mock_build.called
+        assert np.array_equal(first, second)
+        assert first.dtype == np.float32
+        # A new interaction changes the fingerprint and forces a rebuild
+        history["movies"].append({"title": "Heat", "genre": "Crime", "action": "liked", "timestamp": "2024-08-20T10:00:00Z"})
+        with patch.object(llm_service, '_user_embedding_array', return_value=np.zeros(128)) as mock_build:
+            llm_service._get_user_vector("user_123", profile, {}, history, {})
+            assert mock_build.called
+
+    def test_item_embedding_reuses_item_vector_store(self, llm_service):
+        from app.services.item_vector_store import ItemVectorStore
+        llm_service._item_vector_store = ItemVectorStore(dim=128, capacity=16)
+        item = {"title": "Inception", "genre": "Science Fiction", "rating": 8.8}
+        first = llm_service._build_item_embedding(item, "movies")
+        with patch.object(llm_service, '_hashing_vector', wraps=llm_service._hashing_vector) as spy:
+            second = llm_service._build_item_embedding(dict(item), "movies")
+            hashed_texts = [c.args[0] for c in spy.call_args_list]
+        assert first == second
+        assert not any("Inception" in t for t in hashed_texts)
+        assert llm_service._item_vector_store.get_stats()["hits"] == 1
+        # Same title with a different description is re-embedded
+        changed = dict(item, description="A heist inside dreams")
+        llm_service._build_item_embedding(changed, "movies")
+        assert llm_service._item_vector_store.get_stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_assemble_user_context_reuses_provided_sources(self, llm_service):
+        services = {
+            "user_profile": (Mock(get_user_profile=AsyncMock()), "get_user_profile"),
+            "location_data": (Mock(get_location_data=AsyncMock(return_value={"current_location": "Paris"})), "get_location_data"),
+            "interaction_data": (Mock(get_interaction_data=AsyncMock(return_value=None)), "get_interaction_data"),
+        }
+        llm_service._context_services = services
+        profile = Mock(safe_dump=Mock(return_value={"interests": ["jazz"]}))
+        context = await llm_service._assemble_user_context("user_123", {"user_profile": profile})
+        assert context["user_profile"] == {"interests": ["jazz"]}
+        assert context["location_data"] == {"current_location": "Paris"}
+        assert context["interaction_data"] is None
+        services["user_profile"][0].get_user_profile.assert_not_called()
+        services["location_data"][0].get_location_data.assert_awaited_once_with("user_123")
+
+    @pytest.mark.asyncio
+    async def test_assemble_user_context_concurrent_with_partial_results(self, llm_service):
+        import asyncio
+
+        async def slow(user_id):
+            await asyncio.sleep(1)
+            return {"never": True}
+
+        async def quick(user_id):
+            await asyncio.sleep(0.05)
+            return {"engagement_score": 0.7}
+
+        async def broken(user_id):
+            raise RuntimeError("cis down")
+
+        llm_service._context_services = {
+            "user_profile": (Mock(get_user_profile=slow), "get_user_profile"),
+            "location_data": (Mock(get_location_data=broken), "get_location_data"),
+            "interaction_data": (Mock(get_interaction_data=quick), "get_interaction_data"),
+        }
+        with patch.object(llm_service, '_context_fetch_timeout', return_value=0.2):
+            start = time.time()
+            context = await llm_service._assemble_user_context("user_123")
+            elapsed = time.time() - start
+        assert context == {"user_profile": None, "location_data": None, "interaction_data": {"engagement_score": 0.7}}
+        assert elapsed < 0.5
+
+    @pytest.mark.asyncio
+    async def test_call_llm_api_passes_assembled_context(self, llm_service):
+        provided = {"user_profile": {"interests": ["jazz"]}, "location_data": None, "interaction_data": None}
+        with patch('httpx.AsyncClient') as mock_client, \
+             patch.object(llm_service, '_fill_missing_categories', AsyncMock(side_effect=lambda p, recs, c: recs)), \
+             patch.object(llm_service, '_process_llm_recommendations', return_value={"movies": []}) as mock_process:
+            mock_response = Mock()
+            mock_response.json.return_value = {"result": {"movies": [{"title": "A"}]}}
+            mock_response.raise_for_status = Mock()
+            mock_response.status_code = 200
+            mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
+            await llm_service._call_llm_api("p", "user_123", "BCN", user_context=provided)
+        assert mock_process.call_args.kwargs["user_context"] == provided
+
+    def test_process_llm_recommendations_uses_given_context(self, llm_service):
+        context = {"user_profile": {"interests": ["jazz"]}, "location_data": None, "interaction_data": None}
+        with patch.object(llm_service, '_get_user_interaction_history', return_value={}), \
+             patch.object(llm_service, '_resolve_user_context_blocking') as mock_resolve, \
+             patch.object(llm_service, '_compute_ranking_scores', side_effect=lambda items, *a, **k: [0.5] * len(items)) as mock_scores:
+            llm_service._process_llm_recommendations({"movies": [{"title": "A"}]}, "user_123", user_context=context)
+        mock_resolve.assert_not_called()
+        assert mock_scores.call_args.args[3] == {"interests": ["jazz"]}
+
+    def test_compute_ranking_scores_two_tower_batch_matches_single(self, llm_service):
+        if not llm_service._torch_available():
+            pytest.skip("torch not available")
+        llm_service._init_two_tower_if_needed()
+        assert llm_service._two_tower_model is not None
+        llm_service._two_tower_trained = True
+        history = llm_service._get_user_interaction_history("user_123")
+        user_profile = {"interests": ["jazz"], "age": 30}
+        items = [
+            {"title": "Jazz Night", "genre": "Jazz", "rating": "8.5/10"},
+            {"title": "Quiet Film", "genre": "Drama", "distance_from_user": 12},
+            {},
+        ]
+        batch = llm_service._compute_ranking_scores(items, "movies", history, user_profile, {}, {})
+        single = [
+            llm_service._compute_ranking_score(item, "movies", history, user_profile, {}, {})
+            for item in items
+        ]
+        assert batch == pytest.approx(single, abs=1e-5)
+
+    def test_ranking_is_deterministic_without_trained_weights(self):
+        """Untrained two-tower weights are never used, so separate instances rank identically."""
+        items = [{"title": "Jazz Night", "genre": "Jazz"}, {"title": "Quiet Film", "genre": "Drama"}, {"title": "Rock Gig"}]
+        profile = {"interests": ["jazz"], "age": 30}
+        with patch('app.services.llm_service.redis.Redis') as mock_redis:
+            mock_redis.return_value = MagicMock()
+            first, second = LLMService(timeout=1), LLMService(timeout=1)
+        scores = [svc._compute_ranking_scores(items, "movies", {}, profile, {}, {}) for svc in (first, second)]
+        assert scores[0] == scores[1]
+        assert first._two_tower_ready() is False
+        assert first._two_tower_model is None
+
+    def test_two_tower_used_once_trained_weights_are_loaded(self, llm_service, tmp_path):
+        if not llm_service._torch_available():
+            pytest.skip("torch not available")
+        import torch as _torch
+        from app.services import llm_service as mod
+        weights = tmp_path / "two_tower.pt"
+        _torch.save(mod.TwoTowerModel(50000, 64, 8, 8, 64).state_dict(), weights)
+        with patch('app.services.llm_service.settings') as mock_settings:
+            mock_settings.two_tower_weights_path = str(weights)
+            assert llm_service._two_tower_ready() is True
+        with patch.object(llm_service, '_two_tower_similarities', return_value=np.zeros(1)) as mock_sims:
+            llm_service._compute_ranking_scores([{"title": "A"}], "movies", {}, {}, {}, {})
+        mock_sims.assert_called_once()
+
+        with patch('app.services.llm_service.settings') as mock_settings:
+            mock_settings.two_tower_weights_path = str(tmp_path / "missing.pt")
+            with patch('app.services.llm_service.redis.Redis'):
+                fresh = LLMService(timeout=1)
+            assert fresh._two_tower_ready() is False
+
+    def test_two_tower_score_items_batched_forward(self, llm_service):
+        if not llm_service._torch_available():
+            pytest.skip("torch not available")
+        from app.services import llm_service as mod
+        import torch as _torch
+        model = mod.TwoTowerModel(100, 8, 8, 8, 8)
+        model.eval()
+        u_tok = _torch.tensor([1, 2, 3], dtype=_torch.long)
+        u_num = _torch.zeros(8, dtype=_torch.float32)
+        i_tok = _torch.tensor([4, 5, 6, 7, 8], dtype=_torch.long)
+        i_offsets = _torch.tensor([0, 2], dtype=_torch.long)
+        i_num = _torch.zeros((2, 8), dtype=_torch.float32)
+        with _torch.no_grad():
+            sims = model.score_items(u_tok, u_num, i_tok, i_offsets, i_num)
+            first = model(u_tok, u_num, i_tok[:2], i_num[0])
+            second = model(u_tok, u_num, i_tok[2:], i_num[1])
+        assert sims.shape == (2,)
+        assert sims[0].item() == pytest.approx(first.item(), abs=1e-5)
+        assert sims[1].item() == pytest.approx(second.item(), abs=1e-5)
+
     def test_two_tower_class_definitions_cover(self, llm_service):
         # Cover nested class definitions when torch is available
         if not llm_service._torch_available():
@@ -0,0 +1,97 @@
+"""
+Tests for the notification publisher
+"""
+import json
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.services.notification_publisher import (
+    NotificationPublisher,
+    NotificationPublishError,
+    NOTIFICATION_CHANNEL,
+    RECOMMENDATIONS_DB,
+)
+
+
+@pytest.mark.unit
+class TestNotificationPublisher:
+    """Test NotificationPublisher"""
+
+    def test_encode(self):
+        payload = json.loads(NotificationPublisher.encode(123))
+        assert payload == {
+            "type": "notification",
+            "user_id": "123",
+            "message": {"content": "Your new recommendations are ready!"},
+        }
+
+    def test_store_and_publish_single_pipeline(self):
+        store = MagicMock()
+        pipe = store.pipeline.return_value
+        pipe.execute.return_value = [True, 2]
+        publisher = NotificationPublisher(redis_client=store)
+        assert publisher.store_and_publish("recommendations:u1", 60, "{}", "u1") == 2
+        store.pipeline.assert_called_once_with(transaction=False)
+        pipe.setex.assert_called_once_with("recommendations:u1", 60, "{}")
+        pipe.publish.assert_called_once_with(NOTIFICATION_CHANNEL, NotificationPublisher.encode("u1"))
+        pipe.execute.assert_called_once_with(raise_on_error=False)
+
+    def test_store_and_publish_errors(self):
+        store = MagicMock()
+        publisher = NotificationPublisher(redis_client=store)
+        store.pipeline.return_value.execute.return_value = [ValueError("setex"), 1]
+        with pytest.raises(ValueError):
+            publisher.store_and_publish("k", 60, "{}", "u1")
+        store.pipeline.return_value.execute.return_value = [True, ConnectionError("publish")]
+        with pytest.raises(NotificationPublishError) as exc:
+            publisher.store_and_publish("k", 60, "{}", "u1")
+        assert isinstance(exc.value.error, ConnectionError)
+
+    def test_store_many_and_publish_single_pipeline(self):
+        store = MagicMock()
+        pipe = store.pipeline.return_value
+        pipe.execute.return_value = [True, ValueError("oom"), 3]
+        publisher = NotificationPublisher(redis_client=store)
+        items = [("u1", "recommendations:u1", "{}"), ("u2", "recommendations:u2", "{}")]
+        assert publisher.store_many_and_publish(items, 60) == (["u1"], 3)
+        store.pipeline.assert_called_once_with(transaction=False)
+        assert pipe.setex.call_count == 2
+        channel, message = pipe.publish.call_args[0]
+        assert channel == NOTIFICATION_CHANNEL
+        assert json.loads(message)["type"] == "notification_batch"
+        assert json.loads(message)["user_ids"] == ["u1", "u2"]
+        pipe.execute.assert_called_once_with(raise_on_error=False)
+        assert publisher.store_many_and_publish([], 60) == ([], 0)
+
+    def test_store_many_and_publish_publish_error_keeps_stored(self):
+        store = MagicMock()
+        store.pipeline.return_value.execute.return_value = [True, ConnectionError("publish")]
+        publisher = NotificationPublisher(redis_client=store)
+        with pytest.raises(NotificationPublishError) as exc:
+            publisher.store_many_and_publish([("u1", "k", "{}")], 60)
+        assert exc.value.stored == ["u1"]
+
+    def test_client_created_once_on_shared_pool(self):
+        with patch('app.services.notification_publisher.redis.ConnectionPool') as mock_pool, \
+             patch('app.services.notification_publisher.redis.Redis') as mock_redis:
+            publisher = NotificationPublisher()
+            publisher.publish("u1")
+            publisher.publish("u2")
+            mock_pool.assert_called_once()
+            assert mock_pool.call_args.kwargs["db"] == RECOMMENDATIONS_DB
+            mock_redis.assert_called_once_with(connection_pool=mock_pool.return_value)
+            assert mock_redis.return_value.publish.call_count == 2
+            publisher.close()
+            mock_redis.return_value.connection_pool.disconnect.assert_called_once()
+
+    def test_store_and_publish_uses_pooled_client(self):
+        with patch('app.services.notification_publisher.redis.ConnectionPool') as mock_pool, \
+             patch('app.services.notification_publisher.redis.Redis') as mock_redis:
+            pipe = mock_redis.return_value.pipeline.return_value
+            pipe.execute.return_value = [True, 1]
+            publisher = NotificationPublisher()
+            publisher.store_and_publish("recommendations:u1", 60, "{}", "u1")
+            publisher.store_many_and_publish([("u2", "recommendations:u2", "{}")], 60)
+            mock_pool.assert_called_once()
+            assert mock_redis.return_value.pipeline.call_count == 2
@@ -0,0 +1,188 @@
+"""
+Tests for single-flight coalescing
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.services.single_flight import SingleFlight
+
+
+def _fake_redis():
+    """MagicMock Redis supporting SET NX, SETEX, GET and the release script."""
+    store = {}
+    client = MagicMock()
+
+    def set_(key, value, nx=False, px=None):
+        if nx and key in store:
+            return None
+        store[key] = value
+        return True
+
+    def release(script, numkeys, key, token):
+        if store.get(key) == token:
+            del store[key]
+            return 1
+        return 0
+
+    client.set.side_effect = set_
+    client.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value)
+    client.get.side_effect = lambda key: store.get(key)
+    client.eval.side_effect = release
+    return client, store
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """Test SingleFlight"""
+
+    def test_key_depends_on_all_inputs(self):
+        base = SingleFlight.make_key("u1", "prompt", "Barcelona", {"lat": 1}, {"start": "2024-01-01"})
+        assert base == SingleFlight.make_key("u1", "prompt", "Barcelona", {"lat": 1}, {"start": "2024-01-01"})
+        assert base != SingleFlight.make_key("u2", "prompt", "Barcelona", {"lat": 1}, {"start": "2024-01-01"})
+        assert base != SingleFlight.make_key("u1", "other", "Barcelona", {"lat": 1}, {"start": "2024-01-01"})
+        assert base != SingleFlight.make_key("u1", "prompt", "Madrid", {"lat": 1}, {"start": "2024-01-01"})
+        assert base != SingleFlight.make_key("u1", "prompt", "Barcelona", {"lat": 2}, {"start": "2024-01-01"})
+        assert base != SingleFlight.make_key("u1", "prompt", "Barcelona", {"lat": 1}, None)
+
+    def test_concurrent_local_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"success": True, "n": len(calls)}
+
+        async def run():
+            return await asyncio.gather(*(flight.run("k", work) for _ in range(5)))
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(r == {"success": True, "n": 1} for r in results)
+        assert flight.get_stats()["local_followers"] == 4
+        assert flight.get_stats()["in_flight"] == 0
+
+    def test_sequential_calls_are_not_coalesced(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        async def run():
+            return [await flight.run("k", work), await flight.run("k", work)]
+
+        assert asyncio.run(run()) == [1, 2]
+
+    def test_exception_propagates_to_followers(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("llm down")
+
+        async def run():
+            return await asyncio.gather(*(flight.run("k", work) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_leader_publishes_result_and_releases_lease(self):
+        client, store = _fake_redis()
+        flight = SingleFlight(namespace="ns")
+
+        async def work():
+            return {"success": True, "recommendations": {}}
+
+        result = asyncio.run(flight.run("k", work, redis_client=client))
+        assert result["success"] is True
+        assert "ns:singleflight:lease:k" not in store
+        assert json.loads(store["ns:singleflight:result:k"]) == result
+
+    def test_failed_result_is_not_shared(self):
+        client, store = _fake_redis()
+        flight = SingleFlight(namespace="ns")
+
+        async def work():
+            return {"success": False}
+
+        asyncio.run(flight.run("k", work, redis_client=client, share=lambda r: r["success"]))
+        assert "ns:singleflight:result:k" not in store
+
+    def test_follower_in_other_process_uses_published_result(self):
+        client, store = _fake_redis()
+        # Another process holds the lease and publishes its result shortly
+        store["ns:singleflight:lease:k"] = "other-token"
+        flight = SingleFlight(namespace="ns", poll_interval=0.01)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {"success": True, "source": "local"}
+
+        async def publish_later():
+            await asyncio.sleep(0.03)
+            store["ns:singleflight:result:k"] = json.dumps({"success": True, "source": "remote"})
+            del store["ns:singleflight:lease:k"]
+
+        async def run():
+            result, _ = await asyncio.gather(flight.run("k", work, redis_client=client), publish_later())
+            return result
+
+        assert asyncio.run(run()) == {"success": True, "source": "remote"}
+        assert calls == []
+        assert flight.get_stats()["remote_followers"] == 1
+
+    def test_follower_generates_when_leader_gives_up(self):
+        client, store = _fake_redis()
+        store["ns:singleflight:lease:k"] = "other-token"
+        flight = SingleFlight(namespace="ns", poll_interval=0.01)
+
+        async def work():
+            return {"success": True, "source": "local"}
+
+        async def expire_lease():
+            await asyncio.sleep(0.03)
+            del store["ns:singleflight:lease:k"]
+
+        async def run():
+            result, _ = await asyncio.gather(flight.run("k", work, redis_client=client), expire_lease())
+            return result
+
+        assert asyncio.run(run()) == {"success": True, "source": "local"}
+
+    def test_redis_errors_fall_back_to_local_generation(self):
+        client = MagicMock()
+        client.set.side_effect = Exception("redis down")
+        flight = SingleFlight()
+
+        async def work():
+            return "ok"
+
+        assert asyncio.run(flight.run("k", work, redis_client=client)) == "ok"
+
+    def test_redis_calls_run_off_the_event_loop_thread(self):
+        client, _ = _fake_redis()
+        threads = []
+
+        def recording(inner):
+            def call(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return inner(*args, **kwargs)
+            return call
+
+        for method in (client.set, client.setex, client.eval):
+            method.side_effect = recording(method.side_effect)
+        flight = SingleFlight(namespace="ns")
+
+        async def work():
+            return {"success": True, "loop_thread": threading.get_ident()}
+
+        result = asyncio.run(flight.run("k", work, redis_client=client))
+        assert len(threads) == 3
+        assert result["loop_thread"] not in threads
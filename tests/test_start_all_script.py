@@ -85,6 +85,16 @@ def test_main_happy_path_composes_commands(tmp_path, monkeypatch):
     assert "redis-server" in all_cmds
     assert "rabbitmq-server" in all_cmds
     assert "celery -A app.workers.celery_app worker" in all_cmds
+    workers = [c[0] for c in calls if "celery -A app.workers.celery_app worker" in c[0]]
+    assert len(workers) == 4
+    # One worker per dedicated queue, sized by the celeryd_init hook from Settings
+    for queue, hostname in (("interactive", "interactive"), ("bulk_refresh", "bulk"), ("maintenance", "maintenance")):
+        dedicated = [cmd for cmd in workers if f"--queues={queue} " in cmd]
+        assert len(dedicated) == 1
+        assert f"--hostname={hostname}@%h " in dedicated[0]
+        assert "--concurrency" not in dedicated[0]
+    legacy = [cmd for cmd in workers if "--queues=user_processing,user_processing_alt " in cmd]
+    assert len(legacy) == 1
     assert "celery -A app.workers.celery_app beat" in all_cmds
     assert "python notification_service.py" in all_cmds
     assert "python app/main.py" in all_cmds
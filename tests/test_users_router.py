@@ -297,8 +297,7 @@ class TestUsersRouter:
 
     def test_process_user_comprehensive_success(self, client):
         """Test successful user comprehensive processing."""
-        with patch('app.api.routers.users.process_user_comprehensive') as mock_task, \
-             patch('builtins.hash', return_value=7):
+        with patch('app.api.routers.users.process_user_comprehensive') as mock_task:
             mock_task_result = Mock()
             mock_task_result.id = "test_task_123"
             mock_task.apply_async.return_value = mock_task_result
@@ -310,12 +309,13 @@ class TestUsersRouter:
             assert data["task_id"] == "test_task_123"
             assert data["priority"] == 5
             assert data["status"] == "queued"
+            assert data["queue"] == "interactive"
             mock_task.apply_async.assert_called_with(
                 args=["test_user_1"],
-                queue="user_processing",
-                routing_key="user_processing_7",
-                priority=5,
+                kwargs={},
                 expires=None,
+                queue="interactive",
+                priority=5,
                 retry=True,
                 retry_policy={'max_retries': 3, 'interval_start': 0, 'interval_step': 0.2, 'interval_max': 0.2}
             )
@@ -334,9 +334,10 @@ class TestUsersRouter:
             mock_task_result = Mock()
             mock_task_result.id = "test_task_123"
             mock_task_result.get.return_value = {"success": True, "comprehensive_data": {"data": "test"}}
-            mock_task.delay.return_value = mock_task_result
+            mock_task.apply_async.return_value = mock_task_result
             response = client.post("/api/v1/users/test_user_1/process-comprehensive-direct")
             assert response.status_code == status.HTTP_200_OK
+            assert mock_task.apply_async.call_args.kwargs["queue"] == "interactive"
             data = response.json()
             assert data["success"] is True
             assert data["user_id"] == "test_user_1"
@@ -350,7 +351,7 @@ class TestUsersRouter:
             mock_task_result = Mock()
             mock_task_result.id = "test_task_123"
             mock_task_result.get.return_value = {"success": False, "error": "Processing failed"}
-            mock_task.delay.return_value = mock_task_result
+            mock_task.apply_async.return_value = mock_task_result
             response = client.post("/api/v1/users/test_user_1/process-comprehensive-direct")
             assert response.status_code == 500
             data = response.json()
@@ -0,0 +1,96 @@
+"""
+Tests for the worker-lifetime event loop runner
+"""
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from app.utils.event_loop import LoopRunner
+
+
+@pytest.mark.unit
+class TestLoopRunner:
+    """Test LoopRunner"""
+
+    def test_falls_back_to_temporary_loop_when_not_started(self):
+        runner = LoopRunner()
+        loops = set()
+
+        async def current_loop():
+            loops.add(asyncio.get_running_loop())
+            return "ok"
+
+        assert runner.run(current_loop()) == "ok"
+        assert runner.run(current_loop()) == "ok"
+        assert len(loops) == 2
+        assert all(loop.is_closed() for loop in loops)
+        assert runner.is_running is False
+
+    def test_started_runner_reuses_one_loop(self):
+        runner = LoopRunner()
+        loop = runner.start()
+        try:
+            assert runner.start() is loop
+
+            async def current_loop():
+                return asyncio.get_running_loop()
+
+            assert runner.run(current_loop()) is loop
+            assert runner.run(current_loop()) is loop
+            assert not loop.is_closed()
+        finally:
+            runner.stop()
+        assert loop.is_closed()
+        assert runner.is_running is False
+
+    def test_state_bound_to_loop_survives_between_runs(self):
+        runner = LoopRunner()
+        runner.start()
+        try:
+            async def start_background():
+                return asyncio.ensure_future(asyncio.sleep(3600))
+
+            background = runner.run(start_background())
+            assert runner.run(asyncio.sleep(0, result="next")) == "next"
+            assert not background.done()
+        finally:
+            runner.stop()
+        assert background.cancelled()
+
+    def test_exceptions_and_timeouts_propagate(self):
+        runner = LoopRunner()
+        runner.start()
+        try:
+            async def failing():
+                raise ValueError("boom")
+
+            with pytest.raises(ValueError, match="boom"):
+                runner.run(failing())
+            with pytest.raises(TimeoutError):
+                runner.run(asyncio.sleep(5), timeout=0.05)
+        finally:
+            runner.stop()
+
+    def test_run_from_own_loop_is_rejected(self):
+        runner = LoopRunner()
+        runner.start()
+        try:
+            async def nested():
+                with pytest.raises(RuntimeError):
+                    runner.run(asyncio.sleep(0))
+                return True
+
+            assert runner.run(nested()) is True
+        finally:
+            runner.stop()
+
+    def test_forked_copy_is_not_running(self):
+        runner = LoopRunner()
+        runner.start()
+        try:
+            with patch('app.utils.event_loop.os.getpid', return_value=-1):
+                assert runner.is_running is False
+                assert runner.run(asyncio.sleep(0, result="fallback")) == "fallback"
+        finally:
+            runner.stop()
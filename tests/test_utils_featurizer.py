@@ -0,0 +1,65 @@
+"""
+Tests for the stable hashing featurizer
+"""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from app.utils import featurizer
+
+
+@pytest.mark.unit
+class TestFeaturizer:
+    """Test featurizer helpers"""
+
+    def test_vector_matches_token_slots(self):
+        vec = featurizer.vector("Jazz night jazz", dim=16)
+        indices, signs = featurizer.token_slots("Jazz night jazz", 16)
+        expected = np.zeros(16)
+        for i, s in zip(indices, signs):
+            expected[i] += s
+        assert vec.shape == (16,)
+        assert np.array_equal(vec, expected)
+        # Case-insensitive tokens map to the same slot
+        assert indices[0] == indices[2] and signs[0] == signs[2]
+
+    def test_empty_and_invalid_text(self):
+        assert not featurizer.vector("", 8).any()
+        assert not featurizer.vector(None, 8).any()
+        assert featurizer.token_ids("   ", 100) == []
+        idx, vals = featurizer.sparse("", 8)
+        assert idx.size == 0 and vals.size == 0
+
+    def test_sparse_is_nonzero_part_of_dense(self):
+        text = "sagrada familia park guell sagrada"
+        dense = featurizer.vector(text, 32)
+        idx, vals = featurizer.sparse(text, 32)
+        rebuilt = np.zeros(32)
+        rebuilt[idx] = vals
+        assert np.array_equal(dense, rebuilt)
+        assert np.all(vals != 0)
+
+    def test_token_ids_range_and_limit(self):
+        ids = featurizer.token_ids(" ".join(f"t{i}" for i in range(300)), 50)
+        assert len(ids) == 256
+        assert all(0 <= i < 50 for i in ids)
+
+    def test_token_hash_is_memoized(self):
+        featurizer.stable_token_hash.cache_clear()
+        featurizer.vector("alpha beta alpha", 8)
+        info = featurizer.stable_token_hash.cache_info()
+        assert info.misses == 2 and info.hits == 1
+        assert info.maxsize == featurizer.TOKEN_MEMO_SIZE
+
+    def test_stable_across_processes(self):
+        code = "from app.utils import featurizer; print(featurizer.token_ids('inception dark knight', 50000))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        outputs = set()
+        for seed in ("1", "2"):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            out = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, check=True)
+            outputs.add(out.stdout.strip())
+        assert outputs == {str(featurizer.token_ids("inception dark knight", 50000))}
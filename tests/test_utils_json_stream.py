@@ -0,0 +1,56 @@
+"""
+Tests for incremental category array parsing
+"""
+import json
+
+import pytest
+
+from app.utils.json_stream import CategoryStreamParser
+
+
+BODY = json.dumps({
+    "result": {
+        "movies": [{"title": "Inception", "why_would_you_like_this": "Layers [of] \"dreams\" {nested}"}],
+        "music": [{"title": "So What", "tags": ["jazz", {"era": "1959"}]}],
+        "place": [{"name": "Park Guell"}],
+        "events": [],
+    }
+})
+
+
+@pytest.mark.unit
+class TestCategoryStreamParser:
+    """Test CategoryStreamParser"""
+
+    def test_whole_body(self):
+        parser = CategoryStreamParser()
+        completed = parser.feed(BODY)
+        assert [c for c, _ in completed] == ["movies", "music", "places", "events"]
+        assert completed[0][1][0]["why_would_you_like_this"] == "Layers [of] \"dreams\" {nested}"
+        assert completed[1][1][0]["tags"][1] == {"era": "1959"}
+        assert parser.categories == ["events", "movies", "music", "places"]
+
+    @pytest.mark.parametrize("size", [1, 3, 7, 64])
+    def test_any_chunking_gives_same_result(self, size):
+        parser = CategoryStreamParser()
+        completed = []
+        for i in range(0, len(BODY), size):
+            completed.extend(parser.feed(BODY[i:i + size]))
+        assert completed == CategoryStreamParser().feed(BODY)
+
+    def test_categories_emitted_as_soon_as_closed(self):
+        parser = CategoryStreamParser()
+        assert parser.feed('{"movies": [{"title": "A"}') == []
+        assert parser.feed('], "music": [{"title": ') == [("movies", [{"title": "A"}])]
+        assert parser.feed('"B"}]}') == [("music", [{"title": "B"}])]
+
+    def test_escaped_result_string_is_not_parsed_incrementally(self):
+        body = json.dumps({"result": json.dumps({"movies": [{"title": "A"}]})})
+        parser = CategoryStreamParser()
+        assert parser.feed(body) == []
+        assert parser.text == body
+
+    def test_duplicate_and_invalid_arrays_are_skipped(self):
+        parser = CategoryStreamParser()
+        completed = parser.feed('{"movies": [1, 2], "movies": [3], "music": [tru]}')
+        assert completed == [("movies", [1, 2])]
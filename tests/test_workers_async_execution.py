@@ -0,0 +1,128 @@
+"""
+Tests for async-native Celery task execution
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import patch
+from celery.exceptions import Retry
+
+from app.utils.event_loop import LoopRunner
+from app.workers.async_execution import AsyncTask, InFlightLimiter, async_mode_enabled
+from app.workers.celery_app import celery_app
+
+
+@celery_app.task(bind=True, base=AsyncTask, name="tests.async_echo")
+async def async_echo(self, value, delay=0.0):
+    await asyncio.sleep(delay)
+    return {"value": value, "task_id": self.request.id, "thread": threading.current_thread().name}
+
+
+@celery_app.task(
+    bind=True,
+    base=AsyncTask,
+    name="tests.async_flaky",
+    autoretry_for=(ConnectionError,),
+    retry_kwargs={'max_retries': 2},
+    retry_backoff=True,
+    retry_backoff_max=30
+)
+async def async_flaky(self, error=None):
+    await asyncio.sleep(0)
+    raise error or ConnectionError("upstream unavailable")
+
+
+def run_as_worker(task, task_id, *args):
+    """Call ``task`` the way the worker's tracer does: request pushed first."""
+    task.push_request(id=task_id, args=args, kwargs={})
+    try:
+        return task(*args)
+    finally:
+        task.pop_request()
+
+
+@pytest.mark.unit
+class TestInFlightLimiter:
+    """Test InFlightLimiter"""
+
+    def test_caps_concurrent_bodies(self):
+        limiter = InFlightLimiter(3)
+
+        async def body():
+            async with limiter.slot():
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(body() for _ in range(10)))
+
+        asyncio.run(main())
+        stats = limiter.get_stats()
+        assert stats["peak"] == 3
+        assert stats["completed"] == 10
+        assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+    def test_semaphore_follows_the_running_loop(self):
+        limiter = InFlightLimiter(1)
+
+        async def body():
+            async with limiter.slot():
+                return True
+
+        assert asyncio.run(body()) is True
+        assert asyncio.run(body()) is True
+
+
+@pytest.mark.unit
+class TestAsyncTask:
+    """Test AsyncTask"""
+
+    def test_direct_call_runs_coroutine(self):
+        result = async_echo("a")
+        assert result["value"] == "a"
+
+    def test_request_is_visible_inside_coroutine(self):
+        result = run_as_worker(async_echo, "task-123", "b")
+        assert result["value"] == "b"
+        assert result["task_id"] == "task-123"
+        assert async_echo.request.id is None
+
+    def test_calls_from_pool_threads_share_the_worker_loop(self):
+        runner = LoopRunner(name="test-worker-loop")
+        runner.start()
+        try:
+            with patch('app.workers.async_execution.loop_runner', runner), \
+                 patch('app.workers.async_execution.in_flight_limiter', InFlightLimiter(4)) as limiter:
+                with ThreadPoolExecutor(max_workers=12) as pool:
+                    results = list(pool.map(
+                        lambda i: run_as_worker(async_echo, f"t{i}", i, 0.02), range(12)
+                    ))
+                assert [r["value"] for r in results] == list(range(12))
+                assert [r["task_id"] for r in results] == [f"t{i}" for i in range(12)]
+                assert {r["thread"] for r in results} == {"test-worker-loop"}
+                assert limiter.peak == 4
+        finally:
+            runner.stop()
+
+    def test_async_mode_flag(self):
+        with patch('app.workers.async_execution.settings') as mock_settings:
+            mock_settings.celery_async_mode = True
+            assert async_mode_enabled() is True
+            mock_settings.celery_async_mode = "yes"
+            assert async_mode_enabled() is False
+
+    def test_autoretry_policy_applies_to_coroutine_failures(self):
+        with patch.object(async_flaky, 'retry', side_effect=Retry("retrying")) as mock_retry:
+            with pytest.raises(Retry):
+                run_as_worker(async_flaky, "task-retry")
+        exc = mock_retry.call_args.kwargs["exc"]
+        assert isinstance(exc, ConnectionError)
+        assert mock_retry.call_args.kwargs["max_retries"] == 2
+        assert 0 <= mock_retry.call_args.kwargs["countdown"] <= 30
+
+    def test_exceptions_outside_autoretry_for_propagate(self):
+        with patch.object(async_flaky, 'retry') as mock_retry:
+            with pytest.raises(KeyError):
+                async_flaky(error=KeyError("missing"))
+        mock_retry.assert_not_called()
@@ -313,4 +313,94 @@ class TestCeleryApp:
         assert celery_app.conf.task_serializer == 'json'
         assert celery_app.conf.accept_content == ['json']
         assert celery_app.conf.task_track_started is not None
-        assert celery_app.conf.task_acks_late is not None
\ No newline at end of file
+        assert celery_app.conf.task_acks_late is not None
+
+    def test_worker_process_event_loop_lifecycle(self):
+        """Each worker process starts one event loop and stops it on shutdown."""
+        from app.workers import celery_app as celery_module
+
+        with patch.object(celery_module, 'loop_runner') as mock_runner, \
+             patch('app.services.http_client.http_client_registry') as mock_registry, \
+             patch('app.services.notification_publisher.notification_publisher'):
+            celery_module.start_worker_event_loop()
+            mock_runner.start.assert_called_once()
+
+            mock_runner.is_running = True
+            celery_module.close_pooled_connections()
+            mock_runner.run.assert_called_once()
+            mock_registry.aclose_all.assert_called_once()
+            mock_registry.close_all.assert_called_once()
+            mock_runner.stop.assert_called_once()
+
+    def test_priority_queues_and_routes(self):
+        """Interactive, bulk and maintenance work are routed to separate queues."""
+        from app.workers.celery_app import INTERACTIVE_QUEUE, BULK_QUEUE, MAINTENANCE_QUEUE
+
+        queue_names = {q.name for q in celery_app.conf.task_queues}
+        assert {"user_processing", INTERACTIVE_QUEUE, BULK_QUEUE, MAINTENANCE_QUEUE} <= queue_names
+        routes = celery_app.conf.task_routes
+        # Per-user refreshes are routed by the caller, not statically
+        assert "process_user_comprehensive" not in routes
+        assert "process_user_comprehensive_async" not in routes
+        assert routes["process_users_batch"]["queue"] == BULK_QUEUE
+        assert routes["cleanup_expired_cache"]["queue"] == MAINTENANCE_QUEUE
+        priorities = {q.name: q.max_priority for q in celery_app.conf.task_queues}
+        assert priorities[INTERACTIVE_QUEUE] == priorities[BULK_QUEUE] == priorities[MAINTENANCE_QUEUE] == 10
+        # Redeclaring the pre-existing queue with x-max-priority would fail on a live broker
+        assert priorities["user_processing"] is None
+        assert celery_app.conf.task_queue_max_priority is None
+
+    def test_scheduled_refresh_registered_with_beat(self):
+        """Beat triggers schedule_users_refresh on the bulk queue every refresh interval."""
+        from datetime import timedelta
+        from app.core.config import settings
+        from app.workers.celery_app import BULK_QUEUE, refresh_beat_schedule
+        from app.workers.tasks import schedule_users_refresh
+
+        entry = celery_app.conf.beat_schedule["schedule-users-refresh"]
+        assert entry["task"] == schedule_users_refresh.name
+        assert entry["schedule"] == timedelta(minutes=settings.recommendation_refresh_interval_minutes)
+        assert entry["options"]["queue"] == BULK_QUEUE
+        assert refresh_beat_schedule(0) == {}
+        assert refresh_beat_schedule(None) == {}
+
+    def test_enqueue_sets_deadline_and_clamps_priority(self):
+        """enqueue turns a relative deadline into an absolute expiry."""
+        from datetime import datetime, timezone
+        from app.workers.celery_app import enqueue
+
+        task = Mock()
+        before = datetime.now(timezone.utc)
+        enqueue(task, args=["u1"], queue="bulk_refresh", priority=42, deadline=60)
+        kwargs = task.apply_async.call_args.kwargs
+        assert kwargs["args"] == ["u1"]
+        assert kwargs["queue"] == "bulk_refresh"
+        assert kwargs["priority"] == 10
+        assert 59 <= (kwargs["expires"] - before).total_seconds() <= 61
+
+        enqueue(task, args=["u2"])
+        kwargs = task.apply_async.call_args.kwargs
+        assert kwargs["expires"] is None
+        assert "queue" not in kwargs and "priority" not in kwargs
+
+    def test_queue_concurrency_from_settings(self):
+        """Dedicated workers are sized from the per-queue settings."""
+        from app.workers import celery_app as celery_module
+
+        with patch.object(celery_module, 'settings') as mock_settings:
+            mock_settings.celery_interactive_concurrency = 8
+            mock_settings.celery_bulk_concurrency = 2
+            mock_settings.celery_maintenance_concurrency = 1
+            mock_settings.celery_async_mode = False
+            assert celery_module.queue_concurrency("interactive") == 8
+            assert celery_module.queue_concurrency("bulk_refresh,maintenance") == 3
+            assert celery_module.queue_concurrency(["interactive", "user_processing"]) is None
+            assert celery_module.queue_concurrency(None) is None
+
+            conf = Mock(worker_concurrency=None)
+            celery_module.apply_queue_concurrency(conf=conf, options={"queues": "bulk_refresh"})
+            assert conf.worker_concurrency == 2
+
+            conf = Mock(worker_concurrency=None)
+            celery_module.apply_queue_concurrency(conf=conf, options={"queues": "bulk_refresh", "concurrency": 6})
+            assert conf.worker_concurrency is None
@@ -9,6 +9,10 @@ from app.workers.tasks import (
     process_user,
     get_users,
     process_user_comprehensive,
+    process_user_comprehensive_async,
+    process_users_batch,
+    schedule_users_refresh,
+    cleanup_expired_cache,
     generate_user_prompt
 )
 from app.core.constants import RecommendationType
@@ -380,4 +384,185 @@ class TestCeleryTasks:
         # The function is designed to be resilient and always succeed
         assert result["success"] is True
         assert result["user_id"] == "123"
-        assert "generated_prompt" in result
\ No newline at end of file
+        assert "generated_prompt" in result
+
+    def test_process_user_comprehensive_async(self, mock_user_profile, mock_location_data, mock_interaction_data):
+        """The async-native variant awaits the services and the LLM."""
+        with patch('app.workers.tasks.UserProfileService') as mock_user_service_cls, \
+             patch('app.workers.tasks.LIEService') as mock_lie_service_cls, \
+             patch('app.workers.tasks.CISService') as mock_cis_service_cls, \
+             patch('app.workers.tasks.PromptBuilder') as mock_prompt_builder_cls, \
+             patch('app.workers.tasks.cache_service') as mock_cache, \
+             patch('app.workers.tasks.llm_service') as mock_llm_service:
+            mock_user_service_cls.return_value.get_user_profile = AsyncMock(return_value=mock_user_profile)
+            mock_lie_service_cls.return_value.get_location_data = AsyncMock(return_value=mock_location_data)
+            mock_cis_service_cls.return_value.get_interaction_data = AsyncMock(return_value=mock_interaction_data)
+            mock_prompt_builder_cls.return_value.build_recommendation_prompt.return_value = "Test prompt"
+            mock_llm_service.generate_recommendations = AsyncMock(return_value={"success": True})
+
+            result = process_user_comprehensive_async("123")
+
+        assert result["success"] is True
+        assert result["comprehensive_data"]["data_quality"]["interaction_data_available"] is True
+        mock_cache.set.assert_called_once()
+        kwargs = mock_llm_service.generate_recommendations.await_args.kwargs
+        assert kwargs["user_id"] == "123" and kwargs["prompt"] == "Test prompt"
+
+    def test_process_users_batch_batches_io(self, mock_user_profile, mock_location_data, mock_interaction_data):
+        """Contexts are fetched concurrently, users are generated concurrently and results are stored together."""
+        with patch('app.workers.tasks.UserProfileService') as mock_user_service_cls, \
+             patch('app.workers.tasks.LIEService') as mock_lie_service_cls, \
+             patch('app.workers.tasks.CISService') as mock_cis_service_cls, \
+             patch('app.workers.tasks.PromptBuilder') as mock_prompt_builder_cls, \
+             patch('app.workers.tasks.cache_service') as mock_cache, \
+             patch('app.workers.tasks.llm_service') as mock_llm_service:
+            mock_user_service_cls.return_value.get_user_profile = AsyncMock(return_value=mock_user_profile)
+            mock_lie_service_cls.return_value.get_location_data = AsyncMock(return_value=mock_location_data)
+            mock_cis_service_cls.return_value.get_interaction_data = AsyncMock(side_effect=Exception("CIS down"))
+            mock_prompt_builder_cls.return_value.build_recommendation_prompt.return_value = "Shared prompt"
+            order = []
+
+            async def generate(user_id, **kwargs):
+                order.append(user_id)
+                assert kwargs["store"] is False
+                return {"success": user_id != "u3", "recommendations": {}}
+
+            mock_llm_service.generate_recommendations = AsyncMock(side_effect=generate)
+            mock_llm_service.store_many_in_redis.return_value = ["u1", "u2"]
+
+            result = process_users_batch(["u1", "u2", "u1", "u3"])
+
+        assert result["success"] is True
+        assert result["processed"] == 3
+        assert result["stored"] == 2
+        assert result["failed_user_ids"] == ["u3"]
+        assert sorted(order) == ["u1", "u2", "u3"]
+        assert mock_user_service_cls.call_count == 1
+        stored = mock_llm_service.store_many_in_redis.call_args[0][0]
+        assert sorted(stored) == ["u1", "u2"]
+        contexts = mock_cache.set_multiple.call_args[0][1]
+        assert contexts["u2"]["data_quality"]["interaction_data_available"] is False
+
+    def test_generate_batch_runs_users_concurrently(self):
+        """Every user is generated independently, up to the concurrency limit."""
+        import asyncio
+        from app.workers.tasks import _generate_batch
+
+        contexts = {user_id: {"user_profile": None, "location_data": None, "interaction_data": None} for user_id in ("u1", "u2", "u3")}
+        in_flight = {"now": 0, "peak": 0}
+
+        async def generate(user_id, **kwargs):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return {"success": True, "recommendations": {}}
+
+        with patch('app.workers.tasks.PromptBuilder') as mock_prompt_builder_cls, \
+             patch('app.workers.tasks.llm_service') as mock_llm_service:
+            mock_prompt_builder_cls.return_value.build_fallback_prompt.return_value = "Same prompt"
+            mock_llm_service.generate_recommendations = AsyncMock(side_effect=generate)
+            responses = asyncio.run(_generate_batch(["u1", "u2", "u3"], contexts, concurrency=2))
+
+        assert sorted(responses) == ["u1", "u2", "u3"]
+        assert in_flight["peak"] == 2
+        mock_llm_service._llm_cache_key.assert_not_called()
+
+    def test_process_users_batch_incremental_refresh(self, mock_user_profile, mock_location_data, mock_interaction_data):
+        """Unchanged users only get a TTL extension and interaction-only changes are rescored without the LLM."""
+        with patch('app.workers.tasks.UserProfileService') as mock_user_service_cls, \
+             patch('app.workers.tasks.LIEService') as mock_lie_service_cls, \
+             patch('app.workers.tasks.CISService') as mock_cis_service_cls, \
+             patch('app.workers.tasks.PromptBuilder') as mock_prompt_builder_cls, \
+             patch('app.workers.tasks.cache_service'), \
+             patch('app.workers.tasks.llm_service') as mock_llm_service:
+            mock_user_service_cls.return_value.get_user_profile = AsyncMock(return_value=mock_user_profile)
+            mock_lie_service_cls.return_value.get_location_data = AsyncMock(return_value=mock_location_data)
+            mock_cis_service_cls.return_value.get_interaction_data = AsyncMock(return_value=mock_interaction_data)
+            mock_prompt_builder_cls.return_value.build_recommendation_prompt.return_value = "Prompt"
+            cached = {"recommendations": {"places": []}}
+            mock_llm_service.plan_incremental_refresh.return_value = {
+                "same": {"action": "extend", "cached": cached},
+                "gone": {"action": "extend", "cached": cached},
+                "clicked": {"action": "rescore", "cached": cached},
+                "moved": {"action": "regenerate", "cached": None},
+            }
+            mock_llm_service.extend_recommendations_ttl.return_value = ["same"]
+            mock_llm_service.rescore_recommendations.return_value = {"recommendations": {"places": []}, "rescored_at": 1}
+            mock_llm_service.generate_recommendations = AsyncMock(return_value={"success": True, "recommendations": {}})
+            mock_llm_service.store_many_in_redis.side_effect = lambda responses: list(responses)
+
+            result = process_users_batch(["same", "gone", "clicked", "moved"])
+
+        assert result["success"] is True
+        assert result["extended"] == 1 and result["rescored"] == 1 and result["generated"] == 2
+        assert result["failed_user_ids"] == []
+        generated = sorted(c.kwargs["user_id"] for c in mock_llm_service.generate_recommendations.await_args_list)
+        assert generated == ["gone", "moved"]
+        mock_llm_service.extend_recommendations_ttl.assert_called_once_with(["same", "gone"])
+        stored = mock_llm_service.store_many_in_redis.call_args[0][0]
+        assert sorted(stored) == ["clicked", "gone", "moved"]
+        assert stored["clicked"]["rescored_at"] == 1
+
+        with patch('app.workers.tasks.settings') as mock_settings, \
+             patch('app.workers.tasks.llm_service') as mock_llm_service:
+            mock_settings.incremental_refresh_enabled = False
+            from app.workers.tasks import _incremental_refresh
+            assert _incremental_refresh(["u1"], {"u1": {}}) == ([], {}, ["u1"])
+            mock_llm_service.plan_incremental_refresh.assert_not_called()
+
+    def test_process_users_batch_empty(self):
+        """An empty chunk does no work."""
+        with patch('app.workers.tasks.llm_service') as mock_llm_service:
+            result = process_users_batch([])
+        assert result["success"] is True and result["processed"] == 0
+        mock_llm_service.store_many_in_redis.assert_not_called()
+
+    def test_schedule_users_refresh_chunks_population(self):
+        """The active population is split into one batch task per chunk."""
+        with patch('app.workers.tasks.llm_service') as mock_llm_service, \
+             patch('app.workers.tasks.process_users_batch.apply_async') as mock_apply:
+            mock_llm_service.redis_client.scan_iter.return_value = iter([
+                "recommendations:u1", b"recommendations:u2", "recommendations:u3",
+                "recommendations:u1:place", "recommendations:llm_cache:abc",
+                b"recommendations:llm_cache:def", "recommendations:singleflight:lease:abc",
+                "recommendations:embeddings:user:sig:u4",
+            ])
+            mock_apply.return_value.id = "task"
+            result = schedule_users_refresh(chunk_size=2)
+
+        assert result["success"] is True
+        assert result["user_count"] == 3
+        assert result["chunk_count"] == 2
+        chunks = [c.kwargs["args"][0] for c in mock_apply.call_args_list]
+        assert chunks == [["u1", "u2"], ["u3"]]
+
+        with patch('app.workers.tasks.process_users_batch.apply_async') as mock_apply:
+            result = schedule_users_refresh(user_ids=["a", "b", "a"], chunk_size=5)
+        assert result["chunk_count"] == 1
+        assert mock_apply.call_args.kwargs["args"][0] == ["a", "b"]
+
+    def test_schedule_users_refresh_uses_bulk_queue_with_deadline(self):
+        """Scheduled chunks go to the low-priority bulk queue and expire when stale."""
+        with patch('app.workers.tasks.process_users_batch.apply_async') as mock_apply:
+            schedule_users_refresh(user_ids=["a"], chunk_size=5)
+        options = mock_apply.call_args.kwargs
+        assert options["queue"] == "bulk_refresh"
+        assert options["priority"] == 1
+        assert options["expires"] is not None
+
+    def test_cleanup_expired_cache(self):
+        """Every configured cache type is cleaned."""
+        with patch('app.workers.tasks.cache_service') as mock_cache_service:
+            mock_cache_service.cache_ttl = {"user_profile": 3600, "location_data": 1800}
+            mock_cache_service.cleanup_expired.side_effect = [2, 1]
+            result = cleanup_expired_cache()
+        assert result["success"] is True
+        assert result["cleaned"] == {"user_profile": 2, "location_data": 1}
+        assert result["total_cleaned"] == 3
+
+        with patch('app.workers.tasks.cache_service') as mock_cache_service:
+            mock_cache_service.cache_ttl = {"user_profile": 3600}
+            mock_cache_service.cleanup_expired.side_effect = Exception("redis down")
+            result = cleanup_expired_cache()
+        assert result["success"] is False